@@ -0,0 +1,114 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict
+from app.gemini_utils import TokenBucket, gemini_limiter
+from app.metrics import ADMISSION_REJECTED
+
+# =============================
+# ⚙️ Configuration
+# =============================
+# Gemini calls per client per minute (an /analyze is ~5, a chat 1); 0 disables per-client limits
+CLIENT_RATE_PER_MINUTE = float(os.getenv("CLIENT_RATE_PER_MINUTE", "60"))
+CLIENT_MAX_TRACKED = int(os.getenv("CLIENT_MAX_TRACKED", "10000"))  # Least recently seen clients are forgotten
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"  # Behind a proxy that sets X-Forwarded-For
+
+ADMITTED, RATE_LIMITED, SHED = "admitted", "rate_limited", "shed"
+
+
+def client_id(request):
+    """The caller's address (first X-Forwarded-For hop when TRUST_FORWARDED_FOR=1)."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else "unknown"
+
+
+# =============================
+# 🪣 Per-Client Rate Limit
+# =============================
+class ClientRateLimiter:
+    """
+    One token bucket per client, refilled at `per_minute` units a minute and
+    holding at most a minute's worth, so a client may burst that much before
+    being held to the steady rate. Limits are per worker process.
+    """
+
+    def __init__(self, per_minute=CLIENT_RATE_PER_MINUTE, max_clients=CLIENT_MAX_TRACKED):
+        self.per_minute = per_minute
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> TokenBucket, least recently seen first
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.per_minute > 0
+
+    def check(self, client, cost=1):
+        """Charges `cost` units to `client`. Returns 0 when allowed, else seconds until it would be."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(client, None) or TokenBucket(self.per_minute)
+            self._buckets[client] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            wait = bucket.wait_time(cost, now)
+            if wait == 0:
+                bucket.consume(cost, now)
+            return wait
+
+    def snapshot(self):
+        with self._lock:
+            return {"per_minute": self.per_minute, "clients": len(self._buckets), "enabled": self.enabled}
+
+
+client_limiter = ClientRateLimiter()
+
+
+# =============================
+# 🚪 Admission Control
+# =============================
+class Admission:
+    """
+    Decides whether a Gemini-backed request gets in. `shed` turns new work
+    away (503) while the Gemini concurrency queue is too deep or too slow, so
+    the requests already admitted still finish within their deadlines;
+    `charge` bills the request's Gemini calls to the client's rate limit
+    (429 once it runs out). Callers shed before charging, so a request
+    turned away for load isn't billed, and only charge once they know the
+    request really needs Gemini (not for FAQ/cached chat answers).
+    """
+
+    def __init__(self, clients=client_limiter, limiter=gemini_limiter):
+        self.clients = clients
+        self.limiter = limiter
+        self.stats = {ADMITTED: 0, RATE_LIMITED: 0, SHED: 0}
+
+    def shed(self, endpoint):
+        """Retry-After seconds when new work should be turned away right now, else None."""
+        if not self.limiter.overloaded():
+            return None
+        return self._reject(endpoint, SHED, self.limiter.retry_after())
+
+    def charge(self, endpoint, client, cost=1):
+        """Bills `cost` Gemini calls to `client`; Retry-After seconds when over its rate, else None."""
+        wait = self.clients.check(client, cost)
+        if wait:
+            return self._reject(endpoint, RATE_LIMITED, max(1, math.ceil(wait)))
+        self.stats[ADMITTED] += 1
+        return None
+
+    def _reject(self, endpoint, reason, retry_after):
+        self.stats[reason] += 1
+        ADMISSION_REJECTED.inc(endpoint=endpoint, reason=reason)
+        return retry_after
+
+    def snapshot(self):
+        return {**self.stats, "clients": self.clients.snapshot(), "gemini": self.limiter.snapshot()}
+
+
+admission = Admission()
@@ -0,0 +1,301 @@
+import os
+import math
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# =============================
+# ⚙️ Configuration
+# =============================
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "512"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(24 * 3600)))
+# Measured on recompressed, resized and cropped copies: re-encodes and resizes
+# land at 0-2 bits, 5% crops at <= 12 and most 10% crops at <= 14, while
+# unrelated photos sit at 18+ (median ~32). Colour is checked separately.
+ANALYSIS_CACHE_MAX_DISTANCE = int(os.getenv("ANALYSIS_CACHE_MAX_DISTANCE", "12"))
+# L1 distance (0-2) between coarse colour histograms. Re-encodes and crops stay
+# under ~0.26; greyscale (~1.7), +30% brightness (~0.9) or +50% saturation
+# (~0.6) copies are treated as different images.
+ANALYSIS_CACHE_MAX_COLOR_DISTANCE = float(os.getenv("ANALYSIS_CACHE_MAX_COLOR_DISTANCE", "0.35"))
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "")  # Empty = memory only
+
+# =============================
+# 🖼️ Perceptual Hash (DCT pHash)
+# =============================
+_HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+_COS_TABLE = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * _SAMPLE_SIZE)) for x in range(_SAMPLE_SIZE)]
+    for u in range(_HASH_SIZE)
+]
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    64-bit DCT perceptual hash of the image.
+
+    The image is reduced to 32x32 greyscale, the low-frequency 8x8 block of
+    its DCT is kept and each coefficient is compared to the median. Recompressed
+    copies and resizes land within a few bits of each other, small crops
+    within ~12 (see ANALYSIS_CACHE_MAX_DISTANCE).
+    """
+    small = image.convert("L").resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    rows = [pixels[i * _SAMPLE_SIZE:(i + 1) * _SAMPLE_SIZE] for i in range(_SAMPLE_SIZE)]
+
+    # Separable 2D DCT, keeping only the first 8 frequencies in each direction.
+    row_dct = [[sum(c * p for c, p in zip(_COS_TABLE[u], row)) for u in range(_HASH_SIZE)] for row in rows]
+    coeffs = []
+    for v in range(_HASH_SIZE):
+        for u in range(_HASH_SIZE):
+            coeffs.append(sum(_COS_TABLE[v][y] * row_dct[y][u] for y in range(_SAMPLE_SIZE)))
+
+    # Skip the DC term when computing the median; it only encodes brightness.
+    median = sorted(coeffs[1:])[len(coeffs[1:]) // 2]
+    value = 0
+    for coeff in coeffs:
+        value = (value << 1) | (1 if coeff > median else 0)
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# =============================
+# 🎨 Colour Signature
+# =============================
+_COLOR_SAMPLE = 32
+_COLOR_LEVELS = 4  # Per channel, so 64 bins
+
+
+def color_signature(image: Image.Image) -> bytes:
+    """
+    Coarse RGB histogram (64 bins, each a 0-255 share of the pixels). The
+    pHash only sees greyscale structure, so this keeps greyscale, brightened
+    or recoloured copies from reusing an analysis with the wrong palette.
+    """
+    small = image.convert("RGB").resize((_COLOR_SAMPLE, _COLOR_SAMPLE), Image.Resampling.BILINEAR)
+    step = 256 // _COLOR_LEVELS
+    hist = [0] * _COLOR_LEVELS ** 3
+    for r, g, b in small.getdata():
+        hist[(r // step * _COLOR_LEVELS + g // step) * _COLOR_LEVELS + b // step] += 1
+    total = _COLOR_SAMPLE * _COLOR_SAMPLE
+    return bytes(min(255, round(count * 255 / total)) for count in hist)
+
+
+def color_distance(a: bytes, b: bytes) -> float:
+    """L1 distance between two colour signatures, from 0 (same) to 2 (disjoint)."""
+    if not a or not b or len(a) != len(b):
+        return 2.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / 255
+
+
+def image_signature(image: Image.Image):
+    """`(perceptual_hash, color_signature)`: the analysis cache key for an image."""
+    return perceptual_hash(image), color_signature(image)
+
+
+# =============================
+# 🌳 BK-Tree (Hamming Index)
+# =============================
+class BKTree:
+    """Metric tree over 64-bit hashes for near-duplicate lookups."""
+
+    def __init__(self):
+        self._root = None  # (hash, {distance: child})
+        self.size = 0
+
+    def add(self, value: int):
+        if self._root is None:
+            self._root = (value, {})
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            dist = hamming_distance(value, node[0])
+            if dist == 0:
+                return
+            child = node[1].get(dist)
+            if child is None:
+                node[1][dist] = (value, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int):
+        """Returns [(distance, hash)] within `max_distance`, closest first."""
+        if self._root is None:
+            return []
+        matches, stack = [], [self._root]
+        while stack:
+            node_value, children = stack.pop()
+            dist = hamming_distance(value, node_value)
+            if dist <= max_distance:
+                matches.append((dist, node_value))
+            for child_dist, child in children.items():
+                if dist - max_distance <= child_dist <= dist + max_distance:
+                    stack.append(child)
+        return sorted(matches)
+
+
+# =============================
+# 🧠 Two-Tier Analysis Cache
+# =============================
+class AnalysisCache:
+    """
+    Caches image-analysis text by perceptual hash plus colour signature.
+
+    - Memory tier: LRU with TTL.
+    - Disk tier (optional): SQLite file that survives restarts.
+    - Near duplicates are resolved through a BK-tree over all known hashes;
+      an entry only counts when its colours match as well.
+    - Use `get_async`/`put_async` from the event loop: with a disk tier they
+      run in a thread so SQLite never blocks the loop.
+    """
+
+    def __init__(self, max_size=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL,
+                 max_distance=ANALYSIS_CACHE_MAX_DISTANCE, max_color_distance=ANALYSIS_CACHE_MAX_COLOR_DISTANCE,
+                 path=ANALYSIS_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.max_color_distance = max_color_distance
+        self._memory = OrderedDict()  # hash -> (value, color, stored_at)
+        self._tree = BKTree()
+        self._stale = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"hits": 0, "near_hits": 0, "disk_hits": 0, "color_mismatches": 0, "misses": 0, "stores": 0}
+
+        if path:
+            self._open_disk(path)
+
+    def _open_disk(self, path):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache "
+                "(phash TEXT PRIMARY KEY, analysis TEXT, stored_at REAL, color BLOB)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(analysis_cache)")}
+            if "color" not in columns:
+                # Rows from before colour signatures never match (no colour to compare) and age out
+                self._db.execute("ALTER TABLE analysis_cache ADD COLUMN color BLOB")
+            self._db.execute("DELETE FROM analysis_cache WHERE stored_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+            for (phash,) in self._db.execute("SELECT phash FROM analysis_cache"):
+                self._tree.add(int(phash, 16))
+            logging.info(f"🗄️ Analysis cache loaded {self._tree.size} entries from {path}")
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Analysis disk cache disabled ({path}): {e}")
+            self._db = None
+
+    def _read(self, phash, color):
+        """
+        Reads one exact hash from memory, then disk. Returns None if absent,
+        expired or stored for an image with different colours.
+        """
+        now = time.time()
+        entry = self._memory.get(phash)
+        if entry is not None and now - entry[2] > self.ttl:
+            del self._memory[phash]
+            entry = None
+        if entry is not None:
+            self._memory.move_to_end(phash)
+        elif self._db is not None:
+            row = self._db.execute(
+                "SELECT analysis, color, stored_at FROM analysis_cache WHERE phash = ?", (f"{phash:016x}",)
+            ).fetchone()
+            if row and now - row[2] <= self.ttl:
+                self.stats["disk_hits"] += 1
+                entry = (row[0], row[1], row[2])
+                self._remember(phash, *entry)
+
+        if entry is None:
+            return None
+        if color_distance(entry[1], color) > self.max_color_distance:
+            self.stats["color_mismatches"] += 1
+            return None
+        return entry[0]
+
+    def _remember(self, phash, value, color, stored_at):
+        self._memory[phash] = (value, color, stored_at)
+        self._memory.move_to_end(phash)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            if self._db is None:
+                self._stale += 1
+
+    def get(self, phash: int, color: bytes):
+        """Returns the cached analysis for this image or its nearest same-coloured neighbour within range."""
+        with self._lock:
+            value = self._read(phash, color)
+            if value is not None:
+                self.stats["hits"] += 1
+                return value
+
+            for dist, candidate in self._tree.search(phash, self.max_distance):
+                if dist == 0:
+                    continue
+                value = self._read(candidate, color)
+                if value is not None:
+                    self.stats["hits"] += 1
+                    self.stats["near_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, phash: int, color: bytes, value: str):
+        with self._lock:
+            stored_at = time.time()
+            self._remember(phash, value, color, stored_at)
+            self._tree.add(phash)
+            self.stats["stores"] += 1
+
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO analysis_cache (phash, analysis, stored_at, color) VALUES (?, ?, ?, ?)",
+                        (f"{phash:016x}", value, stored_at, color),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"⚠️ Analysis disk cache write failed: {e}")
+
+            # The BK-tree cannot delete, so rebuild it once evicted hashes dominate.
+            if self._stale > self.max_size:
+                self._tree = BKTree()
+                for known in self._memory:
+                    self._tree.add(known)
+                self._stale = 0
+
+    async def get_async(self, phash: int, color: bytes):
+        if self._db is None:
+            return self.get(phash, color)
+        return await asyncio.to_thread(self.get, phash, color)
+
+    async def put_async(self, phash: int, color: bytes, value: str):
+        if self._db is None:
+            return self.put(phash, color, value)
+        return await asyncio.to_thread(self.put, phash, color, value)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "indexed_hashes": self._tree.size,
+                "disk_enabled": self._db is not None,
+            }
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,129 @@
+import re
+
+# =============================
+# ✍️ Local Caption Rules
+# =============================
+# The mechanical half of the caption prompt's rules, checked (and where
+# possible fixed) locally instead of by an extra Gemini round trip:
+# - at most 20 words (hashtags included)
+# - exactly 3 hashtags, one of them #Glamo
+# - no emojis, quotation marks, numbering or bullets
+# - no significant word repeated across the set
+
+MAX_WORDS = 20
+REQUIRED_HASHTAG = "#Glamo"
+HASHTAG_COUNT = 3
+MIN_SIGNIFICANT_LENGTH = 4
+
+_EMOJI = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"  # pictographs, emoticons, transport, symbols & pictographs extended
+    "\U00002600-\U000027BF"  # misc symbols, dingbats
+    "\U00002B00-\U00002BFF"  # arrows, stars
+    "\U0000FE0F\U0000200D"   # variation selector, zero-width joiner
+    "\U0001F1E6-\U0001F1FF"  # flags
+    "]+"
+)
+_QUOTES = re.compile(r"[\"“”„«»]")
+_WRAPPING_SINGLE_QUOTES = re.compile(r"(^|\s)['‘’]+|['‘’]+(?=\s|$)")
+_LIST_PREFIX = re.compile(r"^\s*(?:\(?\d+[.):-]|[-*•·])\s*")
+_HASHTAG = re.compile(r"#\w+")
+_WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+STOPWORDS = {
+    "about", "after", "again", "all", "also", "and", "are", "back", "been", "but", "can", "every", "for",
+    "from", "have", "here", "into", "just", "like", "made", "make", "more", "most", "much", "only", "our",
+    "over", "some", "such", "than", "that", "the", "their", "them", "then", "there", "these", "they",
+    "this", "through", "time", "under", "very", "what", "when", "where", "which", "while", "with",
+    "your", "yours",
+}
+
+
+def caption_violations(caption):
+    """Returns a list of rule names the caption breaks (empty = valid on its own)."""
+    problems = []
+    if _LIST_PREFIX.match(caption):
+        problems.append("numbering")
+    if _QUOTES.search(caption) or _WRAPPING_SINGLE_QUOTES.search(caption):
+        problems.append("quotes")
+    if _EMOJI.search(caption):
+        problems.append("emoji")
+
+    hashtags = _HASHTAG.findall(caption)
+    if len(hashtags) != HASHTAG_COUNT or len({h.lower() for h in hashtags}) != len(hashtags):
+        problems.append("hashtag_count")
+    if REQUIRED_HASHTAG.lower() not in (h.lower() for h in hashtags):
+        problems.append("missing_glamo")
+    if len(caption.split()) > MAX_WORDS:
+        problems.append("too_long")
+    if not _text_words(caption):
+        problems.append("empty")
+    return problems
+
+
+def _text_words(caption):
+    return [w for w in caption.split() if not w.startswith("#")]
+
+
+def fix_caption(caption):
+    """
+    Applies the fixes that don't need the model: strips numbering, quotes and
+    emojis, de-duplicates hashtags, adds #Glamo, drops extra hashtags and trims
+    to the word limit. A caption with too few hashtags of its own stays invalid.
+    """
+    text = _LIST_PREFIX.sub("", caption.strip(), count=1)
+    text = _QUOTES.sub("", text)
+    text = _WRAPPING_SINGLE_QUOTES.sub(r"\1", text)
+    text = _EMOJI.sub("", text)
+
+    hashtags, seen = [], set()
+    for tag in _HASHTAG.findall(text):
+        if tag.lower() not in seen:
+            seen.add(tag.lower())
+            hashtags.append(REQUIRED_HASHTAG if tag.lower() == REQUIRED_HASHTAG.lower() else tag)
+    others = [tag for tag in hashtags if tag != REQUIRED_HASHTAG][:HASHTAG_COUNT - 1]
+
+    words = [w for w in _HASHTAG.sub(" ", text).split() if w.strip(".,;:!?-–—")]
+    words = words[:MAX_WORDS - HASHTAG_COUNT]
+    body = " ".join(words).rstrip(",;:-–— ")
+    return " ".join([body, REQUIRED_HASHTAG, *others]).strip()
+
+
+def significant_words(caption):
+    return {
+        w.lower() for w in _WORD.findall(" ".join(_text_words(caption)))
+        if len(w) >= MIN_SIGNIFICANT_LENGTH and w.lower() not in STOPWORDS
+    }
+
+
+def filter_captions(captions, used_words=None, limit=5):
+    """
+    Fixes each caption and keeps those that pass every rule, in order.
+    A caption repeating a significant word from an earlier kept caption is
+    rejected. Returns `(kept, rejected, used_words)`.
+    """
+    used = set(used_words or ())
+    kept, rejected = [], []
+    for caption in captions:
+        if not caption.strip():
+            continue
+        fixed = fix_caption(caption)
+        words = significant_words(fixed)
+        if len(kept) >= limit or caption_violations(fixed) or words & used:
+            rejected.append(caption)
+            continue
+        kept.append(fixed)
+        used |= words
+    return kept, rejected, used
+
+
+_REJECTION = re.compile(r"❌|\binvalid\b|\bnot\s+valid\b|\bisn[’']?t\s+valid\b", re.IGNORECASE)
+_APPROVAL = re.compile(r"✅|\bvalid\b", re.IGNORECASE)
+
+
+def parse_validator_verdict(text):
+    """Reads the LLM validator's '✅ Valid' / '❌ Invalid' answer. Any rejection, or an unclear answer, is invalid."""
+    verdict = (text or "").strip()
+    if not verdict or _REJECTION.search(verdict):
+        return False
+    return bool(_APPROVAL.search(verdict))
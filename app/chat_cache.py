@@ -0,0 +1,196 @@
+import os
+import re
+import math
+import time
+import json
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from app.faq import FAQ
+
+# =============================
+# ⚙️ Configuration
+# =============================
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1024"))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", str(6 * 3600)))
+CHAT_FAQ_MIN_SCORE = float(os.getenv("CHAT_FAQ_MIN_SCORE", "0.8"))
+CHAT_FAQ_PATH = os.getenv("CHAT_FAQ_PATH", "")  # Optional JSON file replacing the built-in FAQ
+
+NGRAM_SIZES = (3, 4)
+FILLER_WORDS = {"hey", "hi", "hello", "please", "pls", "plz", "glamo", "can", "you", "tell", "me", "um", "so"}
+SYNONYMS = {"versus": "vs", "v": "vs", "or": "vs", "pic": "photo", "pics": "photos", "picture": "photo",
+            "pictures": "photos", "image": "photo", "images": "photos", "apps": "app"}
+
+# Apps and topics a canned answer is specific to. A question only matches an
+# FAQ entry that names exactly the same ones, so "VSCO vs Snapseed" never gets
+# the VSCO/Lightroom answer and "how do I start a vlog" never gets the welcome.
+ENTITY_WORDS = {
+    "vsco": "vsco", "lightroom": "lightroom", "snapseed": "snapseed", "picsart": "picsart",
+    "photoshop": "photoshop", "canva": "canva", "facetune": "facetune", "capcut": "capcut",
+    "instagram": "instagram", "insta": "instagram", "tiktok": "tiktok", "youtube": "youtube",
+    "snapchat": "snapchat", "pinterest": "pinterest", "iphone": "iphone", "android": "android",
+    "video": "video", "videos": "video", "vlog": "video", "vlogs": "video", "reel": "video", "reels": "video",
+    "preset": "preset", "presets": "preset", "filter": "filter", "filters": "filter",
+    "story": "story", "stories": "story", "heic": "heic", "raw": "raw",
+}
+
+
+def normalize_question(question):
+    """Lower-cases, strips accents/punctuation/filler words and maps common synonyms."""
+    text = unicodedata.normalize("NFKD", question).encode("ascii", "ignore").decode().lower()
+    words = re.findall(r"[a-z0-9]+", text)
+    words = [SYNONYMS.get(w, w) for w in words if w not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def question_entities(normalized):
+    """The apps/topics (ENTITY_WORDS) a normalized question names."""
+    return frozenset(ENTITY_WORDS[w] for w in normalized.split() if w in ENTITY_WORDS)
+
+
+# =============================
+# 💬 Answer Cache
+# =============================
+class ChatAnswerCache:
+    """LRU + TTL cache of Gemini answers keyed by the normalized question."""
+
+    def __init__(self, max_size=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # normalized question -> (answer, stored_at)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, answer):
+        if not key or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (answer, time.time())
+            self._entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# =============================
+# 📚 FAQ Similarity Index
+# =============================
+def _ngrams(text):
+    padded = f" {text} "
+    grams = defaultdict(int)
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+class FaqIndex:
+    """
+    TF-IDF over character n-grams of every FAQ phrasing, with an inverted
+    index so a lookup only touches phrasings that share a gram with the query.
+    Matches below `min_score` cosine similarity, or whose phrasing names other
+    apps/topics than the question (see ENTITY_WORDS), are ignored.
+    """
+
+    def __init__(self, entries, min_score=CHAT_FAQ_MIN_SCORE):
+        self.min_score = min_score
+        self.answers = [entry["answer"] for entry in entries]
+        self._doc_answer = []  # doc index -> answer index
+        self._postings = defaultdict(list)  # gram -> [(doc, weight)]
+        self._idf = {}
+        self._entities = []  # doc index -> entities the phrasing names
+        self.stats = {"hits": 0, "misses": 0, "entity_mismatches": 0}
+
+        docs = []
+        for answer_index, entry in enumerate(entries):
+            for question in entry["questions"]:
+                normalized = normalize_question(question)
+                docs.append(_ngrams(normalized))
+                self._doc_answer.append(answer_index)
+                self._entities.append(question_entities(normalized))
+
+        doc_freq = defaultdict(int)
+        for grams in docs:
+            for gram in grams:
+                doc_freq[gram] += 1
+        total = len(docs)
+        self._idf = {gram: math.log((1 + total) / (1 + df)) + 1 for gram, df in doc_freq.items()}
+
+        for doc, grams in enumerate(docs):
+            vector = self._weigh(grams)
+            for gram, weight in vector.items():
+                self._postings[gram].append((doc, weight))
+
+    def _weigh(self, grams):
+        vector = {g: (1 + math.log(tf)) * self._idf[g] for g, tf in grams.items() if g in self._idf}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {g: w / norm for g, w in vector.items()} if norm else {}
+
+    def match(self, question):
+        """Returns `(answer, score)` for the best phrasing at or above the threshold, else None."""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        scores = defaultdict(float)
+        for gram, weight in self._weigh(_ngrams(normalized)).items():
+            for doc, doc_weight in self._postings.get(gram, ()):
+                scores[doc] += weight * doc_weight
+
+        entities = question_entities(normalized)
+        for doc, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if score < self.min_score:
+                break
+            if self._entities[doc] != entities:
+                self.stats["entity_mismatches"] += 1
+                continue
+            self.stats["hits"] += 1
+            return self.answers[self._doc_answer[doc]], round(score, 3)
+        self.stats["misses"] += 1
+        return None
+
+    def snapshot(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "answers": len(self.answers),
+            "phrasings": len(self._doc_answer),
+            "min_score": self.min_score,
+        }
+
+
+def _load_faq():
+    if CHAT_FAQ_PATH:
+        try:
+            with open(CHAT_FAQ_PATH, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"⚠️ Could not load CHAT_FAQ_PATH ({CHAT_FAQ_PATH}), using built-in FAQ: {e}")
+    return FAQ
+
+
+chat_cache = ChatAnswerCache()
+faq_index = FaqIndex(_load_faq())
@@ -0,0 +1,84 @@
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+
+# =============================
+# ⏰ Request Deadlines
+# =============================
+# Each request gets one absolute deadline (monotonic clock) stored in a
+# contextvar, so every stage, Gemini attempt and music lookup started on its
+# behalf sees the same shrinking budget without it being passed around.
+
+_deadline = contextvars.ContextVar("glamo_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the work finished."""
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Sets a deadline `seconds` from now for the enclosed work. A scope never
+    extends an earlier outer deadline. None or <= 0 leaves the budget as is.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def unbounded():
+    """Clears the deadline for the enclosed work (e.g. a call shared by several requests)."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget (may be negative), or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def cap(seconds):
+    """`seconds`, shortened to what is left of the budget (never below 0)."""
+    left = remaining()
+    return seconds if left is None else max(0.0, min(seconds, left))
+
+
+def check(what="request"):
+    """Raises DeadlineExceeded when the budget is spent."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{what} ran past its deadline")
+
+
+async def within_deadline(coro, what="request", grace=0.0):
+    """
+    Awaits `coro`, cancelling it once the budget (plus `grace`) is spent.
+    `grace` lets work that watches the deadline itself return partial results first.
+    """
+    left = remaining()
+    if left is None:
+        return await coro
+    if left + grace <= 0:
+        if asyncio.iscoroutine(coro):
+            coro.close()
+        raise DeadlineExceeded(f"{what} ran past its deadline")
+    try:
+        return await asyncio.wait_for(coro, timeout=left + grace)
+    except asyncio.TimeoutError:
+        if remaining() + grace > 0:
+            raise  # The work's own timeout, not ours
+        raise DeadlineExceeded(f"{what} ran past its deadline") from None
@@ -0,0 +1,127 @@
+# faq.py - Precomputed answers for the questions /chat sees most often.
+# Each entry lists a few phrasings; the chat FAQ index matches new questions
+# against all of them. Answers follow the same rules as `get_chat_prompt`
+# (friendly, beginner-level, no numeric editing values).
+
+FAQ = [
+    {
+        "questions": [
+            "How do I start?",
+            "How do I use Glamo?",
+            "How does this app work?",
+            "Where do I begin?",
+            "How to get started",
+        ],
+        "answer": "Welcome to Glamo! Upload a photo, pick the editing app you use and the style you're going for, then tap Get Editing Suggestions. You'll get step-by-step edits, captions and matching songs for your photo.",
+    },
+    {
+        "questions": [
+            "What is the difference between VSCO and Lightroom?",
+            "VSCO vs Lightroom",
+            "Should I use VSCO or Lightroom?",
+            "Lightroom or VSCO which is better?",
+        ],
+        "answer": "VSCO is filter-first: you start from a film-like preset and fine-tune it, which is great for quick, consistent aesthetic looks. Lightroom gives you precise control over light, color and detail with sliders and masks, so it's better when you want to shape a photo carefully. Pick VSCO for speed and vibe, Lightroom for control.",
+    },
+    {
+        "questions": [
+            "What is the difference between Snapseed and Lightroom?",
+            "Snapseed vs Lightroom",
+            "Should I use Snapseed or Lightroom?",
+        ],
+        "answer": "Snapseed is free and great for quick fixes, selective edits and healing, all with simple swipe controls. Lightroom offers more precise color and light control and syncs presets across devices. Snapseed suits fast touch-ups; Lightroom suits a consistent, polished look.",
+    },
+    {
+        "questions": [
+            "Which app should I use?",
+            "What is the best editing app?",
+            "Which editing app is best for beginners?",
+            "Best app for editing photos",
+        ],
+        "answer": "For beginners, the iPhone Photos app or Snapseed are the easiest places to start. VSCO is great for a quick aesthetic look, Lightroom for precise control, and PicsArt for creative effects. Not sure? Upload a photo and use Suggest Style & App to get a recommendation for that exact shot.",
+    },
+    {
+        "questions": [
+            "Tips for a good selfie?",
+            "How do I take a better selfie?",
+            "Selfie tips",
+            "How to look good in selfies",
+        ],
+        "answer": "Face a soft light source like a window, hold the camera slightly above eye level, and keep the background simple. Tap to focus on your eyes, relax your shoulders and try a few angles. Natural light almost always beats flash!",
+    },
+    {
+        "questions": [
+            "What is the rule of thirds?",
+            "Explain the rule of thirds",
+            "How does the rule of thirds work?",
+        ],
+        "answer": "Imagine your photo split by two horizontal and two vertical lines into nine equal boxes. Placing your subject or horizon along those lines, or where they cross, usually feels more balanced and interesting than centering everything. Most camera apps can show this grid for you.",
+    },
+    {
+        "questions": [
+            "Where can I find captions?",
+            "How do I get captions?",
+            "Where are the captions?",
+            "Can Glamo write captions for me?",
+        ],
+        "answer": "Captions appear in the results after you analyze a photo — Glamo writes five Instagram-ready captions that match your photo and chosen style, each with #Glamo and two relevant hashtags.",
+    },
+    {
+        "questions": [
+            "How do I get song suggestions?",
+            "Where are the songs?",
+            "Can Glamo suggest music for my photo?",
+            "Music for my post",
+        ],
+        "answer": "After you analyze a photo, Glamo suggests songs that match its mood and your style, with links so you can preview them. Pick one that fits the vibe of your post!",
+    },
+    {
+        "questions": [
+            "What style should I choose?",
+            "Which style suits my photo?",
+            "How do I pick a style?",
+            "Suggest a style for my photo",
+        ],
+        "answer": "Think about the mood you want: Bright & Airy for fresh, light photos, Moody & Dark for dramatic scenes, Golden Hour Glow for warm sunsets, Vibrant & Vivid for colorful shots. Or upload your photo and tap Suggest Style & App to let Glamo pick for you.",
+    },
+    {
+        "questions": [
+            "Is Glamo free?",
+            "Do I have to pay?",
+            "How much does Glamo cost?",
+        ],
+        "answer": "You can upload photos and get editing suggestions, captions and song ideas right here in the app. The editing apps themselves (like Lightroom or VSCO) may have their own free and paid features.",
+    },
+    {
+        "questions": [
+            "Which photo formats are supported?",
+            "Can I upload HEIC?",
+            "What file types can I upload?",
+        ],
+        "answer": "Upload any common image format such as JPG, PNG or WebP. For the best results use a clear, well-lit photo — Glamo resizes it automatically before analysis.",
+    },
+    {
+        "questions": [
+            "Why are my photos blurry?",
+            "How do I fix a blurry photo?",
+            "How to take sharp photos",
+        ],
+        "answer": "Blur usually comes from motion or missed focus. Hold your phone steady with both hands, tap to focus on your subject, and use more light so the camera can use a faster shutter. In editing, a gentle sharpening or structure boost can help, but it can't fully rescue a very blurry shot.",
+    },
+    {
+        "questions": [
+            "How do I edit photos at night?",
+            "Tips for night photos",
+            "How to fix dark photos",
+        ],
+        "answer": "Keep the phone steady or use night mode, and find some light like street lamps or neon signs. When editing, lift shadows gently, keep blacks deep enough for contrast, and reduce noise instead of pushing brightness too far. A Moody & Dark style often suits night shots beautifully.",
+    },
+    {
+        "questions": [
+            "What is golden hour?",
+            "When is golden hour?",
+            "Best time of day for photos",
+        ],
+        "answer": "Golden hour is the time shortly after sunrise and before sunset when sunlight is soft, warm and low. It flatters skin tones and adds long, gentle shadows — perfect for portraits and the Golden Hour Glow style.",
+    },
+]
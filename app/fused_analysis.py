@@ -0,0 +1,139 @@
+import re
+import json
+from app.prompts import EDITING_PROMPTS, get_fused_analysis_prompt
+from app.image_analysis import ANALYSIS_FIELDS, ImageAnalysis
+
+# =============================
+# 🧬 Fused (Single-Call) Analysis
+# =============================
+# One multimodal Gemini call with a JSON response schema replaces the
+# analysis → editing / captions → validator / music round trips. The reply
+# is validated here and converted to the same shapes the multi-call
+# pipeline produces, so the rest of /analyze doesn't care which mode ran.
+
+MAX_CAPTIONS = 10  # Extras give the local caption check something to pick from
+MAX_MUSIC_QUERIES = 10
+
+
+class FusedResponseError(ValueError):
+    """The fused reply was not valid JSON or did not match the schema."""
+
+
+def _string():
+    return {"type": "STRING"}
+
+
+def fused_response_schema(include_editing=True):
+    """Gemini `response_schema` (OpenAPI subset) for the fused reply."""
+    properties = {
+        "analysis": {
+            "type": "OBJECT",
+            "properties": {name: _string() for name in ANALYSIS_FIELDS},
+            "required": list(ANALYSIS_FIELDS),
+        },
+        "captions": {"type": "ARRAY", "items": _string()},
+        "music_queries": {"type": "ARRAY", "items": _string()},
+    }
+    if include_editing:
+        properties["editing_steps"] = {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"tool": _string(), "value": _string(), "reason": _string()},
+                "required": ["tool", "value", "reason"],
+            },
+        }
+    return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+
+
+def fused_request(style, selected_app):
+    """Returns `(prompt, generation_config)` for one fused call."""
+    include_editing = (selected_app or "").lower() in EDITING_PROMPTS
+    generation_config = {
+        "response_mime_type": "application/json",
+        "response_schema": fused_response_schema(include_editing),
+    }
+    return get_fused_analysis_prompt(style, selected_app), generation_config
+
+
+def _validate(value, schema, path="$"):
+    kind = schema["type"]
+    if kind == "OBJECT":
+        if not isinstance(value, dict):
+            raise FusedResponseError(f"{path}: expected an object")
+        for name in schema.get("required", ()):
+            if name not in value:
+                raise FusedResponseError(f"{path}.{name}: missing")
+        for name, sub_schema in schema.get("properties", {}).items():
+            if name in value:
+                _validate(value[name], sub_schema, f"{path}.{name}")
+    elif kind == "ARRAY":
+        if not isinstance(value, list):
+            raise FusedResponseError(f"{path}: expected an array")
+        for i, item in enumerate(value):
+            _validate(item, schema["items"], f"{path}[{i}]")
+    elif kind == "STRING":
+        # Editing values come back as numbers surprisingly often; accept and stringify those
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise FusedResponseError(f"{path}: expected a string")
+
+
+def _load_json(text):
+    text = text.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", text, flags=re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise FusedResponseError(f"reply is not valid JSON: {e}") from e
+
+
+def _clean_lines(values, limit):
+    cleaned = []
+    for value in values:
+        value = str(value).strip().strip('"').strip()
+        if value and value not in cleaned:
+            cleaned.append(value)
+    return cleaned[:limit]
+
+
+def render_editing_steps(steps):
+    lines = []
+    for i, step in enumerate(steps, start=1):
+        lines.append(f"Step {i}: {str(step['tool']).strip()} – {str(step['value']).strip()}")
+        lines.append(f"Reason: {str(step['reason']).strip()}")
+    return "\n".join(lines)
+
+
+def parse_fused_response(text, selected_app):
+    """
+    Validates the fused JSON reply and returns the pipeline's section shapes:
+    `image_analysis` (markdown), `editing_values` (text or None when the app has
+    no editing prompt), `raw_captions` (one per line, checked by the caption
+    stage like in the multi-call pipeline) and `music_queries` (list).
+    """
+    if not text or text.startswith("❌"):
+        raise FusedResponseError(text or "empty reply")
+
+    include_editing = (selected_app or "").lower() in EDITING_PROMPTS
+    data = _load_json(text)
+    _validate(data, fused_response_schema(include_editing))
+
+    if any(not str(data["analysis"][name]).strip() for name in ANALYSIS_FIELDS):
+        raise FusedResponseError("$.analysis: empty field")
+    captions = _clean_lines(data["captions"], MAX_CAPTIONS)
+    if not captions:
+        raise FusedResponseError("$.captions: no captions")
+    editing = None
+    if include_editing:
+        if not data["editing_steps"]:
+            raise FusedResponseError("$.editing_steps: no steps")
+        editing = render_editing_steps(data["editing_steps"])
+
+    return {
+        "image_analysis": ImageAnalysis(data["analysis"]).render(),
+        "editing_values": editing,
+        "raw_captions": "\n".join(captions),
+        "music_queries": _clean_lines(data["music_queries"], MAX_MUSIC_QUERIES),
+    }
@@ -0,0 +1,118 @@
+import json
+import base64
+from types import SimpleNamespace
+import httpx
+
+# =============================
+# 🌐 Gemini REST Transport
+# =============================
+# Speaks the public `models/{model}:generateContent` REST API. Used when
+# GEMINI_API_ENDPOINT is set, e.g. to point the app at the local stand-in
+# server in `loadtest/standin.py` instead of generativelanguage.googleapis.com.
+
+_http_client = None
+
+
+def _client():
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=httpx.Timeout(60), limits=httpx.Limits(max_connections=100))
+    return _http_client
+
+
+async def close_rest_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class GeminiRestError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+def _to_part(item):
+    if isinstance(item, str):
+        return {"text": item}
+    if isinstance(item, dict) and "mime_type" in item:
+        return {"inline_data": {"mime_type": item["mime_type"],
+                                "data": base64.b64encode(item["data"]).decode()}}
+    raise TypeError(f"Unsupported content part: {type(item).__name__}")
+
+
+def _camel(name):
+    head, *rest = name.split("_")
+    return head + "".join(word.title() for word in rest)
+
+
+def _to_response(data):
+    candidates = data.get("candidates") or []
+    parts = (candidates[0].get("content") or {}).get("parts", []) if candidates else []
+    usage = data.get("usageMetadata") or {}
+    return SimpleNamespace(
+        text="".join(p.get("text", "") for p in parts),
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount"),
+            candidates_token_count=usage.get("candidatesTokenCount"),
+            total_token_count=usage.get("totalTokenCount"),
+        ),
+    )
+
+
+class RestGenerativeModel:
+    """Minimal stand-in for `genai.GenerativeModel` over plain HTTP, bound to one API key."""
+
+    def __init__(self, model_name, api_key, endpoint):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.endpoint = endpoint.rstrip("/")
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False):
+        items = contents if isinstance(contents, list) else [contents]
+        body = {"contents": [{"role": "user", "parts": [_to_part(item) for item in items]}]}
+        if generation_config:
+            # SDK-style snake_case keys (response_mime_type) -> REST camelCase (responseMimeType)
+            body["generationConfig"] = {_camel(k): v for k, v in generation_config.items()}
+
+        if stream:
+            return RestStream(f"{self.endpoint}/v1beta/models/{self.model_name}:streamGenerateContent",
+                              self.api_key, body)
+
+        res = await _client().post(
+            f"{self.endpoint}/v1beta/models/{self.model_name}:generateContent",
+            params={"key": self.api_key},
+            json=body,
+        )
+        if res.status_code >= 400:
+            raise GeminiRestError(res.status_code, res.text[:200])
+        return _to_response(res.json())
+
+
+class RestStream:
+    """
+    Async iterator over `streamGenerateContent?alt=sse` chunks, shaped like the
+    SDK's streaming response: each chunk has `.text`, and `usage_metadata` is
+    filled in once the stream reports it. The request is sent on first iteration.
+    """
+
+    def __init__(self, url, api_key, body):
+        self.url = url
+        self.api_key = api_key
+        self.body = body
+        self.usage_metadata = None
+
+    async def __aiter__(self):
+        async with _client().stream("POST", self.url, params={"key": self.api_key, "alt": "sse"},
+                                    json=self.body) as res:
+            if res.status_code >= 400:
+                raise GeminiRestError(res.status_code, (await res.aread()).decode(errors="replace")[:200])
+            async for line in res.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                chunk = _to_response(data)
+                if data.get("usageMetadata"):
+                    self.usage_metadata = chunk.usage_metadata
+                yield chunk
@@ -1,10 +1,24 @@
 import os
 import io
+import json
+import time
 import asyncio
-from itertools import cycle
+import hashlib
+import logging
+from collections import deque, defaultdict
 from PIL import Image
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 from dotenv import load_dotenv
+from app.singleflight import SingleFlight
+from app.gemini_rest import RestGenerativeModel
+from app.metrics import (
+    GEMINI_REQUESTS, GEMINI_RETRIES, GEMINI_LATENCY, GEMINI_TOKENS, GEMINI_HEDGES, GEMINI_QUEUE_WAIT,
+    register_collector
+)
+from app.tracing import span
+from app.prompt_tokens import estimate_tokens
+from app import deadline
 
 # =============================
 # 🔑 Load Environment Variables
@@ -17,113 +31,725 @@ keys = [k.strip() for k in keys if k.strip()]
 if not keys:
     raise ValueError("❌ No Gemini API keys found. Please set GEMINI_KEYS in .env")
 
-key_pool = cycle(keys)
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")  # Set to use the REST API (e.g. a local stand-in)
+GEMINI_RPM_PER_KEY = float(os.getenv("GEMINI_RPM_PER_KEY", "15"))
+GEMINI_TPM_PER_KEY = float(os.getenv("GEMINI_TPM_PER_KEY", "1000000"))
+GEMINI_COOLDOWN_SECONDS = float(os.getenv("GEMINI_COOLDOWN_SECONDS", "30"))
+GEMINI_ACQUIRE_TIMEOUT = float(os.getenv("GEMINI_ACQUIRE_TIMEOUT", "30"))
+GEMINI_CALL_TIMEOUT = float(os.getenv("GEMINI_CALL_TIMEOUT", "40"))  # Per attempt, capped by the request deadline
+GEMINI_FIRST_CHUNK_TIMEOUT = float(os.getenv("GEMINI_FIRST_CHUNK_TIMEOUT", "20"))  # Streaming: retry if exceeded
+GEMINI_CHUNK_TIMEOUT = float(os.getenv("GEMINI_CHUNK_TIMEOUT", "40"))  # Streaming: max gap between chunks
+
+# Hedging: once a call runs past the observed p95 for its kind, send a
+# duplicate on another key and keep whichever answer arrives first.
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "0.95"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "0.5"))
+
+# Admission: at most GEMINI_MAX_CONCURRENCY upstream calls run at once per
+# process; the rest wait in FIFO order. New requests are shed (503) while
+# GEMINI_SHED_QUEUE calls are waiting or the oldest has waited GEMINI_SHED_WAIT.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", str(max(4, 4 * len(keys)))))
+GEMINI_SHED_QUEUE = int(os.getenv("GEMINI_SHED_QUEUE", str(2 * GEMINI_MAX_CONCURRENCY)))
+GEMINI_SHED_WAIT = float(os.getenv("GEMINI_SHED_WAIT", "5"))
+
+# Rough token estimate per image used to pre-charge the TPM bucket before a call.
+IMAGE_TOKEN_ESTIMATE = 258
+
+# =============================
+# 🪣 Token Bucket
+# =============================
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute, capped at `per_minute`."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they already are)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount  # May go negative when reconciling actual usage
+
+
+# =============================
+# 🔐 Per-Key Client
+# =============================
+class GeminiKey:
+    """One API key with its own long-lived client, rate budgets and health state."""
+
+    def __init__(self, api_key, index=0):
+        self.api_key = api_key
+        # Every Google key starts with the same prefix, so label by pool position plus a short digest
+        self.label = f"#{index} ({hashlib.sha256(api_key.encode()).hexdigest()[:8]})"
+        self.id = f"key{index}"  # Unique, stable metrics label
+        self.rpm = TokenBucket(GEMINI_RPM_PER_KEY)
+        self.tpm = TokenBucket(GEMINI_TPM_PER_KEY)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "rate_limited": 0,
+                      "timeouts": 0, "tokens": 0}
+        self.last_error = None
+        self._model = None
+
+    @property
+    def model(self):
+        # The model is bound to a client that carries this key, so concurrent
+        # requests never race on the process-global `genai.configure`.
+        if self._model is None and GEMINI_API_ENDPOINT:
+            self._model = RestGenerativeModel(GEMINI_MODEL, self.api_key, GEMINI_API_ENDPOINT)
+        elif self._model is None:
+            self._model = genai.GenerativeModel(GEMINI_MODEL)
+            self._model._async_client = glm.GenerativeServiceAsyncClient(
+                client_options={"api_key": self.api_key}
+            )
+        return self._model
+
+    def wait_time(self, tokens, now):
+        if now < self.cooldown_until:
+            return self.cooldown_until - now
+        return max(self.rpm.wait_time(1, now), self.tpm.wait_time(tokens, now))
+
+    def snapshot(self, now):
+        return {
+            "key": self.label,
+            "id": self.id,
+            "in_flight": self.in_flight,
+            "cooling_down": now < self.cooldown_until,
+            "cooldown_remaining": round(max(0.0, self.cooldown_until - now), 1),
+            "rpm_available": round(max(0.0, self.rpm.tokens), 1),
+            "tpm_available": round(max(0.0, self.tpm.tokens)),
+            "last_error": self.last_error,
+            **self.stats,
+        }
+
+
+# =============================
+# 🎱 Key Pool (Least-Loaded Selection)
+# =============================
+class KeyPool:
+    def __init__(self, api_keys):
+        self.keys = [GeminiKey(k, index) for index, k in enumerate(api_keys)]
+
+    def try_acquire(self, tokens, exclude=None):
+        """Reserves the least-loaded ready key (other than `exclude`) without waiting. None if there is none."""
+        now = time.monotonic()
+        ready = [k for k in self.keys if k is not exclude and k.wait_time(tokens, now) == 0]
+        if not ready:
+            return None
+        entry = min(ready, key=lambda k: (k.in_flight, -k.rpm.tokens, -k.tpm.tokens))
+        entry.rpm.consume(1, now)
+        entry.tpm.consume(tokens, now)
+        entry.in_flight += 1
+        entry.stats["requests"] += 1
+        return entry
+
+    async def acquire(self, tokens, timeout=None):
+        """
+        Reserves the least-loaded key that has RPM/TPM budget and is not cooling
+        down, waiting up to `timeout` (default GEMINI_ACQUIRE_TIMEOUT) for the
+        earliest key to free up if none is ready.
+        """
+        give_up_at = time.monotonic() + (GEMINI_ACQUIRE_TIMEOUT if timeout is None else timeout)
+        while True:
+            entry = self.try_acquire(tokens)
+            if entry is not None:
+                return entry
+
+            now = time.monotonic()
+            wait = min(k.wait_time(tokens, now) for k in self.keys)
+            if now + wait > give_up_at:
+                return None
+            await asyncio.sleep(min(max(wait, 0.05), 5))
+
+    def release(self, entry, estimated_tokens, used_tokens=None, error=None, rate_limited=False, timed_out=False,
+                cancelled=False):
+        now = time.monotonic()
+        entry.in_flight -= 1
+        if cancelled:
+            # Abandoned (lost hedge or spent deadline): not the key's fault
+            return
+        if used_tokens is not None:
+            entry.tpm.consume(used_tokens - estimated_tokens, now)
+            entry.stats["tokens"] += used_tokens
+
+        if error is None:
+            entry.stats["successes"] += 1
+            return
+
+        entry.stats["failures"] += 1
+        entry.last_error = str(error)[:200]
+        if rate_limited:
+            entry.stats["rate_limited"] += 1
+            entry.cooldown_until = now + GEMINI_COOLDOWN_SECONDS
+        if timed_out:
+            entry.stats["timeouts"] += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        return [k.snapshot(now) for k in self.keys]
+
+
+key_pool = KeyPool(keys)
+
+# =============================
+# 🚦 Concurrency Limiter
+# =============================
+class ConcurrencyLimiter:
+    """
+    Caps concurrent upstream calls; callers past the cap wait in FIFO order.
+    The queue depth and the age of the oldest waiter tell the admission
+    middleware when to shed new requests instead of queueing them too.
+    """
+
+    def __init__(self, limit=GEMINI_MAX_CONCURRENCY, shed_queue=GEMINI_SHED_QUEUE, shed_wait=GEMINI_SHED_WAIT):
+        self.limit = limit
+        self.shed_queue = shed_queue
+        self.shed_wait = shed_wait
+        self.in_flight = 0
+        self._waiters = deque()  # (enqueued_at, future)
+        self.waits = LatencyWindow()
+        self.stats = {"acquired": 0, "waited": 0, "timeouts": 0}
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def oldest_wait(self, now=None):
+        """Seconds the longest-waiting caller has been queued (0 when nobody is)."""
+        if not self._waiters:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self._waiters[0][0]
+
+    def overloaded(self):
+        """True when new work should be turned away so queued calls still finish in time."""
+        return self.queued >= self.shed_queue or self.oldest_wait() >= self.shed_wait
+
+    def retry_after(self):
+        """Rough seconds until the backlog clears, for a Retry-After header."""
+        typical = self.waits.percentile(0.5) or 1.0
+        return max(1, min(30, round(max(self.oldest_wait(), typical * self.queued / max(1, self.limit)))))
+
+    def try_acquire(self):
+        """Takes a slot without waiting (never jumps the queue). False if none is free."""
+        if self.in_flight >= self.limit or self._waiters:
+            return False
+        self.in_flight += 1
+        self.stats["acquired"] += 1
+        return True
+
+    async def acquire(self, timeout=None):
+        """Takes a slot, waiting up to `timeout` seconds in line. Returns False on timeout."""
+        if self.try_acquire():
+            self._observe(0.0)
+            return True
+
+        enqueued_at = time.monotonic()
+        waiter = (enqueued_at, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self.stats["waited"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()  # Handed a slot just as we gave up: pass it on
+            else:
+                waiter[1].cancel()
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.stats["timeouts"] += 1
+            return False
+        self._observe(time.monotonic() - enqueued_at)
+        return True
+
+    def release(self):
+        # The slot passes straight to the next waiter, so in_flight stays put
+        while self._waiters:
+            _, future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                self.stats["acquired"] += 1
+                return
+        self.in_flight -= 1
+
+    def _observe(self, seconds):
+        self.waits.add(seconds)
+        GEMINI_QUEUE_WAIT.observe(seconds)
+
+    def snapshot(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "oldest_wait_s": round(self.oldest_wait(), 3),
+            "wait_p95_s": _round(self.waits.percentile(0.95)),
+            "shed_queue": self.shed_queue,
+            "shed_wait_s": self.shed_wait,
+            "overloaded": self.overloaded(),
+            **self.stats,
+        }
 
 # =============================
 # 📌 Helper: Convert PIL Image -> Gemini Blob
 # =============================
 def _convert_image_to_blob(image):
-    """Converts a PIL Image to a Gemini-compatible Blob format."""
+    """Converts a PIL Image (or a pre-encoded PreparedImage) to a Gemini-compatible Blob format."""
     if image is None:
         return None
+    if hasattr(image, "blob"):
+        return image.blob
     try:
         buffer = io.BytesIO()
         image.save(buffer, format="PNG")
         buffer.seek(0)
         return {"mime_type": "image/png", "data": buffer.read()}
     except Exception as e:
-        print("⚠️ Image conversion failed:", e)
+        logging.warning(f"⚠️ Image conversion failed: {e}")
         return None
 
+
+def _as_image_list(image):
+    """`image` may be None, a single image or a list of images (packed multimodal call)."""
+    if image is None:
+        return []
+    if isinstance(image, (list, tuple)):
+        return list(image)
+    return [image]
+
+
+def _estimate_tokens(prompt, image_count):
+    return estimate_tokens(prompt) + IMAGE_TOKEN_ESTIMATE * image_count
+
+
+def _is_rate_limit_error(err):
+    return "quota" in err or "429" in err or "rate" in err or "resource exhausted" in err
+
 # =============================
 # 🌟 Internal Gemini Call Helpers
 # =============================
-async def _call_gemini_content(prompt, image=None):
+async def _call_gemini_content(model, prompt, image=None, generation_config=None):
     """Calls Gemini API for multimodal (image + text) or text-only prompts."""
-    model = genai.GenerativeModel("gemini-1.5-flash")
     try:
-        if image is not None:
-            blob = _convert_image_to_blob(image)
-            if blob:
-                response = await model.generate_content_async([prompt, blob])
-            else:
-                response = await model.generate_content_async(prompt)
+        blobs = [b for b in (_convert_image_to_blob(i) for i in _as_image_list(image)) if b]
+        if blobs:
+            response = await model.generate_content_async([prompt, *blobs], generation_config=generation_config)
         else:
-            response = await model.generate_content_async(prompt)
+            response = await model.generate_content_async(prompt, generation_config=generation_config)
 
-        return getattr(response, "text", str(response)).strip()
+        return response
 
     except Exception as e:
-        print("❌ Gemini content call failed:", e)
+        logging.warning(f"❌ Gemini content call failed: {e}")
         raise
 
-async def _call_gemini_text(prompt):
-    """Calls Gemini API for text-only prompts."""
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    try:
-        response = await model.generate_content_async(prompt)
-        return getattr(response, "text", str(response)).strip()
-    except Exception as e:
-        print("❌ Gemini text call failed:", e)
-        raise
+
+def _response_text(response):
+    return getattr(response, "text", str(response)).strip()
+
+
+def _response_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None) if usage is not None else None
+    return total or None
+
+
+def _record_usage(entry, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens:
+        GEMINI_TOKENS.inc(prompt_tokens, key=entry.id, type="prompt")
+    if response_tokens:
+        GEMINI_TOKENS.inc(response_tokens, key=entry.id, type="response")
+
 
 # =============================
-# 🚀 Public API Functions
+# 🏁 Hedged Calls
 # =============================
-async def generate_content_async(prompt, image=None, retries=None):
+class LatencyWindow:
+    """Latencies of recent successful calls of one kind, for the hedging threshold."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, q):
+        """None until GEMINI_HEDGE_MIN_SAMPLES calls have been seen."""
+        if len(self.samples) < GEMINI_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+latency_windows = defaultdict(LatencyWindow)
+gemini_limiter = ConcurrencyLimiter()
+
+
+class _AttemptFailed(Exception):
+    """An attempt failed in a way another key may not (timeout, rate limit)."""
+
+
+def _hedge_delay(kind):
+    if not GEMINI_HEDGE or len(key_pool.keys) < 2:
+        return None
+    p95 = latency_windows[kind].percentile(GEMINI_HEDGE_PERCENTILE)
+    return None if p95 is None else max(p95, GEMINI_HEDGE_MIN_DELAY)
+
+
+async def _attempt(entry, prompt, image, kind, generation_config, estimated, attempt, hedge=False):
+    """One call on a reserved key; the key is always released. Returns the response."""
+    timeout = deadline.cap(GEMINI_CALL_TIMEOUT)
+    start = time.perf_counter()
+    with span(f"gemini.{kind}", key=entry.label, attempt=attempt, hedge=hedge) as call_span:
+        try:
+            response = await asyncio.wait_for(
+                _call_gemini_content(entry.model, prompt, image, generation_config), timeout=timeout
+            )
+        except asyncio.CancelledError:
+            GEMINI_REQUESTS.inc(key=entry.id, outcome="cancelled")
+            key_pool.release(entry, estimated, cancelled=True)
+            call_span.fail("cancelled", status="cancelled")
+            raise
+        except asyncio.TimeoutError as e:
+            GEMINI_REQUESTS.inc(key=entry.id, outcome="timeout")
+            key_pool.release(entry, estimated, error=e, timed_out=True)
+            call_span.fail("timeout")
+            logging.warning(f"⏳ Gemini {kind} request timeout after {timeout:.1f}s with key {entry.label}")
+            raise _AttemptFailed("timeout") from e
+        except Exception as e:
+            err = str(e).lower()
+            rate_limited = _is_rate_limit_error(err)
+            GEMINI_REQUESTS.inc(key=entry.id, outcome="rate_limited" if rate_limited else "error")
+            key_pool.release(entry, estimated, error=e, rate_limited=rate_limited)
+            logging.warning(f"⚠️ Gemini {kind} key failed ({entry.label}): {err}")
+            if rate_limited:
+                call_span.fail(err, status="rate_limited")
+                raise _AttemptFailed(err) from e
+            raise
+        finally:
+            GEMINI_LATENCY.observe(time.perf_counter() - start, kind=kind)
+
+        latency_windows[kind].add(time.perf_counter() - start)
+        GEMINI_REQUESTS.inc(key=entry.id, outcome="success")
+        _record_usage(entry, response)
+        call_span.set(tokens=_response_tokens(response))
+        key_pool.release(entry, estimated, used_tokens=_response_tokens(response))
+        return response
+
+
+async def _acquire_slot(kind):
+    """Waits (within the request deadline) for a concurrency slot; False when none freed up in time."""
+    with span("gemini.acquire_slot", queued=gemini_limiter.queued):
+        acquired = await gemini_limiter.acquire(timeout=deadline.cap(GEMINI_ACQUIRE_TIMEOUT))
+    if not acquired:
+        deadline.check(f"Gemini {kind} request")
+        GEMINI_REQUESTS.inc(key="none", outcome="no_slot_available")
+        logging.warning(f"⏳ No Gemini concurrency slot within {GEMINI_ACQUIRE_TIMEOUT}s for {kind} request.")
+    return acquired
+
+
+async def _hedged_attempt(entry, prompt, image, kind, generation_config, estimated, attempt):
     """
-    Handles Gemini multimodal requests with:
-    - Automatic API key rotation
-    - Retry logic for quota/rate errors
-    - 40s timeout protection
+    Runs `_attempt` on `entry`. With GEMINI_HEDGE=1, if it is still running
+    after the observed p95 a duplicate goes out on another ready key; the
+    first success wins and the other call is cancelled.
+    """
+    args = (prompt, image, kind, generation_config, estimated, attempt)
+    primary = asyncio.ensure_future(_attempt(entry, *args))
+    tasks = {primary}
+    hedge_slot = False
+    try:
+        delay = _hedge_delay(kind)
+        if delay is None or delay >= deadline.cap(GEMINI_CALL_TIMEOUT):
+            return await primary
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result()
+
+        # A hedge never queues: it only goes out when a slot and a key are free right now
+        if not gemini_limiter.try_acquire():
+            return await primary
+        backup = key_pool.try_acquire(estimated, exclude=entry)
+        if backup is None:
+            gemini_limiter.release()
+            return await primary
+        hedge_slot = True
+        GEMINI_HEDGES.inc(kind=kind, outcome="sent")
+        hedge = asyncio.ensure_future(_attempt(backup, *args, hedge=True))
+        tasks.add(hedge)
+
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        GEMINI_HEDGES.inc(kind=kind, outcome="won")
+                    return task.result()
+                # A hard error beats a retryable one, so the caller doesn't retry a bad request
+                if error is None or isinstance(error, _AttemptFailed):
+                    error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if hedge_slot:
+            gemini_limiter.release()
+
+
+async def _generate(prompt, image, retries, kind, generation_config=None):
+    """
+    Shared retry loop:
+    - Least-loaded key selection with per-key RPM/TPM budgets
+    - Cooldown for keys that hit quota/rate errors
+    - Every wait and attempt is capped by the request deadline; DeadlineExceeded once it is spent
+    - Optional hedging past the p95 (GEMINI_HEDGE=1)
+    - At most GEMINI_MAX_CONCURRENCY calls upstream at once; the rest wait in line
     """
     if retries is None:
         retries = len(keys)
 
-    delay = 0.5
-    for _ in range(retries):
-        key = next(key_pool)
-        genai.configure(api_key=key)
+    estimated = _estimate_tokens(prompt, len(_as_image_list(image)))
+    for attempt in range(retries):
+        deadline.check(f"Gemini {kind} request")
+        if not await _acquire_slot(kind):
+            break
         try:
-            return await asyncio.wait_for(_call_gemini_content(prompt, image), timeout=40)
-        except asyncio.TimeoutError:
-            print(f"⏳ Gemini content request timeout with key {key[:6]}... Retrying...")
-        except Exception as e:
-            err = str(e).lower()
-            print(f"⚠️ Gemini content key failed ({key[:6]}...): {err}")
-            if "quota" in err or "429" in err or "rate" in err:
-                await asyncio.sleep(delay)
-                delay = min(delay * 2, 6)
+            with span("gemini.acquire_key", tokens=estimated):
+                entry = await key_pool.acquire(estimated, timeout=deadline.cap(GEMINI_ACQUIRE_TIMEOUT))
+            if entry is None:
+                deadline.check(f"Gemini {kind} request")
+                GEMINI_REQUESTS.inc(key="none", outcome="no_key_available")
+                logging.warning(f"⏳ No Gemini key available within {GEMINI_ACQUIRE_TIMEOUT}s for {kind} request.")
+                break
+            if attempt:
+                GEMINI_RETRIES.inc(key=entry.id)
+
+            try:
+                response = await _hedged_attempt(entry, prompt, image, kind, generation_config, estimated, attempt)
+            except _AttemptFailed:
                 continue
-            raise
+            return _response_text(response)
+        finally:
+            gemini_limiter.release()
 
-    return "❌ All Gemini keys exhausted or content request failed."
+    deadline.check(f"Gemini {kind} request")
+    return f"❌ All Gemini keys exhausted or {kind} request failed."
 
-async def generate_text_async(prompt, retries=None):
+# =============================
+# 📡 Streaming Generation
+# =============================
+def _chunk_text(chunk):
+    try:
+        return chunk.text or ""
+    except ValueError:
+        # The SDK raises for chunks without text parts (e.g. a final safety/usage chunk)
+        return ""
+
+
+async def _open_stream(model, prompt):
+    """Starts a streaming call and waits for the first chunk with text. Returns (response, iterator, text)."""
+    response = await model.generate_content_async(prompt, stream=True)
+    chunks = response.__aiter__()
+    async for chunk in chunks:
+        text = _chunk_text(chunk)
+        if text:
+            return response, chunks, text
+    return response, chunks, ""
+
+
+async def stream_text_async(prompt, retries=None):
     """
-    Handles Gemini text-only requests with:
-    - Automatic API key rotation
-    - Retry logic for quota/rate errors
-    - 40s timeout protection
+    Streams a text-only Gemini answer chunk by chunk through the per-key pool.
+
+    Until the first chunk arrives this behaves like `_generate`: timeouts,
+    rate limits and failures move on to another key. Once text has been
+    yielded a failure can no longer be retried and is raised to the caller.
+    Streams count against GEMINI_MAX_CONCURRENCY for their whole duration.
     """
     if retries is None:
         retries = len(keys)
 
-    delay = 0.5
-    for _ in range(retries):
-        key = next(key_pool)
-        genai.configure(api_key=key)
+    estimated = _estimate_tokens(prompt, 0)
+    for attempt in range(retries):
+        deadline.check("Gemini stream request")
+        if not await _acquire_slot("stream"):
+            break
+        # The slot is held until the stream ends, not just until the first chunk
         try:
-            return await asyncio.wait_for(_call_gemini_text(prompt), timeout=40)
-        except asyncio.TimeoutError:
-            print(f"⏳ Gemini text request timeout with key {key[:6]}... Retrying...")
-        except Exception as e:
-            err = str(e).lower()
-            print(f"⚠️ Gemini text key failed ({key[:6]}...): {err}")
-            if "quota" in err or "429" in err or "rate" in err:
-                await asyncio.sleep(delay)
-                delay = min(delay * 2, 6)
-                continue
-            raise
+            with span("gemini.acquire_key", tokens=estimated):
+                entry = await key_pool.acquire(estimated, timeout=deadline.cap(GEMINI_ACQUIRE_TIMEOUT))
+            if entry is None:
+                deadline.check("Gemini stream request")
+                GEMINI_REQUESTS.inc(key="none", outcome="no_key_available")
+                logging.warning(f"⏳ No Gemini key available within {GEMINI_ACQUIRE_TIMEOUT}s for stream request.")
+                break
+            if attempt:
+                GEMINI_RETRIES.inc(key=entry.id)
+
+            start = time.perf_counter()
+            with span("gemini.stream_first_chunk", key=entry.label, attempt=attempt) as call_span:
+                try:
+                    response, chunks, first = await asyncio.wait_for(
+                        _open_stream(entry.model, prompt), timeout=deadline.cap(GEMINI_FIRST_CHUNK_TIMEOUT)
+                    )
+                except asyncio.CancelledError:
+                    GEMINI_REQUESTS.inc(key=entry.id, outcome="cancelled")
+                    key_pool.release(entry, estimated, cancelled=True)
+                    raise
+                except asyncio.TimeoutError as e:
+                    GEMINI_REQUESTS.inc(key=entry.id, outcome="timeout")
+                    key_pool.release(entry, estimated, error=e, timed_out=True)
+                    call_span.fail("timeout")
+                    logging.warning(f"⏳ Gemini stream got no first chunk from key {entry.label} Retrying...")
+                    continue
+                except Exception as e:
+                    err = str(e).lower()
+                    rate_limited = _is_rate_limit_error(err)
+                    GEMINI_REQUESTS.inc(key=entry.id, outcome="rate_limited" if rate_limited else "error")
+                    key_pool.release(entry, estimated, error=e, rate_limited=rate_limited)
+                    logging.warning(f"⚠️ Gemini stream key failed ({entry.label}): {err}")
+                    if rate_limited:
+                        call_span.fail(err, status="rate_limited")
+                        continue
+                    raise
+
+            # Past the first chunk: the caller already has text, so no more retries
+            outcome, error = "success", None
+            try:
+                if first:
+                    yield first
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline.cap(GEMINI_CHUNK_TIMEOUT))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        deadline.check("Gemini stream")
+                        raise
+                    text = _chunk_text(chunk)
+                    if text:
+                        yield text
+            except (GeneratorExit, asyncio.CancelledError):
+                outcome = "abandoned"
+                raise
+            except Exception as e:
+                outcome, error = "error", e
+                logging.warning(f"⚠️ Gemini stream broke mid-answer ({entry.label}): {e}")
+                raise
+            finally:
+                GEMINI_LATENCY.observe(time.perf_counter() - start, kind="stream")
+                GEMINI_REQUESTS.inc(key=entry.id, outcome=outcome)
+                if error is None:
+                    _record_usage(entry, response)
+                key_pool.release(entry, estimated, error=error, used_tokens=_response_tokens(response))
+            return
+        finally:
+            gemini_limiter.release()
+
+    deadline.check("Gemini stream request")
+    yield "❌ All Gemini keys exhausted or stream request failed."
+
+# =============================
+# 🛫 Request Coalescing
+# =============================
+gemini_flight = SingleFlight("gemini")
+
+
+def _flight_key(kind, prompt, image, retries, generation_config=None):
+    """Identical (prompt, image digest, config) calls share one upstream request. None = don't coalesce."""
+    digests = [getattr(i, "digest", None) for i in _as_image_list(image)]
+    if None in digests:
+        return None
+    digest = ",".join(digests)
+    config = json.dumps(generation_config, sort_keys=True) if generation_config else ""
+    return hashlib.sha256(f"{kind}\0{retries}\0{digest}\0{config}\0{prompt}".encode()).hexdigest()
+
+
+async def _generate_once(prompt, image, retries, kind, generation_config=None):
+    key = _flight_key(kind, prompt, image, retries, generation_config)
+    if key is None:
+        return await _generate(prompt, image, retries, kind, generation_config)
+    return await gemini_flight.do(key, lambda: _generate(prompt, image, retries, kind, generation_config))
+
+# =============================
+# 🚀 Public API Functions
+# =============================
+async def generate_content_async(prompt, image=None, retries=None, generation_config=None):
+    """
+    Handles Gemini multimodal requests through the per-key client pool.
+    `image` may be a list to send several images in one request.
+    `generation_config` is passed through (e.g. a JSON response schema).
+    Concurrent identical requests are coalesced into one call.
+    """
+    return await _generate_once(prompt, image, retries, "content", generation_config)
+
+
+async def generate_text_async(prompt, retries=None):
+    """
+    Handles Gemini text-only requests through the per-key client pool.
+    Concurrent identical requests are coalesced into one call.
+    """
+    return await _generate_once(prompt, None, retries, "text")
+
+
+def get_key_usage():
+    """Per-key usage and health, for monitoring."""
+    return key_pool.snapshot()
+
+
+def get_hedge_stats():
+    """Hedging setting and the current per-kind latency threshold (None until warmed up)."""
+    return {
+        "enabled": GEMINI_HEDGE,
+        "percentile": GEMINI_HEDGE_PERCENTILE,
+        "thresholds": {
+            kind: {"samples": len(window.samples), "delay_s": _round(window.percentile(GEMINI_HEDGE_PERCENTILE))}
+            for kind, window in latency_windows.items()
+        },
+    }
+
+
+def _round(seconds):
+    return None if seconds is None else round(seconds, 3)
+
 
-    return "❌ All Gemini keys exhausted or text request failed."
+@register_collector
+def _key_pool_metrics():
+    usage = key_pool.snapshot()
+    return [
+        ("glamo_gemini_key_in_flight", "gauge", "Gemini calls currently running per key.",
+         [({"key": k["id"]}, k["in_flight"]) for k in usage]),
+        ("glamo_gemini_key_cooling_down", "gauge", "1 while a key is cooling down after a 429.",
+         [({"key": k["id"]}, int(k["cooling_down"])) for k in usage]),
+        ("glamo_gemini_key_rpm_available", "gauge", "Requests left in each key's RPM bucket.",
+         [({"key": k["id"]}, k["rpm_available"]) for k in usage]),
+        ("glamo_gemini_key_tpm_available", "gauge", "Tokens left in each key's TPM bucket.",
+         [({"key": k["id"]}, k["tpm_available"]) for k in usage]),
+        ("glamo_gemini_in_flight", "gauge", "Gemini calls holding a concurrency slot.",
+         [({}, gemini_limiter.in_flight)]),
+        ("glamo_gemini_queued", "gauge", "Gemini calls waiting for a concurrency slot.",
+         [({}, gemini_limiter.queued)]),
+    ]
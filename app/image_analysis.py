@@ -0,0 +1,101 @@
+import re
+
+# =============================
+# 🧾 Structured Image Analysis
+# =============================
+# The analysis call answers with a markdown list ("- **Mood & Vibe:** ...").
+# Parsed into fields once, every downstream prompt gets only the fields it
+# needs in a terse "field: value" form instead of the whole text.
+
+# Field -> label used in the comprehensive analysis prompt's markdown list
+ANALYSIS_FIELDS = {
+    "subject": "Subject",
+    "setting": "Setting",
+    "mood": "Mood & Vibe",
+    "action": "Action",
+    "key_objects": "Key Objects",
+    "composition": "Composition",
+    "lighting": "Lighting",
+    "color_palette": "Color Palette",
+}
+
+# Other labels the model uses for the same fields
+LABEL_ALIASES = {
+    "mood": "mood", "vibe": "mood", "mood and vibe": "mood", "objects": "key_objects",
+    "colour palette": "color_palette", "colors": "color_palette", "colours": "color_palette",
+    "palette": "color_palette", "light": "lighting",
+}
+
+MAX_FIELD_CHARS = 160
+
+_LABELS = {label.lower(): name for name, label in ANALYSIS_FIELDS.items()}
+_LABELS.update({name.replace("_", " "): name for name in ANALYSIS_FIELDS})
+_LABELS.update(LABEL_ALIASES)
+
+_ITEM = re.compile(r"^\s*(?:[-*•]\s+)?\**\s*([A-Za-z][A-Za-z &/]{1,30}?)\s*\**\s*:\s*\**\s*(.*)$")
+
+
+def _clean(value):
+    return re.sub(r"\s+", " ", value.replace("*", "")).strip()
+
+
+def _shorten(value):
+    value = value.rstrip(".")
+    if len(value) > MAX_FIELD_CHARS:
+        value = value[:MAX_FIELD_CHARS].rsplit(" ", 1)[0].rstrip(",;:") + "…"
+    return value
+
+
+class ImageAnalysis:
+    """
+    Analysis fields (see ANALYSIS_FIELDS) plus the original text. When the
+    text could not be parsed, `compact` falls back to the text itself.
+    """
+
+    def __init__(self, fields, raw=None):
+        self.fields = {name: _clean(str(value)) for name, value in fields.items()
+                       if name in ANALYSIS_FIELDS and str(value).strip()}
+        self.raw = raw
+
+    @classmethod
+    def parse(cls, text):
+        """Reads the markdown list the comprehensive analysis prompt asks for."""
+        text = text or ""
+        fields, current = {}, None
+        for line in text.splitlines():
+            match = _ITEM.match(line)
+            label = match.group(1).strip().lower() if match else ""
+            name = _LABELS.get(label) or _LABELS.get(label.replace("&", "and"))
+            if name is not None:
+                current = name
+                fields[name] = match.group(2)
+            elif current is not None and line[:1].isspace() and line.strip():
+                fields[current] += " " + line.strip()  # Indented continuation line
+        return cls(fields, raw=text)
+
+    @classmethod
+    def coerce(cls, value):
+        """Accepts an ImageAnalysis, analysis text or None."""
+        if isinstance(value, cls):
+            return value
+        return cls.parse(value)
+
+    def get(self, name, default=None):
+        return self.fields.get(name, default)
+
+    def compact(self, fields=None):
+        """One "field: value" line per requested field that is present (all fields by default)."""
+        if not self.fields:
+            return (self.raw or "").strip()
+        names = fields or ANALYSIS_FIELDS
+        return "\n".join(f"{name}: {_shorten(self.fields[name])}" for name in names if name in self.fields)
+
+    def render(self):
+        """The markdown list shown to users (same shape as the analysis prompt's answer)."""
+        if not self.fields:
+            return (self.raw or "").strip()
+        return "\n".join(f"- **{label}:** {self.fields[name]}"
+                         for name, label in ANALYSIS_FIELDS.items() if name in self.fields)
+
+    def __str__(self):
+        return self.render()
@@ -0,0 +1,181 @@
+import os
+import io
+import asyncio
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image
+from app.tracing import span
+
+# =============================
+# ⚙️ Configuration
+# =============================
+GEMINI_IMAGE_MAX_SIZE = int(os.getenv("GEMINI_IMAGE_MAX_SIZE", "512"))
+GEMINI_IMAGE_FORMAT = os.getenv("GEMINI_IMAGE_FORMAT", "JPEG").upper()  # JPEG | WEBP | PNG
+GEMINI_IMAGE_QUALITY = int(os.getenv("GEMINI_IMAGE_QUALITY", "85"))
+
+# Decompression-bomb guard: images with more pixels are rejected from the header, before decoding
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+
+# Decode/resize/encode runs off the event loop in this pool
+IMAGE_POOL_KIND = os.getenv("IMAGE_POOL_KIND", "thread").lower()  # thread | process
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+IMAGE_POOL_MAX_QUEUE = int(os.getenv("IMAGE_POOL_MAX_QUEUE", "32"))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# =============================
+# 🖼️ Prepared Image
+# =============================
+class ImageTooLarge(ValueError):
+    """The image header declares more than IMAGE_MAX_PIXELS pixels."""
+
+
+def check_dimensions(image, max_pixels=IMAGE_MAX_PIXELS):
+    """Rejects an opened (not yet decoded) image whose declared size exceeds `max_pixels`."""
+    width, height = image.size
+    if width <= 0 or height <= 0 or width * height > max_pixels:
+        raise ImageTooLarge(f"{image.format} image is {width}x{height}, limit is {max_pixels} pixels")
+
+
+class PreparedImage:
+    """
+    An upload decoded once at (roughly) the target size and encoded once for
+    Gemini. Every multimodal call in a request reuses the same `blob` bytes.
+    """
+
+    def __init__(self, image: Image.Image, fmt=GEMINI_IMAGE_FORMAT, quality=GEMINI_IMAGE_QUALITY):
+        if fmt not in _MIME_TYPES:
+            raise ValueError(f"❌ Unsupported Gemini image format: {fmt}")
+        self.image = image
+        self.format = fmt
+        self.quality = quality
+        self._blob = None
+        self._digest = None
+        self.decoded_bytes = 0  # Size of the full decode buffer, for memory accounting
+
+    @classmethod
+    def from_file(cls, fp, max_size=GEMINI_IMAGE_MAX_SIZE, fmt=GEMINI_IMAGE_FORMAT, quality=GEMINI_IMAGE_QUALITY,
+                  max_pixels=IMAGE_MAX_PIXELS):
+        """
+        Decodes the image in `fp` straight to about `max_size`. Only the header
+        is read before the pixel limit is checked. For JPEGs, draft mode lets
+        libjpeg scale by 1/2, 1/4 or 1/8 during decoding, so a 12MP photo is never
+        fully materialised. Raises `PIL.UnidentifiedImageError` for non-images
+        and `ImageTooLarge` for oversized ones.
+        """
+        try:
+            image = Image.open(fp)
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e)) from e
+        check_dimensions(image, max_pixels)
+        image.draft("RGB", (max_size, max_size))
+        decoded_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        image = image.convert("RGB")
+        image.thumbnail((max_size, max_size))
+        prepared = cls(image, fmt=fmt, quality=quality)
+        prepared.decoded_bytes = decoded_bytes
+        return prepared
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_size=GEMINI_IMAGE_MAX_SIZE, fmt=GEMINI_IMAGE_FORMAT,
+                   quality=GEMINI_IMAGE_QUALITY):
+        return cls.from_file(io.BytesIO(data), max_size=max_size, fmt=fmt, quality=quality)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def blob(self):
+        """Gemini-compatible Blob, encoded on first access and cached."""
+        if self._blob is None:
+            buffer = io.BytesIO()
+            if self.format == "PNG":
+                self.image.save(buffer, format="PNG")
+            else:
+                self.image.save(buffer, format=self.format, quality=self.quality)
+            self._blob = {"mime_type": _MIME_TYPES[self.format], "data": buffer.getvalue()}
+        return self._blob
+
+    @property
+    def digest(self):
+        """Stable content digest of the encoded bytes."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.blob["data"]).hexdigest()
+        return self._digest
+
+
+# =============================
+# 🧵 Image Work Executor
+# =============================
+class ImagePoolFull(Exception):
+    """Raised when more image jobs are queued than IMAGE_POOL_MAX_QUEUE allows."""
+
+
+_executor = None
+_pending = 0
+
+
+def get_image_executor():
+    global _executor
+    if _executor is None:
+        if IMAGE_POOL_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_POOL_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_POOL_WORKERS, thread_name_prefix="image")
+    return _executor
+
+
+def shutdown_image_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def run_image_task(func, *args, **kwargs):
+    """
+    Runs CPU-bound PIL work in the image pool. The queue is bounded: once
+    IMAGE_POOL_MAX_QUEUE jobs are waiting or running, new work is rejected
+    with `ImagePoolFull` instead of piling up behind a busy pool.
+    """
+    global _pending
+    if _pending >= IMAGE_POOL_MAX_QUEUE:
+        raise ImagePoolFull(f"{_pending} image jobs already queued")
+
+    _pending += 1
+    try:
+        with span(f"image.{getattr(func, '__name__', 'task')}", queued=_pending):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_image_executor(), functools.partial(func, *args, **kwargs))
+    finally:
+        _pending -= 1
+
+
+def _prepare_sync(source, max_size, fmt, quality):
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    image = PreparedImage.from_file(fp, max_size=max_size, fmt=fmt, quality=quality)
+    image.digest  # Encodes the blob and hashes it inside the worker
+    return image
+
+
+async def prepare_image(source, max_size=GEMINI_IMAGE_MAX_SIZE, fmt=GEMINI_IMAGE_FORMAT,
+                        quality=GEMINI_IMAGE_QUALITY):
+    """
+    Decodes, resizes and encodes an upload (bytes or a seekable file) in the
+    image pool. A process pool can't be handed open files, so those are read
+    into bytes first.
+    """
+    if IMAGE_POOL_KIND == "process" and not isinstance(source, (bytes, bytearray)):
+        source = source.read()
+    return await run_image_task(_prepare_sync, source, max_size, fmt, quality)
+
+
+def image_pool_stats():
+    return {
+        "kind": IMAGE_POOL_KIND,
+        "workers": IMAGE_POOL_WORKERS,
+        "queued": _pending,
+        "max_queue": IMAGE_POOL_MAX_QUEUE,
+    }
@@ -0,0 +1,402 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import socket
+import sqlite3
+import asyncio
+import logging
+import itertools
+import threading
+
+# =============================
+# ⚙️ Configuration
+# =============================
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+JOB_TTL = float(os.getenv("JOB_TTL", "600"))  # How long a job may wait in the queue before it expires
+JOB_MAX_TTL = float(os.getenv("JOB_MAX_TTL", "3600"))  # Upper bound for a per-job `ttl`
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "1800"))  # How long finished results stay pollable
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "")  # Empty = memory only; a SQLite path makes jobs survive restarts
+JOB_LEASE = float(os.getenv("JOB_LEASE", "60"))  # A running job is reclaimed once its owner stops renewing this long
+# Clients may lower their job's priority but not raise it above JOB_MAX_PRIORITY
+JOB_MIN_PRIORITY = int(os.getenv("JOB_MIN_PRIORITY", "-5"))
+JOB_MAX_PRIORITY = int(os.getenv("JOB_MAX_PRIORITY", "0"))
+
+QUEUED, RUNNING, DONE, FAILED, EXPIRED = "queued", "running", "done", "error", "expired"
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_QUEUE_MAX jobs are already waiting."""
+
+
+def clamp_priority(priority):
+    """A client-supplied priority, limited to JOB_MIN_PRIORITY..JOB_MAX_PRIORITY."""
+    return min(max(int(priority or 0), JOB_MIN_PRIORITY), JOB_MAX_PRIORITY)
+
+
+# =============================
+# 📋 Job
+# =============================
+class Job:
+    """
+    One queued unit of work. `params` (JSON) and `data` (bytes) are all a
+    handler may rely on after a restart; `attachment` is an in-memory
+    shortcut (e.g. the already prepared image) that is lost on restart.
+    """
+
+    def __init__(self, params, data=None, priority=0, ttl=JOB_TTL, attachment=None, job_id=None):
+        now = time.time()
+        self.id = job_id or uuid.uuid4().hex
+        self.params = params
+        self.data = data
+        self.attachment = attachment
+        self.priority = priority
+        self.status = QUEUED
+        self.created_at = now
+        self.expires_at = now + ttl
+        self.started_at = None
+        self.finished_at = None
+        self.sections = {}  # Partial results, filled in while the job runs
+        self.result = None
+        self.error = None
+        self.owner = None  # Queue (process) running it, and until when its lease holds
+        self.lease_until = None
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": round(self.created_at, 3),
+            "expires_at": round(self.expires_at, 3),
+            "sections": self.sections,
+        }
+        if self.started_at is not None:
+            data["queued_ms"] = round((self.started_at - self.created_at) * 1000, 1)
+        if self.finished_at is not None and self.started_at is not None:
+            data["run_ms"] = round((self.finished_at - self.started_at) * 1000, 1)
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+# =============================
+# 🧵 Job Queue & Workers
+# =============================
+class JobQueue:
+    """
+    Bounded priority queue (higher `priority` first, FIFO within a priority)
+    drained by `workers` asyncio tasks that call `handler(job)`.
+
+    With a `path`, every job is also written to SQLite: queued jobs and jobs
+    whose runner died are picked up again, and any worker process sharing
+    the file can answer polls for them. Jobs are claimed with a conditional
+    UPDATE, so two processes never run the same job, and a running job holds
+    a lease its worker renews; only jobs whose lease ran out (their process
+    is gone) are re-queued. SQLite work runs in a thread, off the event loop.
+    """
+
+    COLUMNS = ("id", "status", "priority", "created_at", "expires_at", "finished_at", "params", "data",
+               "sections", "result", "error", "owner", "lease_until")
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_MAX, result_ttl=JOB_RESULT_TTL,
+                 path=JOB_QUEUE_PATH, lease=JOB_LEASE):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs = {}  # id -> Job
+        self._heap = []  # (-priority, seq, id)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._tasks = []
+        self._handler = None
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.stats = {"submitted": 0, "done": 0, "failed": 0, "expired": 0, "rejected": 0, "recovered": 0,
+                      "lease_lost": 0}
+
+        if path:
+            self._open_disk(path)
+
+    # --- persistence (blocking; called through asyncio.to_thread) ---
+    def _open_disk(self, path):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    finished_at REAL,
+                    params TEXT NOT NULL,
+                    data BLOB,
+                    sections TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    lease_until REAL
+                )"""
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db.commit()
+            self._purge_disk()
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Durable job queue disabled ({path}): {e}")
+            self._db = None
+
+    def _save(self, job):
+        if self._db is None:
+            return
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                    (job.id, job.status, job.priority, job.created_at, job.expires_at, job.finished_at,
+                     json.dumps(job.params), job.data, json.dumps(job.sections, default=str),
+                     json.dumps(job.result, default=str) if job.result is not None else None, job.error,
+                     job.owner, job.lease_until),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Job {job.id} could not be persisted: {e}")
+
+    def _claim(self, job):
+        """Marks a queued job as running under our lease; False when another process got there first."""
+        job.owner, job.lease_until = self.owner, time.time() + self.lease
+        if self._db is None:
+            return True
+        try:
+            with self._db_lock:
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = ?, owner = ?, lease_until = ? WHERE id = ? AND status = ?",
+                    (RUNNING, job.owner, job.lease_until, job.id, QUEUED),
+                ).rowcount
+                self._db.commit()
+            return claimed == 1
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Job {job.id} could not be claimed: {e}")
+            return False
+
+    def _renew(self, job):
+        """Extends our lease on a running job; False when it was lost (reclaimed by another process)."""
+        job.lease_until = time.time() + self.lease
+        if self._db is None:
+            return True
+        try:
+            with self._db_lock:
+                renewed = self._db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = ?",
+                    (job.lease_until, job.id, self.owner, RUNNING),
+                ).rowcount
+                self._db.commit()
+            return renewed == 1
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Job {job.id} lease could not be renewed: {e}")
+            return True  # Try again next time rather than give the job up
+
+    @classmethod
+    def _from_row(cls, row):
+        values = dict(zip(cls.COLUMNS, row))
+        job = Job(json.loads(values["params"]), data=values["data"], priority=values["priority"],
+                  job_id=values["id"])
+        job.status = values["status"]
+        job.created_at = values["created_at"]
+        job.expires_at = values["expires_at"]
+        job.finished_at = values["finished_at"]
+        job.sections = json.loads(values["sections"]) if values["sections"] else {}
+        job.result = json.loads(values["result"]) if values["result"] else None
+        job.error = values["error"]
+        job.owner = values["owner"]
+        job.lease_until = values["lease_until"]
+        return job
+
+    def _select(self, where, params):
+        with self._db_lock:
+            rows = self._db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE {where}", params).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def _reclaim(self):
+        """
+        Re-queues running jobs whose lease ran out (their process died) and
+        returns every queued job on disk, including ones other processes submitted.
+        """
+        with self._db_lock:
+            # Their runner is gone; they run again from the start
+            self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, sections = '{}' "
+                "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, time.time()),
+            )
+            self._db.commit()
+        return self._select("status = ?", (QUEUED,))
+
+    def _purge_disk(self):
+        with self._db_lock:
+            self._db.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                             (time.time() - self.result_ttl,))
+            self._db.commit()
+
+    async def _recover(self):
+        """Picks up queued jobs and jobs whose runner died; also drops expired finished rows."""
+        if self._db is None:
+            return
+        try:
+            jobs = await asyncio.to_thread(self._reclaim)
+            await asyncio.to_thread(self._purge_disk)
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Job recovery failed: {e}")
+            return
+        for job in jobs:
+            if job.id not in self._jobs:
+                self._jobs[job.id] = job
+                heapq.heappush(self._heap, (-job.priority, next(self._seq), job.id))
+                self.stats["recovered"] += 1
+        if jobs and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _maintain(self):
+        """Every lease period: reclaim jobs of dead processes and purge old results."""
+        while True:
+            await asyncio.sleep(self.lease)
+            await self._recover()
+
+    # --- queue ---
+    @property
+    def queued(self):
+        return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    async def submit(self, job):
+        self._purge()
+        if self.queued >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise JobQueueFull(f"{self.max_queued} jobs already queued")
+        await asyncio.to_thread(self._save, job)
+        self._jobs[job.id] = job
+        heapq.heappush(self._heap, (-job.priority, next(self._seq), job.id))
+        self.stats["submitted"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id):
+        """The job from memory, or (with a durable queue) from the shared SQLite file."""
+        self._purge()
+        job = self._jobs.get(job_id)
+        if job is None and self._db is not None:
+            jobs = await asyncio.to_thread(self._select, "id = ?", (job_id,))
+            job = jobs[0] if jobs else None
+        return job
+
+    async def save_progress(self, job):
+        if self._db is not None:
+            await asyncio.to_thread(self._save, job)
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at is not None and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    async def _finish(self, job, status, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.attachment = None
+        job.data = None  # The upload is no longer needed once the job has finished
+        self.stats[{DONE: "done", FAILED: "failed", EXPIRED: "expired"}[status]] += 1
+        await asyncio.to_thread(self._save, job)
+
+    async def _next_job(self):
+        while True:
+            while self._heap:
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job.status != QUEUED:
+                    continue
+                if time.time() > job.expires_at:
+                    await self._finish(job, EXPIRED, error="Job expired before a worker picked it up.")
+                    continue
+                job.status = RUNNING  # Reserved in memory while the claim is written
+                if not await asyncio.to_thread(self._claim, job):
+                    self._jobs.pop(job_id, None)
+                    continue
+                return job
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _keep_lease(self, job):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not await asyncio.to_thread(self._renew, job):
+                self.stats["lease_lost"] += 1
+                logging.warning(f"⚠️ Job {job.id} lost its lease; another process may run it again")
+                return
+
+    async def _worker(self):
+        while True:
+            job = await self._next_job()
+            job.started_at = time.time()
+            lease = asyncio.create_task(self._keep_lease(job)) if self._db is not None else None
+            try:
+                result = await self._handler(job)
+            except asyncio.CancelledError:
+                # Shutting down: leave it queued so a durable queue runs it after the restart
+                job.status, job.owner, job.lease_until = QUEUED, None, None
+                self._save(job)  # Blocking on purpose: the loop is shutting down
+                raise
+            except Exception as e:
+                logging.error(f"❌ Job {job.id} failed: {e}")
+                await self._finish(job, FAILED, error=str(e) or type(e).__name__)
+            else:
+                await self._finish(job, DONE, result=result)
+            finally:
+                if lease is not None:
+                    lease.cancel()
+
+    async def start(self, handler):
+        """Starts the workers (call from inside the running event loop)."""
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"job-worker-{i}") for i in range(self.workers)]
+        if self._db is not None:
+            self._tasks.append(asyncio.create_task(self._maintain(), name="job-maintenance"))
+        if self._heap:
+            self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self):
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            **self.stats,
+            "by_status": counts,
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "durable": self._db is not None,
+            "owner": self.owner,
+            "priority_range": [JOB_MIN_PRIORITY, JOB_MAX_PRIORITY],
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,75 @@
+import os
+import sys
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from app.tracing import TRACE_EXPORT_LOGGER, TRACE_EXPORT_PATH, TraceIdFilter
+
+# =============================
+# 📝 Non-Blocking Logging
+# =============================
+# Request handlers only put records on an in-memory queue; a listener thread
+# does the formatting-to-stream and file I/O. When the queue is full records
+# are dropped (and counted) rather than blocking the event loop.
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_FORMAT = "%(asctime)s [%(levelname)s] [%(trace_id)s] %(message)s"
+
+_listeners = []  # (logger, queue_handler, listener)
+_stats = {"dropped": 0}
+
+
+class DroppingQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+def _start_listener(logger, handler):
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(TraceIdFilter())
+    logger.addHandler(queue_handler)
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append((logger, queue_handler, listener))
+
+
+def configure_logging():
+    """Routes the root logger (and the trace exporter) through queue handlers. Idempotent."""
+    if _listeners:
+        return
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    _start_listener(root, console)
+    # httpx logs every request at INFO, including Gemini URLs with the key in the query string
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if TRACE_EXPORT_PATH:
+        directory = os.path.dirname(TRACE_EXPORT_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        exporter = logging.getLogger(TRACE_EXPORT_LOGGER)
+        exporter.setLevel(logging.INFO)
+        file_handler = logging.FileHandler(TRACE_EXPORT_PATH, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        _start_listener(exporter, file_handler)
+
+
+def stop_logging():
+    """Flushes queued records and stops the listener threads."""
+    while _listeners:
+        logger, queue_handler, listener = _listeners.pop()
+        logger.removeHandler(queue_handler)
+        listener.stop()
+
+
+def log_stats():
+    queued = sum(handler.queue.qsize() for _, handler, _ in _listeners)
+    return {"queued": queued, "dropped": _stats["dropped"]}
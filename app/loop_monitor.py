@@ -0,0 +1,61 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+# =============================
+# ⚙️ Configuration
+# =============================
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+
+# =============================
+# ⏱️ Event-Loop Lag Monitor
+# =============================
+class LoopLagMonitor:
+    """
+    Sleeps for a fixed interval and measures how late it wakes up. Anything
+    blocking the event loop (sync I/O, CPU work) shows up directly as lag.
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, window=240):
+        self.interval = interval
+        self.samples = deque(maxlen=window)  # lag in ms over the last `window` ticks
+        self.max_lag_ms = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > LOOP_LAG_WARN_MS:
+                logging.warning(f"🐢 Event loop lagged {lag_ms:.0f}ms")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0, "last_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "samples": len(ordered),
+            "last_ms": round(self.samples[-1], 2),
+            "p50_ms": round(ordered[len(ordered) // 2], 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "max_ms": round(self.max_lag_ms, 2),
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -1,46 +1,227 @@
 import os
-import io
 import re
+import json
+import time
+import asyncio
 import logging
-from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from typing import List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
-from PIL import Image, UnidentifiedImageError
+from starlette.routing import Match
+from PIL import UnidentifiedImageError
 
 # === Import Prompts & Utils ===
 # Import the new comprehensive analysis prompt
 from app.prompts import (
     COMPREHENSIVE_ANALYSIS_PROMPT,
     EDITING_PROMPTS,
+    get_batch_analysis_prompt,
     get_caption_prompt,
     get_caption_validator_prompt,
+    get_caption_regeneration_prompt,
     get_music_prompt,
     get_chat_prompt,
     get_style_and_app_prompt
 )
-from app.gemini_utils import generate_content_async, generate_text_async
+from app.gemini_utils import (
+    generate_content_async, generate_text_async, stream_text_async, get_key_usage, get_hedge_stats, gemini_flight
+)
+from app.gemini_rest import close_rest_client
+from app.pipeline import Stage, run_pipeline
+from app.analysis_cache import analysis_cache, image_signature
+from app.fused_analysis import fused_request, parse_fused_response
+from app.image_analysis import ImageAnalysis
+from app.prompt_tokens import prompt_accounting, record_prompt
+from app.caption_rules import filter_captions, parse_validator_verdict
+from app.chat_cache import chat_cache, faq_index, normalize_question
+from app.image_utils import (
+    PreparedImage, ImagePoolFull, ImageTooLarge, prepare_image, run_image_task, image_pool_stats,
+    shutdown_image_executor
+)
+from app.uploads import (
+    UploadSizeLimit, UploadTooLarge, UPLOAD_MAX_BYTES, UPLOAD_TOO_LARGE_MESSAGE, MULTIPART_OVERHEAD_BYTES,
+    open_upload, record_ingest, record_rejection, upload_stats
+)
+from app.loop_monitor import loop_monitor
+from app.metrics import (
+    HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, DEADLINES_EXCEEDED, register_collector, render_metrics
+)
+from app.deadline import DeadlineExceeded, deadline_scope
+from app.admission import admission, client_id
+from app.jobs import Job, JobQueueFull, JOB_TTL, JOB_MAX_TTL, clamp_priority, job_queue
+from app.tracing import start_trace, detach_trace, finish_trace, current_trace, recent_traces
+from app.log_queue import configure_logging, stop_logging, log_stats
+from app.song_cache import song_cache
+from app.song_catalog import song_catalog
 from app.routers import music
-from app.routers.music import search_spotify_song, search_jiosaavn_song
+from app.routers.music import resolve_songs, iter_resolved_songs
+from app.music_providers import close_http_client, music_flight, spotify_tokens
 
 # =============================
 # 🚀 FastAPI App Initialization
 # =============================
-app = FastAPI(title="Glamo - AI Photo Editing Assistant")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    await job_queue.start(_run_analyze_job)
+    yield
+    # Release pooled upstream connections and worker pools on shutdown
+    await job_queue.stop()
+    await loop_monitor.stop()
+    await close_http_client()
+    await close_rest_client()
+    shutdown_image_executor()
+    stop_logging()
+
+
+app = FastAPI(title="Glamo - AI Photo Editing Assistant", lifespan=lifespan)
 
 # ... (Keep all your app setup, middleware, static files, etc. the same) ...
-# ✅ Logging configuration
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# ✅ Logging configuration (queue-based: the event loop never waits on log I/O)
+configure_logging()
+
+def _route_template(request: Request):
+    """Route path (e.g. '/analyze') used as a low-cardinality metrics label."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+def _incoming_trace_id(request: Request):
+    """Reuses a caller-supplied X-Request-ID when it looks like a sane ID."""
+    value = request.headers.get("x-request-id", "")
+    return value if re.fullmatch(r"[\w\-]{8,64}", value) else None
+
+
+async def _finish_after_body(body_iterator, trace, request, status):
+    """Ends the trace once the body is fully sent, so streamed responses are timed end to end."""
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        trace.set(status=status)
+        if finish_trace(trace, status="error" if status >= 500 else "ok"):
+            # Sampled: errors and slow requests are always logged, the rest at TRACE_SAMPLE_RATE
+            logging.info(f"⬅️ {request.method} {request.url} - {status} in {trace.duration_ms}ms",
+                         extra={"trace_id": trace.trace_id})
+
+
+# ✅ Request deadlines (seconds): every stage, Gemini attempt and music lookup
+# started for a request shares its budget, and work still running when it
+# is spent is cancelled. Streamed responses keep the budget while streaming.
+ANALYZE_DEADLINE_SECONDS = float(os.getenv("ANALYZE_DEADLINE_SECONDS", "60"))
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+REQUEST_DEADLINES = {
+    "/analyze": ANALYZE_DEADLINE_SECONDS,
+    "/analyze/stream": ANALYZE_DEADLINE_SECONDS,
+    "/analyze/batch": float(os.getenv("BATCH_DEADLINE_SECONDS", "180")),
+    "/suggest_style_app": ANALYZE_DEADLINE_SECONDS,
+    "/chat": CHAT_DEADLINE_SECONDS,
+    "/chat/stream": CHAT_DEADLINE_SECONDS,
+}
+TIMEOUT_MESSAGE = "This is taking longer than expected. Please try again."
+
+# ✅ Upload size limits: the request body is capped while it streams in, so
+# oversized uploads (declared or chunked) are refused with a 413 as soon as
+# they pass the limit, before the multipart body is fully read.
+def _max_body_bytes(endpoint):
+    files = {"/analyze": 1, "/analyze/stream": 1, "/suggest_style_app": 1,
+             "/analyze/batch": BATCH_MAX_FILES}.get(endpoint)
+    return None if files is None else files * UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES
+
+
+app.add_middleware(UploadSizeLimit, limit_for=lambda scope: _max_body_bytes(_route_template(Request(scope))))
+
+
+# ✅ Admission control for Gemini-backed endpoints: new requests get a fast
+# 503 while the Gemini concurrency queue is backed up, and each client is
+# held to CLIENT_RATE_PER_MINUTE Gemini calls a minute (429). Upload
+# endpoints are shed here, before the body is read; each handler then
+# charges what it will really call (see `_admit`), once the pHash cache has
+# said whether the analysis call is needed.
+SHED_EARLY = {"/analyze", "/analyze/stream", "/analyze/batch", "/suggest_style_app"}
+OVERLOADED_MESSAGE = "Glamo is busy right now. Please try again in a moment."
+RATE_LIMITED_MESSAGE = "Too many requests. Please slow down and try again shortly."
+
+
+def _follow_up_calls(selected_app):
+    """
+    Gemini calls the pipeline makes after the analysis: editing (known apps
+    only), captions, music and, with CAPTION_LLM_CHECK=1, the caption
+    validator. Caption regeneration only runs when captions are rejected
+    and is not charged.
+    """
+    editing = 1 if selected_app.lower() in EDITING_PROMPTS else 0
+    return editing + 2 + (1 if CAPTION_LLM_CHECK else 0)
+
+
+def _analyze_cost(mode, selected_app, cached=False):
+    """Gemini calls one photo costs: the fused mode answers every section in one call."""
+    if mode == "fused":
+        return 1
+    return (0 if cached else 1) + _follow_up_calls(selected_app)
 
-# ✅ Middleware for request logging
+
+def _admit(request: Request, cost, shed=False):
+    """Charges `cost` Gemini calls to the caller (and sheds first when `shed`); raises 503/429."""
+    endpoint = _route_template(request)
+    if shed:
+        retry_after = admission.shed(endpoint)
+        if retry_after is not None:
+            raise HTTPException(status_code=503, detail=OVERLOADED_MESSAGE,
+                                headers={"Retry-After": str(retry_after)})
+    retry_after = admission.charge(endpoint, client_id(request), cost)
+    if retry_after is not None:
+        raise HTTPException(status_code=429, detail=RATE_LIMITED_MESSAGE,
+                            headers={"Retry-After": str(retry_after)})
+
+
+@app.middleware("http")
+async def shed_uploads(request: Request, call_next):
+    endpoint = _route_template(request)
+    # Async jobs wait in the bounded job queue instead, so they are never shed
+    queued_job = request.query_params.get("async", "").lower() in ("1", "true", "yes", "on")
+    if request.method == "POST" and endpoint in SHED_EARLY and not queued_job:
+        retry_after = admission.shed(endpoint)
+        if retry_after is not None:
+            return JSONResponse({"detail": OVERLOADED_MESSAGE}, status_code=503,
+                                headers={"Retry-After": str(retry_after)})
+    return await call_next(request)
+
+
+# ✅ Middleware for request tracing, logging, metrics & deadlines
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logging.info(f"➡️ {request.method} {request.url}")
-    response = await call_next(request)
-    logging.info(f"⬅️ {request.method} {request.url} - {response.status_code}")
+    endpoint = _route_template(request)
+    trace, token = start_trace(f"{request.method} {endpoint}", _incoming_trace_id(request))
+    HTTP_IN_FLIGHT.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    status = 500
+    try:
+        with deadline_scope(REQUEST_DEADLINES.get(endpoint)):
+            response = await call_next(request)
+        status = response.status_code
+    except Exception as e:
+        trace.set(status=status, error=str(e)[:300])
+        finish_trace(trace, status="error")
+        raise
+    finally:
+        HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=status)
+        detach_trace(token)
+
+    response.headers["X-Trace-Id"] = trace.trace_id
+    response.body_iterator = _finish_after_body(response.body_iterator, trace, request, status)
     return response
 
+
 # ✅ Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -70,18 +251,6 @@ else:
 # ✅ Include the music router in our main app
 app.include_router(music.router)
 
-# =============================
-# 📌 Utility: Downscale image
-# =============================
-def downscale_image(image: Image.Image, max_size=512):
-    """Downscale the image proportionally."""
-    try:
-        image.thumbnail((max_size, max_size))
-        return image
-    except Exception as e:
-        logging.warning(f"⚠️ Image downscaling failed: {e}")
-        return image
-
 # =============================
 # 🏠 Home Page
 # =============================
@@ -94,135 +263,723 @@ async def home(request: Request):
         return HTMLResponse("<h2>Template not found or error rendering page.</h2>", status_code=500)
 
 # =============================
-# 🧠 Analyze Image (Fully Upgraded)
+# 🧩 Analyze Pipeline Stages
 # =============================
-@app.post("/analyze")
-async def analyze_image(photo: UploadFile = File(...), selected_app: str = Form(...), style: str = Form(...)):
+DEFAULT_EDITING_TEXT = "Step 1: Auto Enhance – Apply\nReason: Default enhancement."
+DEFAULT_CAPTIONS = ["#Glamo #GlowGoals #Inspo", "#VibeCheck #Glamo #Magic"]
+
+
+async def _lookup_analysis(image):
+    """The image's (pHash, colour) signature and its cached analysis (None on a miss)."""
+    # The analysis does not depend on app or style, so re-uploads and
+    # near-duplicates of the same photo are served from the pHash cache.
+    signature = await run_image_task(image_signature, image.image)
+    return signature, await analysis_cache.get_async(*signature)
+
+
+async def _fresh_analysis(image, signature):
+    image_analysis = await generate_content_async(record_prompt("image_analysis", COMPREHENSIVE_ANALYSIS_PROMPT),
+                                                  image=image)
+    if image_analysis and not image_analysis.startswith("❌"):
+        await analysis_cache.put_async(*signature, image_analysis)
+    return image_analysis
+
+
+async def _stage_analysis(image):
+    """Comprehensive image analysis — every other stage builds on this."""
+    signature, cached = await _lookup_analysis(image)
+    if cached is not None:
+        return cached
+    return await _fresh_analysis(image, signature)
+
+
+async def _stage_analysis_fields(image_analysis):
+    """Parses the analysis once so each prompt below pastes only the fields it needs."""
+    return ImageAnalysis.parse(image_analysis)
+
+
+async def _stage_editing(image, analysis, selected_app, style):
+    editing_prompt_func = EDITING_PROMPTS.get(selected_app.lower())
+    if not editing_prompt_func:
+        return DEFAULT_EDITING_TEXT
+    prompt = record_prompt("editing_values", editing_prompt_func(style, analysis))
+    return await generate_content_async(prompt, image=image)
+
+
+async def _stage_captions(image, analysis, style):
+    return await generate_content_async(record_prompt("raw_captions", get_caption_prompt(style, analysis)), image=image)
+
+
+CAPTION_COUNT = 5
+CAPTION_REGENERATE_ATTEMPTS = int(os.getenv("CAPTION_REGENERATE_ATTEMPTS", "1"))
+CAPTION_LLM_CHECK = os.getenv("CAPTION_LLM_CHECK", "0") == "1"  # Optional relevance/style check by Gemini
+
+
+async def _stage_caption_validator(raw_captions, analysis, style):
+    """
+    Checks and fixes captions locally; only the ones that still fail are
+    regenerated. The Gemini relevance check runs only with CAPTION_LLM_CHECK=1.
+    """
+    if not raw_captions:
+        return DEFAULT_CAPTIONS
+    captions, rejected, used_words = filter_captions(raw_captions.splitlines(), limit=CAPTION_COUNT)
+
+    for _ in range(CAPTION_REGENERATE_ATTEMPTS):
+        missing = CAPTION_COUNT - len(captions)
+        if missing <= 0 or not rejected:
+            break
+        prompt = record_prompt("caption_regenerate",
+                               get_caption_regeneration_prompt(style, analysis, missing, used_words))
+        regenerated = await generate_text_async(prompt)
+        if regenerated.startswith("❌"):
+            break
+        extra, rejected, used_words = filter_captions(regenerated.splitlines(), used_words, limit=missing)
+        captions += extra
+
+    if not captions:
+        return DEFAULT_CAPTIONS
+    if CAPTION_LLM_CHECK:
+        validator_prompt = record_prompt("caption_validator",
+                                         get_caption_validator_prompt(style, analysis, "\n".join(captions)))
+        if not parse_validator_verdict(await generate_text_async(validator_prompt)):
+            return DEFAULT_CAPTIONS
+    return captions
+
+
+async def _stage_music(image, analysis, style):
+    music_response = await generate_content_async(record_prompt("music_queries", get_music_prompt(style, analysis)),
+                                                  image=image)
+    return re.findall(r'"([^"]+)"', music_response)
+
+
+async def _stage_song_lookup(music_queries, song_sink):
+    if song_sink is None:
+        return await resolve_songs(music_queries)
+
+    # Streaming mode: hand each song over as soon as its lookup resolves
+    songs = []
+    async for _, song in iter_resolved_songs(music_queries):
+        songs.append(song)
+        await song_sink(song)
+    return songs
+
+
+ANALYZE_STAGES = [
+    Stage("image_analysis", _stage_analysis, requires=("image",), critical=True),
+    Stage("analysis", _stage_analysis_fields, requires=("image_analysis",), critical=True),
+    Stage("editing_values", _stage_editing, requires=("image", "analysis", "selected_app", "style"),
+          fallback=DEFAULT_EDITING_TEXT),
+    Stage("raw_captions", _stage_captions, requires=("image", "analysis", "style"), fallback=""),
+    Stage("captions", _stage_caption_validator, requires=("raw_captions", "analysis", "style"),
+          fallback=DEFAULT_CAPTIONS),
+    Stage("music_queries", _stage_music, requires=("image", "analysis", "style"), fallback=lambda _: []),
+    Stage("songs", _stage_song_lookup, requires=("music_queries", "song_sink"), fallback=lambda _: []),
+]
+
+
+def _looked_up_stages(lookup):
+    """ANALYZE_STAGES for an image whose cache lookup already ran (the handler priced the request with it)."""
+    signature, cached = lookup
+
+    async def analysis(image):
+        if cached is not None:
+            return cached
+        return await _fresh_analysis(image, signature)
+
+    stage = Stage("image_analysis", analysis, requires=("image",), critical=True)
+    return [stage if s.name == "image_analysis" else s for s in ANALYZE_STAGES]
+
+# =============================
+# 🧬 Fused Analysis Stages
+# =============================
+# ANALYZE_MODE=fused (or a `mode=fused` form field) answers every section
+# from one structured Gemini call; the multi-call pipeline is the fallback.
+ANALYZE_MODE = os.getenv("ANALYZE_MODE", "pipeline").lower()
+ANALYZE_MODES = ("pipeline", "fused")
+
+
+async def _stage_fused(image, selected_app, style):
+    prompt, generation_config = fused_request(style, selected_app)
+    prompt = record_prompt("fused", prompt)
+    text = await generate_content_async(prompt, image=image, generation_config=generation_config)
+    sections = parse_fused_response(text, selected_app)
+    # Keep the pHash cache warm for later multi-call or batch requests
+    phash, color = await run_image_task(image_signature, image.image)
+    await analysis_cache.put_async(phash, color, sections["image_analysis"])
+    return sections
+
+
+def _fused_section(name, default=None):
+    async def extract(fused):
+        value = fused[name]
+        return default if value is None else value
+    return extract
+
+
+FUSED_STAGES = [
+    Stage("fused", _stage_fused, requires=("image", "selected_app", "style"), critical=True),
+    Stage("image_analysis", _fused_section("image_analysis"), requires=("fused",)),
+    Stage("editing_values", _fused_section("editing_values", DEFAULT_EDITING_TEXT), requires=("fused",)),
+    Stage("analysis", _stage_analysis_fields, requires=("image_analysis",)),
+    Stage("raw_captions", _fused_section("raw_captions"), requires=("fused",)),
+    Stage("captions", _stage_caption_validator, requires=("raw_captions", "analysis", "style"),
+          fallback=DEFAULT_CAPTIONS),
+    Stage("music_queries", _fused_section("music_queries"), requires=("fused",)),
+    Stage("songs", _stage_song_lookup, requires=("music_queries", "song_sink"), fallback=lambda _: []),
+]
+
+
+def _analyze_mode(mode):
+    mode = (mode or ANALYZE_MODE).lower()
+    if mode not in ANALYZE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(ANALYZE_MODES)}")
+    return mode
+
+
+async def _run_analyze(context, mode, on_result=None, lookup=None):
+    """
+    Runs the chosen mode; a failed fused call (bad JSON, schema mismatch)
+    falls back to the multi-call pipeline. `lookup` is the analysis cache
+    lookup the caller already made, if any.
+    """
+    if mode == "fused":
+        try:
+            return await run_pipeline(FUSED_STAGES, context, on_result=on_result)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logging.warning(f"⚠️ Fused analysis failed, falling back to the multi-call pipeline: {e}")
+    stages = ANALYZE_STAGES if lookup is None else _looked_up_stages(lookup)
+    return await run_pipeline(stages, context, on_result=on_result)
+
+# Stage name -> section name sent to the client
+STREAMED_SECTIONS = {
+    "image_analysis": "mood_info",
+    "editing_values": "editing_values",
+    "captions": "captions",
+    "songs": "songs",
+}
+
+
+async def _admit_analyze(request: Request, image, selected_app, mode):
+    """Charges one photo's analysis once the cache says whether it needs the analysis call; returns the lookup."""
+    lookup = await _lookup_analysis(image) if mode == "pipeline" else None
+    _admit(request, _analyze_cost(mode, selected_app, cached=lookup is not None and lookup[1] is not None))
+    return lookup
+
+
+async def _read_prepared_image(photo: UploadFile):
+    """Checks an upload and prepares it for Gemini, raising 4xx for bad input."""
+    upload = None
     try:
-        image_bytes = await photo.read()
-        if not image_bytes:
+        # The file Starlette already spooled is decoded in place; the body
+        # size itself was capped while it streamed in (UploadSizeLimit)
+        upload = await open_upload(photo)
+        if upload is None:
             raise HTTPException(status_code=400, detail="No image uploaded.")
+        # Decoded once at the target size and encoded once for every Gemini call,
+        # in the image pool so large photos never stall the event loop
+        image = await prepare_image(upload.file)
+        record_ingest(upload, image)
+        return image
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_MESSAGE)
+    except ImageTooLarge:
+        record_rejection("dimensions")
+        raise HTTPException(status_code=413, detail="Image dimensions are too large.")
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Invalid image file.")
+    except ImagePoolFull:
+        raise HTTPException(status_code=503, detail="Server is busy processing images. Please retry shortly.",
+                            headers={"Retry-After": "2"})
+    finally:
+        if upload is not None:
+            upload.close()
 
-        try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        except UnidentifiedImageError:
-            raise HTTPException(status_code=400, detail="Invalid image file.")
+def _trace_context():
+    """Elapsed time and slowest spans of the current request, for error logs."""
+    trace = current_trace()
+    if trace is None:
+        return "no trace"
+    return f"after {trace.elapsed_ms()}ms [{trace.summary()}]"
 
-        image = downscale_image(image)
+def _result_payload(result, image_analysis=None):
+    return {
+        "editing_values": result["editing_values"],
+        "captions": result["captions"],
+        "songs": result["songs"],
+        "mood_info": result.get("image_analysis", image_analysis), # Return the full analysis for potential frontend use
+        "mode": "fused" if "fused" in result.results else "pipeline",
+        "timings": result.timings
+    }
+
+# =============================
+# 🧠 Analyze Image (Fully Upgraded)
+# =============================
+@app.post("/analyze")
+async def analyze_image(request: Request, photo: UploadFile = File(...), selected_app: str = Form(...),
+                        style: str = Form(...), mode: str = Form(None), run_async: bool = Query(False, alias="async"),
+                        priority: int = Form(0), ttl: float = Form(None)):
+    try:
+        mode = _analyze_mode(mode)
+        image = await _read_prepared_image(photo)
+        lookup = await _admit_analyze(request, image, selected_app, mode)
+        if run_async:
+            return await _submit_analyze_job(image, selected_app, style, mode, priority, ttl)
 
-        # --- 1. Comprehensive Image Analysis (NEW FIRST STEP) ---
+        # Analysis runs first; editing, captions→validator and music→lookup
+        # then run as parallel branches, each with its own fallback.
         try:
-            image_analysis = await generate_content_async(COMPREHENSIVE_ANALYSIS_PROMPT, image=image)
+            result = await _run_analyze({
+                "image": image,
+                "selected_app": selected_app,
+                "style": style,
+                "song_sink": None,
+            }, mode, lookup=lookup)
+        except DeadlineExceeded as e:
+            DEADLINES_EXCEEDED.inc(endpoint="/analyze")
+            logging.error(f"⏰ Analysis ran out of time: {e} | {_trace_context()}")
+            raise HTTPException(status_code=504, detail=TIMEOUT_MESSAGE)
         except Exception as e:
-            logging.error(f"❌ Comprehensive analysis failed: {e}")
+            logging.error(f"❌ Comprehensive analysis failed: {e} | {_trace_context()}")
             raise HTTPException(status_code=500, detail="Could not understand the image. Please try another.")
 
-        # --- 2. Editing Suggestions (Now uses analysis) ---
+        return JSONResponse(_result_payload(result))
+
+    except HTTPException as http_exc:
+        # Re-raise HTTP exceptions to let FastAPI handle them
+        raise http_exc
+    except Exception as e:
+        logging.error(f"❌ General analyze error: {e} | {_trace_context()}")
+        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+# =============================
+# 📬 Analyze Image (Job Mode)
+# =============================
+# POST /analyze?async=1 answers 202 with a job ID at once; the job queue's
+# workers run the pipeline and GET /jobs/{id} returns partial or final results.
+async def _submit_analyze_job(image, selected_app, style, mode, priority, ttl):
+    ttl = JOB_TTL if ttl is None else min(max(ttl, 1.0), JOB_MAX_TTL)
+    # Clients can only lower their own job's priority, never jump the queue
+    job = Job({"selected_app": selected_app, "style": style, "mode": mode},
+              data=image.blob["data"], attachment=image, priority=clamp_priority(priority), ttl=ttl)
+    try:
+        await job_queue.submit(job)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many queued analyses. Please retry shortly.",
+                            headers={"Retry-After": "5"})
+    poll_url = f"/jobs/{job.id}"
+    return JSONResponse({"job_id": job.id, "status": job.status, "poll_url": poll_url}, status_code=202,
+                        headers={"Location": poll_url})
+
+
+async def _run_analyze_job(job):
+    """Job-queue handler: the /analyze pipeline, with each section saved on the job as it is ready."""
+    # After a restart only the encoded upload survives; it is already at the target size
+    image = job.attachment or await prepare_image(job.data)
+
+    async def on_result(name, value):
+        if name in STREAMED_SECTIONS:
+            job.sections[STREAMED_SECTIONS[name]] = value
+            await job_queue.save_progress(job)
+
+    trace, token = start_trace("JOB /analyze")
+    trace.set(job_id=job.id, priority=job.priority)
+    status = "ok"
+    try:
+        with deadline_scope(ANALYZE_DEADLINE_SECONDS):
+            result = await _run_analyze({**job.params, "image": image, "song_sink": None},
+                                        job.params["mode"], on_result=on_result)
+        return _result_payload(result)
+    except DeadlineExceeded as e:
+        status = "error"
+        DEADLINES_EXCEEDED.inc(endpoint="/jobs")
+        logging.error(f"⏰ Analysis job {job.id} ran out of time: {e} | {_trace_context()}")
+        raise RuntimeError(TIMEOUT_MESSAGE) from e
+    except Exception as e:
+        status = "error"
+        logging.error(f"❌ Analysis job {job.id} failed: {e} | {_trace_context()}")
+        raise RuntimeError("Could not understand the image. Please try another.") from e
+    finally:
+        finish_trace(trace, status=status)
+        detach_trace(token)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job.to_dict()
+
+# =============================
+# 📡 Analyze Image (Streaming)
+# =============================
+@app.post("/analyze/stream")
+async def analyze_image_stream(request: Request, photo: UploadFile = File(...), selected_app: str = Form(...),
+                               style: str = Form(...), mode: str = Form(None)):
+    """
+    Same pipeline as /analyze, streamed as NDJSON. One line per event:
+    `mood_info`, `editing_values`, `captions` and `songs` as each section is
+    ready, a `song` event per resolved track, then `done` (or `error`).
+    """
+    mode = _analyze_mode(mode)
+    image = await _read_prepared_image(photo)
+    lookup = await _admit_analyze(request, image, selected_app, mode)
+    queue = asyncio.Queue()
+
+    async def on_result(name, value):
+        if name in STREAMED_SECTIONS:
+            await queue.put({"event": STREAMED_SECTIONS[name], "data": value})
+
+    async def on_song(song):
+        await queue.put({"event": "song", "data": song})
+
+    async def run():
         try:
-            editing_prompt_func = EDITING_PROMPTS.get(selected_app.lower())
-            if editing_prompt_func:
-                # Pass the detailed analysis to the prompt function
-                editing_prompt = editing_prompt_func(style, image_analysis)
-                editing_text = await generate_content_async(editing_prompt, image=image)
-            else:
-                editing_text = "Step 1: Auto Enhance – Apply\nReason: Default enhancement."
+            result = await _run_analyze({
+                "image": image,
+                "selected_app": selected_app,
+                "style": style,
+                "song_sink": on_song,
+            }, mode, on_result=on_result, lookup=lookup)
+            await queue.put({"event": "done", "data": {
+                "mode": "fused" if "fused" in result.results else "pipeline", "timings": result.timings,
+            }})
+        except DeadlineExceeded as e:
+            DEADLINES_EXCEEDED.inc(endpoint="/analyze/stream")
+            logging.error(f"⏰ Streaming analysis ran out of time: {e} | {_trace_context()}")
+            await queue.put({"event": "error", "data": TIMEOUT_MESSAGE})
         except Exception as e:
-            logging.error(f"❌ Editing generation failed: {e}")
-            editing_text = "Step 1: Auto Enhance – Apply\nReason: Default enhancement."
+            logging.error(f"❌ Streaming analysis failed: {e} | {_trace_context()}")
+            await queue.put({"event": "error", "data": "Could not understand the image. Please try another."})
+        finally:
+            await queue.put(None)
 
-        # --- 3. Captions (Now uses analysis) ---
+    async def event_stream():
+        task = asyncio.create_task(run())
         try:
-            # Pass the analysis instead of separate mood, scene, colors
-            caption_prompt = get_caption_prompt(style, image_analysis)
-            raw_captions = await generate_content_async(caption_prompt, image=image)
-            
-            validator_prompt = get_caption_validator_prompt(style, image_analysis, raw_captions)
-            validator_result = await generate_text_async(validator_prompt)
-
-            if "valid" in validator_result.lower():
-                captions = [line.strip() for line in raw_captions.splitlines() if line.strip()][:5]
-            else:
-                captions = ["#Glamo #GlowGoals #Inspo", "#VibeCheck #Glamo #Magic"]
-        except Exception as e:
-            logging.error(f"❌ Caption generation failed: {e}")
-            captions = ["#Glamo #GlowGoals #Inspo", "#VibeCheck #Glamo #Magic"]
+            while (event := await queue.get()) is not None:
+                yield json.dumps(event) + "\n"
+        finally:
+            # Client went away (or we finished): stop any work still running
+            task.cancel()
 
-        # --- 4. Music Suggestions (Now uses analysis) ---
-        songs = []
-        added_song_titles = set()
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# =============================
+# 🗂️ Analyze Image (Batch)
+# =============================
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10"))
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "3"))
+BATCH_PACK_SIZE = int(os.getenv("BATCH_PACK_SIZE", "4"))
+
+
+def _split_batch_analysis(text, count):
+    """Splits a packed '### IMAGE n' response into `count` analyses, or None if it doesn't line up."""
+    parts = re.split(r"^\s*#{2,}\s*\**\s*IMAGE\s+(\d+)\s*\**\s*:?\s*$", text, flags=re.MULTILINE | re.IGNORECASE)
+    sections = {}
+    for i in range(1, len(parts) - 1, 2):
+        sections[int(parts[i])] = parts[i + 1].strip()
+    if sorted(sections) != list(range(1, count + 1)) or not all(sections.values()):
+        return None
+    return [sections[i] for i in range(1, count + 1)]
+
+
+async def _batch_lookup(images):
+    """
+    Splits a batch by the pHash cache: returns each image's signature, its
+    analysis (None when not cached) and the chunks of uncached image indices,
+    BATCH_PACK_SIZE per Gemini call.
+    """
+    analyses = [None] * len(images)
+    signatures = await asyncio.gather(*[run_image_task(image_signature, image.image) for image in images])
+    pending = []
+    for index, signature in enumerate(signatures):
+        cached = await analysis_cache.get_async(*signature)
+        if cached is not None:
+            analyses[index] = cached
+        else:
+            pending.append(index)
+    chunks = [pending[i:i + BATCH_PACK_SIZE] for i in range(0, len(pending), BATCH_PACK_SIZE)]
+    return signatures, analyses, chunks
+
+
+async def _batch_analyses(images, signatures, analyses, chunks):
+    """
+    Fills in the uncached analyses of a batch with one packed Gemini call per
+    chunk. Entries left as None are analysed individually by the normal
+    pipeline stage.
+    """
+    async def analyse_chunk(chunk):
         try:
-            # Pass the analysis for the best music context
-            music_prompt = get_music_prompt(style, image_analysis)
-            music_response = await generate_content_async(music_prompt, image=image)
-            
-            queries = re.findall(r'"([^"]+)"', music_response)
-            for query in queries:
-                if len(songs) >= 10:
-                    break
-                song = search_spotify_song(query) or search_jiosaavn_song(query)
-                if song and song.get("title") and song["title"] not in added_song_titles:
-                    songs.append(song)
-                    added_song_titles.add(song["title"])
+            text = await generate_content_async(
+                record_prompt("batch_analysis", get_batch_analysis_prompt(len(chunk))), image=[images[i] for i in chunk]
+            )
         except Exception as e:
-            logging.error(f"❌ Music fetch failed: {e}")
+            logging.warning(f"⚠️ Packed analysis failed for {len(chunk)} images: {e}")
+            return
+        sections = _split_batch_analysis(text, len(chunk))
+        if sections is None:
+            logging.warning(f"⚠️ Packed analysis response did not split into {len(chunk)} parts")
+            return
+        for index, section in zip(chunk, sections):
+            analyses[index] = section
+            await analysis_cache.put_async(*signatures[index], section)
 
-        # --- 5. Final Response ---
-        return JSONResponse({
-            "editing_values": editing_text,
-            "captions": captions,
-            "songs": songs,
-            "mood_info": image_analysis # Return the full analysis for potential frontend use
-        })
+    await asyncio.gather(*[analyse_chunk(chunk) for chunk in chunks if len(chunk) > 1])
+    return analyses
 
-    except HTTPException as http_exc:
-        # Re-raise HTTP exceptions to let FastAPI handle them
-        raise http_exc
-    except Exception as e:
-        logging.error(f"❌ General analyze error: {e}")
-        raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
+
+async def _analyze_one(image, image_analysis, selected_app, style):
+    """Runs the analyze pipeline for one image, skipping the analysis stage when it is already known."""
+    context = {"image": image, "selected_app": selected_app, "style": style, "song_sink": None}
+    stages = ANALYZE_STAGES
+    if image_analysis is not None:
+        context["image_analysis"] = image_analysis
+        stages = [stage for stage in ANALYZE_STAGES if stage.name != "image_analysis"]
+    result = await run_pipeline(stages, context)
+    return _result_payload(result, image_analysis)
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: Request, photos: List[UploadFile] = File(...), selected_app: str = Form(...),
+                        style: str = Form(...)):
+    """
+    Analyzes a carousel of photos with the same app and style. Photos run
+    through a bounded worker pool and errors are reported per image.
+    """
+    if len(photos) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Please upload at most {BATCH_MAX_FILES} photos at once.")
+
+    prepared = []
+    for photo in photos:
+        try:
+            prepared.append(await _read_prepared_image(photo))
+        except HTTPException as e:
+            prepared.append(e)
+
+    valid = [item for item in prepared if isinstance(item, PreparedImage)]
+    signatures, analyses, chunks = await _batch_lookup(valid)
+    # Every valid photo makes its follow-up calls; uncached analyses share one call per chunk
+    _admit(request, len(valid) * _follow_up_calls(selected_app) + len(chunks))
+    analyses = dict(zip(map(id, valid), await _batch_analyses(valid, signatures, analyses, chunks)))
+    semaphore = asyncio.Semaphore(BATCH_MAX_PARALLEL)
+
+    async def run_one(photo, item):
+        if isinstance(item, HTTPException):
+            return {"filename": photo.filename, "ok": False, "error": item.detail}
+        async with semaphore:
+            try:
+                payload = await _analyze_one(item, analyses.get(id(item)), selected_app, style)
+            except DeadlineExceeded:
+                DEADLINES_EXCEEDED.inc(endpoint="/analyze/batch")
+                return {"filename": photo.filename, "ok": False, "error": TIMEOUT_MESSAGE}
+            except Exception as e:
+                logging.error(f"❌ Batch analysis failed for {photo.filename}: {e} | {_trace_context()}")
+                return {"filename": photo.filename, "ok": False,
+                        "error": "Could not understand the image. Please try another."}
+        return {"filename": photo.filename, "ok": True, **payload}
+
+    results = await asyncio.gather(*[run_one(photo, item) for photo, item in zip(photos, prepared)])
+    return {"results": results}
 
 # =============================
 # 💬 Chat Assistant
 # =============================
+CHAT_ERROR_MESSAGE = "Oops! Something went wrong on our end."
+
+
+async def _read_question(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Please enter a question.")
+    question = (data.get("question", "") if isinstance(data, dict) else "").strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Please enter a question.")
+    return question
+
+
+def _chat_shortcut(question):
+    """Recurring questions never reach Gemini: FAQ match first, then earlier answers."""
+    faq_match = faq_index.match(question)
+    if faq_match is not None:
+        answer, score = faq_match
+        return {"answer": answer, "source": "faq", "score": score}
+    cached = chat_cache.get(normalize_question(question))
+    if cached is not None:
+        return {"answer": cached, "source": "cache"}
+    return None
+
+
 @app.post("/chat")
 async def chat_endpoint(request: Request):
     try:
-        data = await request.json()
-        question = data.get("question", "")
-        if not question:
-            raise HTTPException(status_code=400, detail="Please enter a question.")
-        
-        prompt = get_chat_prompt(question)
-        response = await generate_text_async(prompt)
-        return {"answer": response.strip()}
+        question = await _read_question(request)
+        shortcut = _chat_shortcut(question)
+        if shortcut is not None:
+            return shortcut
+        # Only questions that really go to Gemini are shed or charged
+        _admit(request, 1, shed=True)
+
+        prompt = record_prompt("chat", get_chat_prompt(question))
+        response = (await generate_text_async(prompt)).strip()
+        if not response.startswith("❌"):
+            chat_cache.put(normalize_question(question), response)
+        return {"answer": response, "source": "gemini"}
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        DEADLINES_EXCEEDED.inc(endpoint="/chat")
+        logging.error(f"⏰ Chat ran out of time: {e}")
+        raise HTTPException(status_code=504, detail=TIMEOUT_MESSAGE)
     except Exception as e:
         logging.error(f"❌ Chat error: {e}")
-        raise HTTPException(status_code=500, detail="Oops! Something went wrong on our end.")
+        raise HTTPException(status_code=500, detail=CHAT_ERROR_MESSAGE)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """
+    Same answers as /chat, sent as Server-Sent Events while Gemini generates:
+    `token` events carry text chunks, then `done` (with the answer source) or `error`.
+    FAQ and cached answers arrive as a single token.
+    """
+    question = await _read_question(request)
+    shortcut = _chat_shortcut(question)
+    if shortcut is None:
+        # Only questions that really go to Gemini are shed or charged
+        _admit(request, 1, shed=True)
+
+    async def events():
+        if shortcut is not None:
+            yield _sse("token", {"text": shortcut["answer"]})
+            yield _sse("done", {"source": shortcut["source"]})
+            return
+
+        parts = []
+        try:
+            async for text in stream_text_async(record_prompt("chat", get_chat_prompt(question))):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except DeadlineExceeded as e:
+            DEADLINES_EXCEEDED.inc(endpoint="/chat/stream")
+            logging.error(f"⏰ Chat stream ran out of time: {e} | {_trace_context()}")
+            yield _sse("error", TIMEOUT_MESSAGE)
+            return
+        except Exception as e:
+            logging.error(f"❌ Chat stream error: {e} | {_trace_context()}")
+            yield _sse("error", CHAT_ERROR_MESSAGE)
+            return
+
+        answer = "".join(parts).strip()
+        if answer and not answer.startswith("❌"):
+            chat_cache.put(normalize_question(question), answer)
+        yield _sse("done", {"source": "gemini"})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # =============================
 # 🔮 Suggest Best Style & App
 # =============================
 @app.post("/suggest_style_app")
-async def suggest_style_app(photo: UploadFile = File(...)):
+async def suggest_style_app(request: Request, photo: UploadFile = File(...)):
     try:
-        image_bytes = await photo.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="No image uploaded.")
-
-        try:
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        except UnidentifiedImageError:
-            raise HTTPException(status_code=400, detail="Invalid image file.")
-
-        image = downscale_image(image)
+        _admit(request, 1)
+        image = await _read_prepared_image(photo)
         prompt = get_style_and_app_prompt()
         response = await generate_content_async(prompt, image=image)
         return {"result": response.strip()}
 
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        DEADLINES_EXCEEDED.inc(endpoint="/suggest_style_app")
+        logging.error(f"⏰ Suggest Style/App ran out of time: {e}")
+        raise HTTPException(status_code=504, detail=TIMEOUT_MESSAGE)
     except Exception as e:
         logging.error(f"❌ Suggest Style/App failed: {e}")
         raise HTTPException(status_code=500, detail="Could not suggest a style. Please try another image.")
 
+# =============================
+# 📊 Operational Stats
+# =============================
+@app.get("/stats")
+async def stats():
+    return {
+        "analysis_cache": analysis_cache.snapshot(),
+        "song_cache": song_cache.snapshot(),
+        "song_catalog": song_catalog.snapshot(),
+        "spotify_token": spotify_tokens.snapshot(),
+        "chat_cache": chat_cache.snapshot(),
+        "chat_faq": faq_index.snapshot(),
+        "prompt_tokens": prompt_accounting.snapshot(),
+        "gemini_keys": get_key_usage(),
+        "gemini_hedging": get_hedge_stats(),
+        "deadlines": REQUEST_DEADLINES,
+        "admission": admission.snapshot(),
+        "image_pool": image_pool_stats(),
+        "uploads": upload_stats(),
+        "jobs": job_queue.snapshot(),
+        "event_loop": loop_monitor.snapshot(),
+        "singleflight": {
+            "gemini": gemini_flight.snapshot(),
+            "music": music_flight.snapshot(),
+        },
+        "logging": log_stats(),
+    }
+
+
+@app.get("/traces")
+async def traces(limit: int = 50, min_ms: float = 0.0):
+    """Recently kept traces, slowest first, as JSON lines (same shape as the TRACE_EXPORT_PATH file)."""
+    lines = [json.dumps(trace, ensure_ascii=False, default=str) + "\n" for trace in recent_traces(limit, min_ms)]
+    return PlainTextResponse("".join(lines), media_type="application/x-ndjson")
+
+
+@register_collector
+def _app_state_metrics():
+    analysis = analysis_cache.snapshot()
+    songs = song_cache.snapshot()
+    catalog = song_catalog.snapshot()
+    chat = chat_cache.snapshot()
+    faq = faq_index.snapshot()
+    lag = loop_monitor.snapshot()
+    pool = image_pool_stats()
+    flights = {"gemini": gemini_flight.snapshot(), "music": music_flight.snapshot()}
+    return [
+        ("glamo_cache_hits_total", "counter", "Cache hits (near-duplicate and negative hits included).",
+         [({"cache": "analysis"}, analysis["hits"]),
+          ({"cache": "songs"}, songs["hits"] + songs["negative_hits"]), ({"cache": "song_catalog"}, catalog["hits"]),
+          ({"cache": "chat"}, chat["hits"]), ({"cache": "chat_faq"}, faq["hits"])]),
+        ("glamo_cache_misses_total", "counter", "Cache misses.",
+         [({"cache": "analysis"}, analysis["misses"]), ({"cache": "songs"}, songs["misses"]),
+          ({"cache": "song_catalog"}, catalog["misses"]),
+          ({"cache": "chat"}, chat["misses"]), ({"cache": "chat_faq"}, faq["misses"])]),
+        ("glamo_cache_hit_ratio", "gauge", "Hit ratio since start.",
+         [({"cache": "analysis"}, analysis["hit_rate"]), ({"cache": "songs"}, songs["hit_rate"]),
+          ({"cache": "song_catalog"}, catalog["hit_rate"]),
+          ({"cache": "chat"}, chat["hit_rate"]), ({"cache": "chat_faq"}, faq["hit_rate"])]),
+        ("glamo_event_loop_lag_seconds", "gauge", "Event-loop lag over the recent window.",
+         [({"quantile": "0.5"}, lag["p50_ms"] / 1000), ({"quantile": "0.99"}, lag["p99_ms"] / 1000),
+          ({"quantile": "max"}, lag["max_ms"] / 1000)]),
+        ("glamo_image_pool_queued", "gauge", "Image jobs queued or running.", [({}, pool["queued"])]),
+        ("glamo_singleflight_coalesced_total", "counter", "Calls that joined an identical in-flight call.",
+         [({"flight": name}, snap["coalesced"]) for name, snap in flights.items()]),
+    ]
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 # from flask import Flask, request, jsonify, render_template
 # from flask_cors import CORS
@@ -0,0 +1,229 @@
+import time
+import bisect
+import asyncio
+import threading
+import functools
+
+# =============================
+# 📈 Minimal Prometheus Metrics
+# =============================
+# Counters, gauges and histograms rendered in the Prometheus text format
+# (version 0.0.4). Kept dependency-free; values live in-process, so with
+# several workers each one is scraped separately.
+
+_registry = []
+_collectors = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, extra, value in self._samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self, **labels):
+        """Sum over every series matching the given subset of labels."""
+        wanted = {self.labelnames.index(n): str(v) for n, v in labels.items()}
+        with self._lock:
+            return sum(v for key, v in self._values.items() if all(key[i] == w for i, w in wanted.items()))
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    samples.append((f"{self.name}_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+                samples.append((f"{self.name}_bucket", key, (("le", "+Inf"),), count))
+                samples.append((f"{self.name}_sum", key, (), total))
+                samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def register_collector(func):
+    """
+    Registers `func() -> [(name, type, help, [(labels_dict, value), ...]), ...]`,
+    evaluated on every scrape. Used to export state that already lives elsewhere
+    (cache stats, key-pool health, loop lag) without duplicating bookkeeping.
+    """
+    _collectors.append(func)
+    return func
+
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception:
+            continue
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = _format_labels(labels.keys(), labels.values())
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# =============================
+# 📊 Application Metrics
+# =============================
+HTTP_REQUESTS = Counter("glamo_http_requests_total", "HTTP requests by endpoint and status.",
+                        ("method", "endpoint", "status"))
+HTTP_LATENCY = Histogram("glamo_http_request_duration_seconds", "Time to response headers per endpoint.",
+                         ("endpoint",))
+HTTP_IN_FLIGHT = Gauge("glamo_http_in_flight_requests", "Requests currently being handled.", ("endpoint",))
+
+STAGE_LATENCY = Histogram("glamo_stage_duration_seconds", "Pipeline stage latency.", ("stage",))
+STAGE_FAILURES = Counter("glamo_stage_failures_total", "Pipeline stages that fell back or aborted.", ("stage",))
+
+GEMINI_REQUESTS = Counter("glamo_gemini_requests_total", "Gemini attempts by key and outcome.",
+                          ("key", "outcome"))
+GEMINI_RETRIES = Counter("glamo_gemini_retries_total", "Gemini attempts after the first, by key.", ("key",))
+GEMINI_LATENCY = Histogram("glamo_gemini_request_duration_seconds", "Gemini call latency.", ("kind",))
+GEMINI_TOKENS = Counter("glamo_gemini_tokens_total", "Tokens reported in Gemini usage metadata.",
+                        ("key", "type"))
+GEMINI_HEDGES = Counter("glamo_gemini_hedges_total", "Duplicate Gemini calls sent after the p95 (sent) and won.",
+                        ("kind", "outcome"))
+GEMINI_QUEUE_WAIT = Histogram("glamo_gemini_queue_wait_seconds", "Time a Gemini call waited for a concurrency slot.",
+                              (), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10))
+ADMISSION_REJECTED = Counter("glamo_admission_rejected_total",
+                             "Requests turned away before any work, by endpoint and reason.", ("endpoint", "reason"))
+PROMPT_TOKENS = Histogram("glamo_prompt_tokens", "Estimated text tokens per prompt, by stage.", ("stage",),
+                          buckets=(50, 100, 200, 400, 800, 1600, 3200, 6400))
+UPLOAD_REJECTED = Counter("glamo_upload_rejected_total", "Uploads rejected before decoding, by reason.", ("reason",))
+UPLOAD_PEAK_MEMORY = Histogram("glamo_upload_peak_memory_bytes",
+                               "Estimated peak memory to ingest one upload (buffer + decode + blob).", (),
+                               buckets=(2**18, 2**19, 2**20, 2**21, 2**22, 2**23, 2**24, 2**25, 2**26, 2**27))
+DEADLINES_EXCEEDED = Counter("glamo_deadline_exceeded_total", "Requests whose deadline ran out, by endpoint.",
+                             ("endpoint",))
+
+MUSIC_UPSTREAM_LATENCY = Histogram("glamo_music_upstream_duration_seconds", "Music provider call latency.",
+                                   ("provider", "outcome"),
+                                   buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8))
+MUSIC_LOOKUPS = Counter("glamo_music_lookups_total", "Remote song lookups by winning provider ('none' = miss).",
+                        ("provider", "strategy"))
+
+
+def timed_upstream(histogram, error_types=(Exception,), **labels):
+    """Decorator timing an async upstream call into `histogram` with an ok/error outcome label."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except error_types:
+                outcome = "error"
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, outcome=outcome, **labels)
+        return wrapper
+    return decorator
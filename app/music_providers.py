@@ -0,0 +1,442 @@
+import os
+import time
+import base64
+import random
+import asyncio
+import logging
+import httpx
+from app.song_cache import cached_lookup, normalize_query, SongLookupError
+from app.singleflight import SingleFlight, coalesce
+from app.metrics import MUSIC_UPSTREAM_LATENCY, MUSIC_LOOKUPS, timed_upstream
+from app.tracing import span, traced
+from app import deadline
+
+# =============================
+# ⚙️ Configuration
+# =============================
+SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+
+# Overridable so load tests can point at the local stand-in server
+SPOTIFY_TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+SPOTIFY_SEARCH_URL = os.getenv("SPOTIFY_SEARCH_URL", "https://api.spotify.com/v1/search")
+JIOSAAVN_SEARCH_URL = os.getenv("JIOSAAVN_SEARCH_URL", "https://saavn.dev/api/search/songs")
+
+MUSIC_HTTP_TIMEOUT = float(os.getenv("MUSIC_HTTP_TIMEOUT", "4"))
+MUSIC_HTTP_MAX_CONNECTIONS = int(os.getenv("MUSIC_HTTP_MAX_CONNECTIONS", "20"))
+
+# Spotify tokens are refreshed this long before they expire; failed refreshes back off
+SPOTIFY_TOKEN_TIMEOUT = float(os.getenv("SPOTIFY_TOKEN_TIMEOUT", "5"))
+SPOTIFY_TOKEN_REFRESH_MARGIN = float(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "300"))
+SPOTIFY_TOKEN_BACKOFF_BASE = float(os.getenv("SPOTIFY_TOKEN_BACKOFF_BASE", "1"))
+SPOTIFY_TOKEN_BACKOFF_MAX = float(os.getenv("SPOTIFY_TOKEN_BACKOFF_MAX", "120"))
+SPOTIFY_TOKEN_AUTH_BACKOFF = float(os.getenv("SPOTIFY_TOKEN_AUTH_BACKOFF", "60"))
+
+# Providers in priority order, and how a query is spread over them:
+# - priority: ask the first; the next joins after MUSIC_HEDGE_DELAY or as soon as the first misses
+# - race:     ask all at once and take the first good answer
+# - language: like priority, but providers for the query's detected language go first
+MUSIC_PROVIDERS = [p.strip().lower() for p in os.getenv("MUSIC_PROVIDERS", "spotify,jiosaavn").split(",") if p.strip()]
+MUSIC_PROVIDER_STRATEGY = os.getenv("MUSIC_PROVIDER_STRATEGY", "priority").lower()
+MUSIC_PROVIDER_STRATEGIES = ("priority", "race", "language")
+MUSIC_HEDGE_DELAY = float(os.getenv("MUSIC_HEDGE_DELAY", "0.4"))
+
+# =============================
+# 🎼 Song Result Model
+# =============================
+# Every provider (and the local catalog) hands back the same JSON-ready dict.
+SONG_FIELDS = ("title", "artist", "album", "image", "preview", "link", "language", "source")
+DEFAULT_IMAGE = "/static/music-default.jpg"
+
+
+def normalize_song(song, source=None, language=None):
+    """Fills a song dict out to SONG_FIELDS; older cached shapes get the provider's source/language."""
+    if not song or not song.get("title"):
+        return None
+    normalized = {name: song.get(name) for name in SONG_FIELDS}
+    normalized["artist"] = normalized["artist"] or "Unknown"
+    normalized["image"] = normalized["image"] or DEFAULT_IMAGE
+    normalized["source"] = normalized["source"] or source
+    normalized["language"] = normalized["language"] or language
+    return normalized
+
+
+HINDI_KEYWORDS = {"tere", "mera", "meri", "dil", "saath", "tum", "pyar", "yaar", "ke", "ki", "hai", "mein", "hoon",
+                  "chal", "zindagi", "ishq", "tujhe", "tera", "jaana", "kya"}
+
+
+def detect_language(query):
+    """'hindi' when the query contains common Hindi words, else 'english'."""
+    words = set(normalize_query(query).split())
+    return "hindi" if words & HINDI_KEYWORDS else "english"
+
+
+# =============================
+# 🌐 Shared Async HTTP Pool
+# =============================
+# Identical in-flight searches (same provider + normalized query) share one request
+music_flight = SingleFlight("music")
+
+_http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the process-wide keep-alive client used for every music lookup."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(MUSIC_HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=MUSIC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=MUSIC_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=60,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# =============================
+# 🧩 Provider Interface
+# =============================
+class MusicProvider:
+    """
+    One music search backend. Subclasses implement `fetch(query)`, returning a
+    song dict, None when nothing matched, or raising `SongLookupError` when
+    the upstream failed. `search(query)` adds the per-provider timeout
+    (MUSIC_TIMEOUT_<NAME>, capped by the request deadline), metrics, tracing,
+    coalescing and the song cache, and returns a normalized song.
+    """
+
+    name = None
+    label = None
+    language = None
+
+    def __init__(self, timeout=None):
+        self.timeout = float(os.getenv(f"MUSIC_TIMEOUT_{self.name.upper()}", timeout or MUSIC_HTTP_TIMEOUT))
+        lookup = timed_upstream(MUSIC_UPSTREAM_LATENCY, provider=self.name)(self._fetch_with_timeout)
+        lookup = traced(f"music.{self.name}")(lookup)
+        lookup = coalesce(music_flight, lambda query: f"{self.name}:{normalize_query(query)}")(lookup)
+        self._lookup = cached_lookup(self.name)(lookup)
+
+    def call_timeout(self):
+        """This provider's timeout, shortened to what is left of the request deadline."""
+        return deadline.cap(self.timeout)
+
+    async def _fetch_with_timeout(self, query):
+        try:
+            return await asyncio.wait_for(self.fetch(query), timeout=self.call_timeout())
+        except asyncio.TimeoutError as e:
+            raise SongLookupError(f"{self.name} timed out after {self.timeout}s: {query}") from e
+
+    async def fetch(self, query):
+        raise NotImplementedError
+
+    async def search(self, query):
+        return normalize_song(await self._lookup(query), source=self.label, language=self.language)
+
+
+# =============================
+# 🎵 Spotify
+# =============================
+class SpotifyTokenManager:
+    """
+    Client-credentials token shared by every Spotify lookup in the process.
+
+    - Fast path: a valid token is returned without awaiting anything.
+    - Within `refresh_margin` seconds of expiry a refresh starts in the
+      background while callers keep using the current token.
+    - Only one refresh is ever in flight; callers without a valid token wait
+      on that one (up to their own timeout) instead of posting their own.
+    - Failed refreshes back off exponentially (auth errors for at least
+      `auth_backoff` seconds); while backing off, callers get None at once.
+    """
+
+    def __init__(self, client_id, client_secret, token_url=SPOTIFY_TOKEN_URL, timeout=SPOTIFY_TOKEN_TIMEOUT,
+                 refresh_margin=SPOTIFY_TOKEN_REFRESH_MARGIN, backoff_base=SPOTIFY_TOKEN_BACKOFF_BASE,
+                 backoff_max=SPOTIFY_TOKEN_BACKOFF_MAX, auth_backoff=SPOTIFY_TOKEN_AUTH_BACKOFF):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.auth_backoff = auth_backoff
+        self._token = None
+        self._expiry = 0.0
+        self._lifetime = 0.0
+        self._refresh = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self.stats = {"refreshes": 0, "proactive_refreshes": 0, "failures": 0, "waits": 0, "backoff_skips": 0}
+
+    def current(self):
+        """The token if it is still valid, else None. Never blocks."""
+        if self._token and time.time() < self._expiry:
+            return self._token
+        return None
+
+    async def get(self, timeout=None):
+        token = self.current()
+        if token is not None:
+            # Short-lived tokens refresh at half their lifetime at the latest
+            margin = min(self.refresh_margin, self._lifetime / 2)
+            if self._expiry - time.time() < margin and self._refresh is None:
+                if self._start_refresh() is not None:
+                    self.stats["proactive_refreshes"] += 1
+            return token
+
+        refresh = self._start_refresh()
+        if refresh is None:
+            self.stats["backoff_skips"] += 1
+            return None
+        self.stats["waits"] += 1
+        try:
+            # Shielded: a caller timing out or going away never cancels the shared refresh
+            return await asyncio.wait_for(asyncio.shield(refresh), timeout=self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _start_refresh(self):
+        if self._refresh is None:
+            if not self.client_id or not self.client_secret:
+                if not self.stats["failures"]:
+                    logging.error("❌ Spotify credentials are not set in environment variables.")
+                self.stats["failures"] += 1
+                return None
+            if time.time() < self._retry_at:
+                return None
+            self._refresh = asyncio.create_task(self._do_refresh(), name="spotify-token-refresh")
+            self._refresh.add_done_callback(self._refresh_done)
+        return self._refresh
+
+    def _refresh_done(self, task):
+        if self._refresh is task:
+            self._refresh = None
+
+    async def _do_refresh(self):
+        # Runs on behalf of every waiter, so it uses its own timeout rather than one request's deadline
+        with span("music.spotify_token") as token_span:
+            auth_str = f"{self.client_id}:{self.client_secret}"
+            b64_auth = base64.b64encode(auth_str.encode()).decode()
+            try:
+                res = await get_http_client().post(
+                    self.token_url,
+                    headers={"Authorization": f"Basic {b64_auth}"},
+                    data={"grant_type": "client_credentials"},
+                    timeout=self.timeout,
+                )
+                res.raise_for_status()
+                data = res.json()
+                token = data["access_token"]
+            except httpx.HTTPStatusError as e:
+                token_span.fail(e)
+                self._back_off(auth=e.response.status_code in (400, 401, 403))
+                logging.error(f"❌ Spotify Authentication Failed: {e}")
+                return None
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                token_span.fail(e)
+                self._back_off()
+                logging.error(f"❌ Spotify token refresh failed: {e}")
+                return None
+
+        self._token = token
+        self._lifetime = float(data.get("expires_in", 3600))
+        self._expiry = time.time() + self._lifetime
+        self._failures = 0
+        self._retry_at = 0.0
+        self.stats["refreshes"] += 1
+        return token
+
+    def _back_off(self, auth=False):
+        self._failures += 1
+        self.stats["failures"] += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+        if auth:
+            delay = max(delay, self.auth_backoff)
+        self._retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+
+    def snapshot(self):
+        now = time.time()
+        return {
+            **self.stats,
+            "valid": self.current() is not None,
+            "expires_in": round(max(0.0, self._expiry - now), 1),
+            "refreshing": self._refresh is not None,
+            "backoff_remaining": round(max(0.0, self._retry_at - now), 1),
+        }
+
+
+spotify_tokens = SpotifyTokenManager(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
+
+
+class SpotifyProvider(MusicProvider):
+    name = "spotify"
+    label = "Spotify"
+    language = "english"
+
+    async def fetch(self, query):
+        token = await spotify_tokens.get(self.call_timeout())
+        if not token:
+            raise SongLookupError("Spotify token unavailable")
+
+        try:
+            res = await get_http_client().get(
+                SPOTIFY_SEARCH_URL,
+                headers={"Authorization": f"Bearer {token}"},
+                params={"q": query, "type": "track", "limit": 1},
+                timeout=self.call_timeout(),
+            )
+            res.raise_for_status()
+            return self.parse(res.json())
+        except httpx.HTTPError as e:
+            logging.warning(f"⚠️ Spotify Search Failed: {query} | {e}")
+            raise SongLookupError(query) from e
+        except Exception as e:
+            logging.error(f"❌ An unexpected error occurred during Spotify search: {e}")
+            raise SongLookupError(query) from e
+
+    @staticmethod
+    def parse(data):
+        tracks = data.get("tracks", {}).get("items", [])
+        if not tracks:
+            return None
+        track = tracks[0]
+        album = track.get("album") or {}
+        return {
+            "title": track["name"],
+            "artist": ", ".join(a["name"] for a in track.get("artists", [])),
+            "album": album.get("name"),
+            "image": album["images"][0]["url"] if album.get("images") else DEFAULT_IMAGE,
+            "preview": track.get("preview_url"),
+            "link": (track.get("external_urls") or {}).get("spotify"),
+            "language": "english",
+            "source": "Spotify",
+        }
+
+
+# =============================
+# 🎵 JioSaavn
+# =============================
+def _last_url(items):
+    """JioSaavn lists images/downloads from lowest to highest quality, as `url` or (older API) `link`."""
+    if isinstance(items, list) and items:
+        return items[-1].get("url") or items[-1].get("link")
+    return items if isinstance(items, str) else None
+
+
+class JioSaavnProvider(MusicProvider):
+    name = "jiosaavn"
+    label = "JioSaavn"
+    language = "hindi"
+
+    async def fetch(self, query):
+        try:
+            res = await get_http_client().get(JIOSAAVN_SEARCH_URL, params={"query": query},
+                                              timeout=self.call_timeout())
+            res.raise_for_status()
+            return self.parse(res.json())
+        except httpx.HTTPError as e:
+            logging.warning(f"⚠️ JioSaavn Search Failed: {query} | {e}")
+            raise SongLookupError(query) from e
+        except Exception as e:
+            logging.error(f"❌ An unexpected error occurred during JioSaavn search: {e}")
+            raise SongLookupError(query) from e
+
+    @staticmethod
+    def parse(data):
+        results = (data.get("data") or {}).get("results") or []
+        if not results:
+            return None
+        song = results[0]
+        artist = song.get("primaryArtists")
+        if not artist:
+            primary = (song.get("artists") or {}).get("primary") or []
+            artist = ", ".join(a.get("name", "") for a in primary if a.get("name"))
+        album = song.get("album")
+        return {
+            "title": song.get("name") or song.get("title"),
+            "artist": artist,
+            "album": album.get("name") if isinstance(album, dict) else album,
+            "image": _last_url(song.get("image")) or DEFAULT_IMAGE,
+            "preview": _last_url(song.get("downloadUrl")),
+            "link": song.get("url"),
+            "language": song.get("language") or "hindi",
+            "source": "JioSaavn",
+        }
+
+
+PROVIDER_TYPES = {provider.name: provider for provider in (SpotifyProvider, JioSaavnProvider)}
+providers = [PROVIDER_TYPES[name]() for name in MUSIC_PROVIDERS if name in PROVIDER_TYPES]
+
+
+# =============================
+# 🏁 Provider Strategies
+# =============================
+async def _first_good(ordered, query, hedge_delay):
+    """
+    Starts `ordered[0]`; each next provider starts after `hedge_delay`, or at
+    once when everything started so far has missed. Returns the first song
+    found (the higher-priority one when several land together) and cancels
+    the rest. Every provider runs under its own timeout, so a slow one never
+    holds up the answer from another.
+    """
+    waiting = list(ordered)
+    running = {}  # task -> priority
+
+    def start_next():
+        provider = waiting.pop(0)
+        task = asyncio.create_task(provider.search(query), name=f"music:{provider.name}")
+        running[task] = len(ordered) - len(waiting) - 1
+
+    start_next()
+    if hedge_delay <= 0:
+        while waiting:
+            start_next()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, timeout=hedge_delay if waiting else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=running.get):
+                priority = running.pop(task)
+                try:
+                    song = task.result()
+                except Exception as e:
+                    logging.warning(f"⚠️ {ordered[priority].name} lookup failed: {e}")
+                    song = None
+                if song:
+                    return song, ordered[priority]
+            if waiting and (not done or not running):
+                start_next()  # Hedge delay passed, or everything started so far missed
+        return None, None
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def search_song(query, strategy=None):
+    """Looks `query` up across the configured providers; returns a normalized song or None."""
+    strategy = (strategy or MUSIC_PROVIDER_STRATEGY).lower()
+    if strategy not in MUSIC_PROVIDER_STRATEGIES:
+        raise ValueError(f"❌ Unknown music provider strategy: {strategy}")
+    if not providers:
+        return None
+
+    ordered = providers
+    if strategy == "language":
+        language = detect_language(query)
+        ordered = sorted(providers, key=lambda p: p.language != language)
+
+    with span("music.search", strategy=strategy) as search_span:
+        song, winner = await _first_good(ordered, query, 0 if strategy == "race" else MUSIC_HEDGE_DELAY)
+        search_span.set(provider=winner.name if winner else None)
+    MUSIC_LOOKUPS.inc(provider=winner.name if winner else "none", strategy=strategy)
+    return song
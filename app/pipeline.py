@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+from app.metrics import STAGE_LATENCY, STAGE_FAILURES
+from app.tracing import span
+from app.deadline import within_deadline
+
+# Stages that watch the deadline themselves (e.g. song lookups) get this long
+# past it to hand back partial results before they are cancelled.
+STAGE_DEADLINE_GRACE = 0.25
+
+# =============================
+# 🧩 Stage Definition
+# =============================
+class Stage:
+    """
+    One step of a request pipeline.
+
+    - `name` is the key the stage's output is stored under.
+    - `requires` lists the context keys / stage names it needs as keyword arguments.
+    - `fallback` is returned when the stage fails (a callable receives the exception).
+    - `critical` stages abort the whole pipeline instead of falling back.
+    """
+
+    def __init__(self, name, func, requires=(), fallback=None, critical=False):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.fallback = fallback
+        self.critical = critical
+
+    def resolve_fallback(self, exc):
+        if callable(self.fallback):
+            return self.fallback(exc)
+        return self.fallback
+
+
+class PipelineResult:
+    """Stage outputs plus per-stage timings (milliseconds)."""
+
+    def __init__(self, results, timings):
+        self.results = results
+        self.timings = timings
+
+    def __getitem__(self, name):
+        return self.results[name]
+
+    def get(self, name, default=None):
+        return self.results.get(name, default)
+
+
+# =============================
+# 🚀 Dependency-Aware Scheduler
+# =============================
+def _check_graph(stages, context):
+    """Validates that every requirement is satisfiable and returns stages in dependency order."""
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("❌ Duplicate stage names in pipeline.")
+
+    ordered, visiting, done = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"❌ Cycle detected at stage '{stage.name}'.")
+        visiting.add(stage.name)
+        for dep in stage.requires:
+            if dep in by_name:
+                visit(by_name[dep])
+            elif dep not in context:
+                raise ValueError(f"❌ Stage '{stage.name}' requires unknown input '{dep}'.")
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+async def run_pipeline(stages, context, on_result=None):
+    """
+    Runs `stages` as a DAG: every stage starts as soon as all of its
+    inputs are available, so independent branches execute concurrently.
+
+    `on_result(name, value)` (sync or async) is invoked as each stage finishes.
+    A failing critical stage cancels everything still running and re-raises.
+    Stages still running when the request deadline passes are cancelled and
+    fall back (or abort the pipeline, if critical) with DeadlineExceeded.
+    """
+    ordered = _check_graph(stages, context)
+    results = dict(context)
+    timings = {}
+    tasks = {}
+    started = time.perf_counter()
+
+    def _record_timing(name, stage_start):
+        elapsed = time.perf_counter() - stage_start
+        timings[name] = round(elapsed * 1000, 1)
+        STAGE_LATENCY.observe(elapsed, stage=name)
+
+    async def run_stage(stage):
+        deps = [tasks[d] for d in stage.requires if d in tasks]
+        if deps:
+            await asyncio.gather(*deps)
+
+        kwargs = {dep: results[dep] for dep in stage.requires}
+        stage_start = time.perf_counter()
+        with span(f"stage.{stage.name}") as stage_span:
+            try:
+                value = await within_deadline(stage.func(**kwargs), f"stage '{stage.name}'", STAGE_DEADLINE_GRACE)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                STAGE_FAILURES.inc(stage=stage.name)
+                if stage.critical:
+                    _record_timing(stage.name, stage_start)
+                    raise
+                logging.error(f"❌ Stage '{stage.name}' failed, using fallback: {e}")
+                stage_span.fail(e)
+                stage_span.set(fallback=True)
+                value = stage.resolve_fallback(e)
+
+        _record_timing(stage.name, stage_start)
+        results[stage.name] = value
+
+        if on_result is not None:
+            outcome = on_result(stage.name, value)
+            if asyncio.iscoroutine(outcome):
+                await outcome
+        return value
+
+    for stage in ordered:
+        tasks[stage.name] = asyncio.create_task(run_stage(stage), name=f"stage:{stage.name}")
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+    logging.info(f"⏱️ Pipeline timings (ms): {timings}")
+    return PipelineResult({k: v for k, v in results.items() if k not in context}, timings)
@@ -0,0 +1,44 @@
+import threading
+from app.metrics import PROMPT_TOKENS
+
+# =============================
+# 🧮 Prompt Token Accounting
+# =============================
+# Estimated text size of every prompt sent, per stage, so prompt trimming
+# (e.g. the compact analysis fields) shows up in /stats and /metrics.
+# Uses the same chars-per-token estimate as the key pool's TPM pre-charge;
+# Gemini's own usage metadata (glamo_gemini_tokens_total) is the billed total.
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+class PromptAccounting:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, prompt):
+        """Accounts `prompt` to `stage` and returns it unchanged."""
+        tokens = estimate_tokens(prompt)
+        PROMPT_TOKENS.observe(tokens, stage=stage)
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"prompts": 0, "tokens": 0, "max_tokens": 0})
+            entry["prompts"] += 1
+            entry["tokens"] += tokens
+            entry["max_tokens"] = max(entry["max_tokens"], tokens)
+        return prompt
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                stage: {**entry, "avg_tokens": round(entry["tokens"] / entry["prompts"], 1)}
+                for stage, entry in sorted(self._stages.items())
+            }
+
+
+prompt_accounting = PromptAccounting()
+record_prompt = prompt_accounting.record
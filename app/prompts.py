@@ -1,4 +1,5 @@
 # prompt.py - Consolidated and Final Version
+from app.image_analysis import ImageAnalysis
 
 # ===================================================================
 # === 1. CORE IMAGE ANALYSIS (The First and Most Important Step)
@@ -17,10 +18,38 @@ Analyze the provided image in detail, focusing on elements that would be useful
 - **Color Palette:** Describe the dominant colors and their overall tone. (e.g., "Warm earthy tones of brown and orange," "Vibrant pastels," "Monochromatic black and white").
 """
 
+def get_batch_analysis_prompt(image_count):
+    """
+    Packs the comprehensive analysis of several images into one multimodal request.
+    """
+    return f"""
+You will receive {image_count} images, in order. Analyze EACH image separately using the instructions below.
+
+{COMPREHENSIVE_ANALYSIS_PROMPT}
+
+📋 **STRICT OUTPUT FORMAT:**
+- Start each image's analysis with a header line exactly like: ### IMAGE 1
+- Number the images from 1 to {image_count} in the order they were provided.
+- Do not merge, compare or skip any image.
+"""
+
 # ===================================================================
 # === 2. PHOTO EDITING PROMPTS
 # ===================================================================
 # These prompts all receive the 'image_analysis' from the step above for context.
+# Each builder only pastes the analysis fields it needs, in the compact
+# "field: value" form (an ImageAnalysis or the raw analysis text both work).
+
+EDITING_ANALYSIS_FIELDS = ("subject", "setting", "mood", "composition", "lighting", "color_palette")
+CAPTION_ANALYSIS_FIELDS = ("subject", "setting", "mood", "action", "key_objects")
+VALIDATOR_ANALYSIS_FIELDS = ("subject", "setting", "mood")
+MUSIC_ANALYSIS_FIELDS = ("subject", "setting", "mood", "action")
+
+def analysis_context(image_analysis, fields):
+    return ImageAnalysis.coerce(image_analysis).compact(fields)
+
+def _editing_context(image_analysis):
+    return analysis_context(image_analysis, EDITING_ANALYSIS_FIELDS)
 
 EDITING_PROMPTS = {
     "snapseed": lambda style, image_analysis: f"""
@@ -30,7 +59,7 @@ You are a senior Snapseed expert and photo editor.
 Transform the provided image into a professional '{style}' look using a sequence of precise, actionable steps.
 
 📸 **IMAGE ANALYSIS:**
-{image_analysis}
+{_editing_context(image_analysis)}
 
 🧠 **STRATEGY:**
 Based on the image analysis, create a logical editing plan to achieve the '{style}' aesthetic. Your steps should build on each other to create a cohesive final result.
@@ -57,7 +86,7 @@ You are a professional Lightroom Mobile expert.
 Convert the provided image into a visually perfect '{style}' aesthetic with precise Lightroom adjustments.
 
 📸 **IMAGE ANALYSIS:**
-{image_analysis}
+{_editing_context(image_analysis)}
 
 🧠 **STRATEGY:**
 Analyze the image's light, color, and composition from the analysis to build a plan that matches the '{style}' vibe.
@@ -86,7 +115,7 @@ You are a VSCO aesthetic expert.
 Make the provided image look stunning in the '{style}' style using authentic VSCO adjustments.
 
 📸 **IMAGE ANALYSIS:**
-{image_analysis}
+{_editing_context(image_analysis)}
 
 🧠 **STRATEGY:**
 Start with a base filter that matches the '{style}' goal, then refine it using specific tool adjustments based on the image's unique characteristics from the analysis.
@@ -115,7 +144,7 @@ You are an expert iPhone Photos app editor (iOS 17+).
 Create a clean and vibrant '{style}' edit using only the native iOS Photos app tools.
 
 📸 **IMAGE ANALYSIS:**
-{image_analysis}
+{_editing_context(image_analysis)}
 
 🧠 **STRATEGY:**
 Use the analysis to identify areas for improvement (e.g., brightness, color vibrancy) and apply subtle, high-quality adjustments to achieve the '{style}' look.
@@ -142,7 +171,7 @@ You are a creative PicsArt editor.
 Make the provided image visually striking in a '{style}' transformation using PicsArt's unique capabilities.
 
 📸 **IMAGE ANALYSIS:**
-{image_analysis}
+{_editing_context(image_analysis)}
 
 🧠 **STRATEGY:**
 Based on the analysis, decide if the '{style}' requires a filter-based approach, manual adjustments, or creative effects. Formulate a step-by-step plan.
@@ -169,7 +198,7 @@ Reason: [Explain how this specific action helps create the '{style}' transformat
 # === 3. INSTAGRAM CONTENT PROMPTS
 # ===================================================================
 
-def get_caption_prompt(style, image_analysis):
+def get_caption_prompt(style, image_analysis, count=5):
     """
     Generates a high-accuracy prompt for Instagram captions.
     NOTE: This function was added back as it is required for the validator.
@@ -178,9 +207,9 @@ def get_caption_prompt(style, image_analysis):
 You are a poetic and stylish Instagram caption writer.
 
 📸 IMAGE ANALYSIS:
-{image_analysis}
+{analysis_context(image_analysis, CAPTION_ANALYSIS_FIELDS)}
 
-🎯 TASK: Generate 5 unique Instagram captions inspired by the detailed image analysis. The captions must perfectly reflect the '{style}' aesthetic.
+🎯 TASK: Generate {count} unique Instagram captions inspired by the detailed image analysis. The captions must perfectly reflect the '{style}' aesthetic.
 
 🛑 STRICT RULES:
 - Each caption must be 20 words or less.
@@ -189,9 +218,20 @@ You are a poetic and stylish Instagram caption writer.
 - NO quotation marks.
 - NO numbered lists or bullet points.
 - NO explanations or conversational text.
-- DO NOT repeat significant words across the 5 captions.
+- DO NOT repeat significant words across the {count} captions.
+
+Return ONLY the {count} captions, each on a new line.
+"""
 
-Return ONLY the 5 captions, each on a new line.
+def get_caption_regeneration_prompt(style, image_analysis, count, avoid_words):
+    """
+    Asks only for the captions that failed the local rule check, steering clear
+    of words the kept captions already use.
+    """
+    avoid = ", ".join(sorted(avoid_words)) or "none"
+    return f"""
+{get_caption_prompt(style, image_analysis, count)}
+🚫 These words are already used by other captions, DO NOT use them: {avoid}
 """
 
 def get_caption_validator_prompt(style, image_analysis, captions):
@@ -202,7 +242,7 @@ def get_caption_validator_prompt(style, image_analysis, captions):
 You are an objective AI quality checker. Your task is to validate a list of Instagram captions against a set of rules.
 
 📌 IMAGE ANALYSIS CONTEXT:
-{image_analysis}
+{analysis_context(image_analysis, VALIDATOR_ANALYSIS_FIELDS)}
 
 📝 CAPTIONS TO VALIDATE:
 {captions}
@@ -229,7 +269,7 @@ def get_music_prompt(style, image_analysis):
     You are a music curator for Glamo AI.
 
     📸 IMAGE ANALYSIS:
-    {image_analysis}
+    {analysis_context(image_analysis, MUSIC_ANALYSIS_FIELDS)}
 
     🎯 TASK:
     Based on the detailed image analysis, generate a list of song suggestions that would be a perfect soundtrack for this photo.
@@ -283,4 +323,39 @@ Provide your output ONLY in the following strict format. Do not add any other te
 Style: [Suggested Style]
 App: [Suggested App Name]
 Reason: [A concise, expert explanation for why this specific combination is the best fit for this particular image.]
-"""
\ No newline at end of file
+"""
+# ===================================================================
+# === 6. FUSED (SINGLE-CALL) ANALYSIS PROMPT
+# ===================================================================
+# Reuses the prompts above so the rules stay in one place; the model fills
+# every section in one multimodal call and answers with JSON only.
+
+FUSED_ANALYSIS_CONTEXT = "(Use the analysis you write in the `analysis` field of your JSON answer.)"
+
+def get_fused_analysis_prompt(style, selected_app=None):
+    """
+    Generates one prompt covering analysis, editing steps, captions and music,
+    answered as JSON matching the schema in `app.fused_analysis`.
+    """
+    editing_prompt_func = EDITING_PROMPTS.get((selected_app or "").lower())
+    editing_section = ""
+    if editing_prompt_func:
+        editing_section = f"""
+=== PART 2 → `editing_steps` ===
+Return the steps below as objects with `tool`, `value` and `reason`.
+{editing_prompt_func(style, FUSED_ANALYSIS_CONTEXT)}"""
+
+    return f"""
+You are Glamo's all-in-one photo assistant. Complete EVERY part below for the provided image
+and answer with a single JSON object. The JSON schema replaces any "output format" or
+"return only" instructions inside the parts.
+
+=== PART 1 → `analysis` ===
+Fill one field per item: subject, setting, mood, action, key_objects, composition, lighting, color_palette.
+{COMPREHENSIVE_ANALYSIS_PROMPT}
+{editing_section}
+=== PART 3 → `captions` (an array of 5 strings) ===
+{get_caption_prompt(style, FUSED_ANALYSIS_CONTEXT)}
+=== PART 4 → `music_queries` (an array of strings, each "Song Title by Artist Name", no quotes) ===
+{get_music_prompt(style, FUSED_ANALYSIS_CONTEXT)}
+"""
@@ -1,9 +1,10 @@
 import os
-import time
-import base64
+import asyncio
 import logging
-import requests
 from fastapi import APIRouter, HTTPException
+from app.music_providers import normalize_song, search_song
+from app.song_catalog import song_catalog
+from app import deadline
 
 # Create a new router object. This is like a "mini" FastAPI app.
 router = APIRouter(
@@ -12,100 +13,71 @@ router = APIRouter(
 )
 
 # =============================
-# 🎵 Spotify Auth & Music Fetch
+# 🎵 Song Resolution
 # =============================
-# All music-related code now lives in this file.
-SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
-SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
-SPOTIFY_TOKEN = None
-SPOTIFY_TOKEN_EXPIRY = 0
-
-
-def get_spotify_token():
-    """Fetch or refresh Spotify API token."""
-    global SPOTIFY_TOKEN, SPOTIFY_TOKEN_EXPIRY
-
-    if SPOTIFY_TOKEN and time.time() < SPOTIFY_TOKEN_EXPIRY:
-        return SPOTIFY_TOKEN
-
-    if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
-        logging.error("❌ Spotify credentials are not set in environment variables.")
-        return None
-
+# Provider code (Spotify, JioSaavn, strategies, HTTP pool) lives in app.music_providers.
+MUSIC_LOOKUP_CONCURRENCY = int(os.getenv("MUSIC_LOOKUP_CONCURRENCY", "6"))
+MAX_SONGS = 10
+
+
+async def lookup_song(query: str):
+    """
+    Local catalog first; only when it has no confident match does the query
+    go to the remote providers (see MUSIC_PROVIDER_STRATEGY). Songs found
+    remotely are added to the catalog.
+    """
+    local = await song_catalog.match_async(query)
+    if local is not None:
+        return normalize_song(local[0])
+    song = await search_song(query)
+    if song:
+        await song_catalog.add_async(song)
+    return song
+
+
+async def iter_resolved_songs(queries, limit=MAX_SONGS, concurrency=MUSIC_LOOKUP_CONCURRENCY):
+    """
+    Resolves all queries concurrently (at most `concurrency` in flight) and
+    yields `(query_index, song)` as each unique song arrives. Outstanding
+    lookups are cancelled once `limit` unique songs have been found or the
+    request deadline is reached.
+    """
+    if not queries:
+        return
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(index, query):
+        async with semaphore:
+            return index, await lookup_song(query)
+
+    tasks = [asyncio.create_task(resolve(i, q)) for i, q in enumerate(queries)]
+    seen_titles = set()
+    found = 0
     try:
-        auth_str = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-        b64_auth = base64.b64encode(auth_str.encode()).decode()
-
-        res = requests.post(
-            "https://accounts.spotify.com/api/token",
-            headers={"Authorization": f"Basic {b64_auth}"},
-            data={"grant_type": "client_credentials"}
-        )
-
-        res.raise_for_status()  # This will raise an error for bad responses (4xx or 5xx)
-
-        data = res.json()
-        SPOTIFY_TOKEN = data.get("access_token")
-        SPOTIFY_TOKEN_EXPIRY = time.time() + data.get("expires_in", 3600)
-        return SPOTIFY_TOKEN
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"❌ Spotify Authentication Failed: {e}")
-        return None
-    except Exception as e:
-        logging.error(f"❌ An unexpected error occurred during Spotify token fetch: {e}")
-        return None
-
-
-def search_spotify_song(query: str):
-    """Search for a song on Spotify."""
-    token = get_spotify_token()
-    if not token:
-        return None
-
-    try:
-        url = "https://api.spotify.com/v1/search"
-        headers = {"Authorization": f"Bearer {token}"}
-        params = {"q": query, "type": "track", "limit": 1}
-
-        res = requests.get(url, headers=headers, params=params)
-        res.raise_for_status()
-        
-        tracks = res.json().get("tracks", {}).get("items", [])
-        if tracks:
-            track = tracks[0]
-            return {
-                "title": track["name"],
-                "artist": ", ".join(a["name"] for a in track["artists"]),
-                "image": track["album"]["images"][0]["url"] if track["album"]["images"] else "/static/music-default.jpg",
-                "preview": track.get("preview_url")
-            }
-    except requests.exceptions.RequestException as e:
-        logging.warning(f"⚠️ Spotify Search Failed: {query} | {e}")
-    except Exception as e:
-        logging.error(f"❌ An unexpected error occurred during Spotify search: {e}")
-
-    return None
-
-
-def search_jiosaavn_song(query: str):
-    """Search for a song on JioSaavn."""
-    try:
-        res = requests.get(f"https://saavn.dev/api/search/songs?query={query}")
-        res.raise_for_status()
-        
-        data = res.json()
-        if "data" in data and data["data"].get("results"):
-            song = data["data"]["results"][0]
-            return {
-                "title": song.get("name"), # Corrected from "title" to "name" for consistency
-                "artist": song.get("primaryArtists"),
-                "image": song["image"][-1]["link"] if song.get("image") else "/static/music-default.jpg",
-                "link": song.get("url")
-            }
-    except requests.exceptions.RequestException as e:
-        logging.warning(f"⚠️ JioSaavn Search Failed: {query} | {e}")
-    except Exception as e:
-        logging.error(f"❌ An unexpected error occurred during JioSaavn search: {e}")
-
-    return None
+        for next_done in asyncio.as_completed(tasks, timeout=deadline.remaining()):
+            try:
+                index, song = await next_done
+            except asyncio.TimeoutError:
+                # Request deadline reached: keep the songs found so far
+                logging.warning(f"⏳ Song lookups stopped at the deadline with {found} songs")
+                break
+            except Exception as e:
+                logging.warning(f"⚠️ Song lookup failed: {e}")
+                continue
+            if song and song.get("title") and song["title"] not in seen_titles:
+                seen_titles.add(song["title"])
+                found += 1
+                yield index, song
+                if found >= limit:
+                    break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def resolve_songs(queries, limit=MAX_SONGS, concurrency=MUSIC_LOOKUP_CONCURRENCY):
+    """Resolves queries concurrently and returns unique songs in the LLM's suggested order."""
+    resolved = [item async for item in iter_resolved_songs(queries, limit, concurrency)]
+    return [song for _, song in sorted(resolved, key=lambda item: item[0])]
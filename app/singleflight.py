@@ -0,0 +1,93 @@
+import asyncio
+import functools
+from app import deadline
+from app.tracing import span
+
+
+async def _detached(factory):
+    with deadline.unbounded():
+        return await factory()
+
+
+# =============================
+# 🛫 Single-Flight Call Coalescing
+# =============================
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one upstream call.
+
+    - The first caller starts the call; later callers with the same key await
+      the same task and receive its result (or its exception).
+    - Nothing is remembered once the call settles, so a failure only reaches
+      the callers that were already waiting on that exact key.
+    - A caller being cancelled never cancels the shared call for the others;
+      the call is only cancelled once every waiter has gone away.
+    - The shared call runs without a deadline; each caller applies its own,
+      so a joiner never inherits the leader's (possibly nearly spent) budget.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> [task, waiters]
+        self.stats = {"calls": 0, "coalesced": 0, "retried": 0}
+
+    async def do(self, key, factory):
+        with span(f"singleflight.{self.name}") as flight_span:
+            while True:
+                entry = self._join(key, factory, flight_span)
+                task = entry[0]
+                entry[1] += 1
+                try:
+                    # Each caller waits only as long as its own deadline allows
+                    return await deadline.within_deadline(asyncio.shield(task), f"{self.name} call")
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        raise  # This caller was cancelled
+                    # The shared call was abandoned by the callers before us; start a fresh one
+                    self.stats["retried"] += 1
+                finally:
+                    entry[1] -= 1
+                    if entry[1] == 0 and not task.done():
+                        task.cancel()
+
+    def _join(self, key, factory, flight_span):
+        entry = self._calls.get(key)
+        if entry is not None and not entry[0].cancelled():
+            self.stats["coalesced"] += 1
+            flight_span.set(coalesced=True)
+            return entry
+        # The shared call keeps the leader's trace but not its deadline: it runs
+        # for every waiter, so no single request's budget may cut it short
+        task = asyncio.ensure_future(_detached(factory))
+        entry = [task, 0]
+        self._calls[key] = entry
+        task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        self.stats["calls"] += 1
+        return entry
+
+    def _forget(self, key, task):
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Mark retrieved so an unawaited failure is not logged twice
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
+
+    def snapshot(self):
+        return {**self.stats, "in_flight": self.in_flight}
+
+
+def coalesce(flight, key_func):
+    """Decorator form: concurrent calls with equal `key_func(*args, **kwargs)` share one call."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = key_func(*args, **kwargs)
+            if key is None:
+                return await func(*args, **kwargs)
+            return await flight.do(key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
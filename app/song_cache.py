@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+import functools
+import unicodedata
+import inspect
+
+# =============================
+# ⚙️ Configuration
+# =============================
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SONG_CACHE_PATH = os.getenv("SONG_CACHE_PATH", os.path.join(BASE_DIR, "data", "song_cache.sqlite3"))
+SONG_CACHE_NEGATIVE_TTL = float(os.getenv("SONG_CACHE_NEGATIVE_TTL", str(3600)))
+
+# Per-provider positive TTLs; override with SONG_CACHE_TTL_<PROVIDER>.
+DEFAULT_PROVIDER_TTLS = {
+    "spotify": 7 * 24 * 3600,
+    "jiosaavn": 3 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+
+class SongLookupError(Exception):
+    """Raised by a search when the upstream failed (as opposed to finding nothing)."""
+
+
+# =============================
+# 🔤 Query Normalization
+# =============================
+def normalize_query(query: str) -> str:
+    """'  "Perfect" by Ed Sheeran!! ' -> 'perfect by ed sheeran'"""
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    text = re.sub(r"[\"'“”‘’`]", "", text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def provider_ttl(provider: str) -> float:
+    env_value = os.getenv(f"SONG_CACHE_TTL_{provider.upper()}")
+    if env_value:
+        return float(env_value)
+    return DEFAULT_PROVIDER_TTLS.get(provider, DEFAULT_TTL)
+
+
+# =============================
+# 🗄️ SQLite Song Cache (WAL)
+# =============================
+class SongCache:
+    """
+    Song-metadata cache shared by every worker process through one SQLite
+    file in WAL mode. Found songs live for the provider's TTL; misses are
+    cached as NULL rows for the shorter negative TTL.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, path=SONG_CACHE_PATH, negative_ttl=SONG_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.enabled = bool(path)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+        if self.enabled:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                conn = self._conn()
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS song_cache (
+                        provider TEXT NOT NULL,
+                        query TEXT NOT NULL,
+                        payload TEXT,
+                        expires_at REAL NOT NULL,
+                        PRIMARY KEY (provider, query)
+                    )"""
+                )
+                conn.execute("DELETE FROM song_cache WHERE expires_at < ?", (time.time(),))
+                conn.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"⚠️ Song cache disabled ({path}): {e}")
+                self.enabled = False
+
+    def _conn(self):
+        # sqlite3 connections are not thread-safe; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get(self, provider, query):
+        """Returns the cached song dict, None for a cached miss, or `SongCache._MISSING`."""
+        if not self.enabled:
+            return self._MISSING
+        try:
+            row = self._conn().execute(
+                "SELECT payload, expires_at FROM song_cache WHERE provider = ? AND query = ?",
+                (provider, normalize_query(query)),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning(f"⚠️ Song cache read failed: {e}")
+            return self._MISSING
+
+        if not row or row[1] < time.time():
+            self._count("misses")
+            return self._MISSING
+        if row[0] is None:
+            self._count("negative_hits")
+            return None
+        self._count("hits")
+        return json.loads(row[0])
+
+    def set(self, provider, query, song):
+        if not self.enabled:
+            return
+        ttl = provider_ttl(provider.split(":")[0]) if song else self.negative_ttl
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO song_cache (provider, query, payload, expires_at) VALUES (?, ?, ?, ?)",
+                (provider, normalize_query(query), json.dumps(song) if song else None, time.time() + ttl),
+            )
+            conn.commit()
+            self._count("stores")
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning(f"⚠️ Song cache write failed: {e}")
+
+    # Event-loop callers go through these: SQLite may wait on the busy
+    # timeout or a commit, which must not stall every other request.
+    async def get_async(self, provider, query):
+        if not self.enabled:
+            return self._MISSING
+        return await asyncio.to_thread(self.get, provider, query)
+
+    async def set_async(self, provider, query, song):
+        if self.enabled:
+            await asyncio.to_thread(self.set, provider, query, song)
+
+    def snapshot(self):
+        with self._stats_lock:
+            lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+            served = self.stats["hits"] + self.stats["negative_hits"]
+            return {
+                **self.stats,
+                "hit_rate": round(served / lookups, 3) if lookups else 0.0,
+                "enabled": self.enabled,
+            }
+
+
+song_cache = SongCache()
+
+
+# =============================
+# 🎁 Lookup Decorator
+# =============================
+def cached_lookup(provider, namespace=None):
+    """
+    Wraps a `search(query) -> dict | None` function (sync or async) with the
+    song cache. A `SongLookupError` from the search is turned into None
+    without being cached, so upstream outages never become negative entries.
+    """
+    cache_provider = f"{provider}:{namespace}" if namespace else provider
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(query, *args, **kwargs):
+                cached = await song_cache.get_async(cache_provider, query)
+                if cached is not SongCache._MISSING:
+                    return cached
+                try:
+                    song = await func(query, *args, **kwargs)
+                except SongLookupError:
+                    return None
+                await song_cache.set_async(cache_provider, query, song)
+                return song
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(query, *args, **kwargs):
+            cached = song_cache.get(cache_provider, query)
+            if cached is not SongCache._MISSING:
+                return cached
+            try:
+                song = func(query, *args, **kwargs)
+            except SongLookupError:
+                return None
+            song_cache.set(cache_provider, query, song)
+            return song
+        return wrapper
+
+    return decorator
@@ -0,0 +1,278 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import defaultdict
+from app.song_cache import BASE_DIR, normalize_query
+from app.music_providers import SONG_FIELDS, DEFAULT_IMAGE, normalize_song
+
+# =============================
+# ⚙️ Configuration
+# =============================
+SONG_CATALOG_PATH = os.getenv("SONG_CATALOG_PATH", os.path.join(BASE_DIR, "data", "song_catalog.sqlite3"))
+SONG_CATALOG_MIN_SCORE = float(os.getenv("SONG_CATALOG_MIN_SCORE", "0.82"))
+SONG_CATALOG_REFRESH_SECONDS = float(os.getenv("SONG_CATALOG_REFRESH_SECONDS", "30"))
+
+TITLE_WEIGHT = 0.7  # Title vs artist share of the score when the query names an artist
+
+
+# =============================
+# 🔤 Query Parsing
+# =============================
+def parse_song_query(query):
+    """'1. "Perfect" by Ed Sheeran' -> ('Perfect', 'Ed Sheeran'); the artist is None when missing."""
+    text = re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", query or "").strip().strip("\"'“”")
+    parts = re.split(r"\s+by\s+", text, flags=re.IGNORECASE)
+    if len(parts) >= 2 and parts[-1].strip():
+        return " by ".join(parts[:-1]).strip().strip("\"'“”"), parts[-1].strip().strip("\"'“”")
+    return text, None
+
+
+def _core_title(title):
+    """Drops '(From "Movie")', '[Remastered]' and ' - Radio Edit' style suffixes before matching."""
+    title = re.sub(r"[(\[].*?[)\]]", " ", title or "")
+    return normalize_query(re.split(r"\s+-\s+", title)[0])
+
+
+def _artists(artist):
+    """Each credited artist, normalized ('A, B & C' -> ['a', 'b', 'c'])."""
+    names = re.split(r",|&|\band\b|\bfeat\.?|\bft\.?|\bx\b", (artist or "").lower())
+    return [n for n in (normalize_query(name) for name in names) if n]
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+# =============================
+# 📀 Song Catalog
+# =============================
+class SongCatalog:
+    """
+    Local index of songs the remote providers have already returned (or that
+    were imported from a dump). Rows live in one SQLite file shared by every
+    worker; each process keeps a trigram inverted index of the titles in
+    memory so a "Title by Artist" query is fuzzy-matched without any I/O.
+    Rows added by other workers are picked up every SONG_CATALOG_REFRESH_SECONDS.
+    From the event loop use `match_async`/`add_async`, which do the SQLite
+    work in a thread.
+    """
+
+    def __init__(self, path=SONG_CATALOG_PATH, min_score=SONG_CATALOG_MIN_SCORE,
+                 refresh_seconds=SONG_CATALOG_REFRESH_SECONDS):
+        self.path = path
+        self.min_score = min_score
+        self.refresh_seconds = refresh_seconds
+        self.enabled = bool(path)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._songs = []  # doc -> song dict
+        self._titles = []  # doc -> title trigrams
+        self._artists = []  # doc -> [artist trigrams]
+        self._keys = {}  # (core title, artists) -> doc
+        self._postings = defaultdict(list)  # trigram -> [doc]
+        self._last_rowid = 0
+        self._refreshed_at = 0.0
+        self._refreshing = False
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "errors": 0, "match_us_total": 0.0}
+
+        if self.enabled:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                conn = self._conn()
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS song_catalog (
+                        key TEXT PRIMARY KEY,
+                        payload TEXT NOT NULL,
+                        added_at REAL NOT NULL
+                    )"""
+                )
+                conn.commit()
+                self.refresh()
+            except sqlite3.Error as e:
+                logging.warning(f"⚠️ Song catalog disabled ({path}): {e}")
+                self.enabled = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _key(song):
+        return _core_title(song.get("title")), tuple(_artists(song.get("artist")))
+
+    def _index(self, song):
+        """Adds `song` to the in-memory index; returns False when it is already there. Caller holds the lock."""
+        key = self._key(song)
+        if not key[0] or key in self._keys:
+            return False
+        doc = len(self._songs)
+        self._keys[key] = doc
+        self._songs.append(song)
+        self._titles.append(_trigrams(key[0]))
+        self._artists.append([_trigrams(name) for name in key[1]])
+        for gram in self._titles[doc]:
+            self._postings[gram].append(doc)
+        return True
+
+    def refresh(self):
+        """Indexes rows written since the last refresh (by this or another worker)."""
+        if not self.enabled:
+            return
+        try:
+            rows = self._conn().execute(
+                "SELECT rowid, payload FROM song_catalog WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning(f"⚠️ Song catalog refresh failed: {e}")
+            return
+        with self._lock:
+            for rowid, payload in rows:
+                self._index(json.loads(payload))
+                self._last_rowid = max(self._last_rowid, rowid)
+            self._refreshed_at = time.monotonic()
+
+    def match(self, query):
+        """Returns `(song, score)` for the best entry at or above `min_score`, else None (memory only)."""
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        title, artist = parse_song_query(query)
+        title_grams = _trigrams(_core_title(title))
+        artist_grams = [_trigrams(name) for name in _artists(artist)]
+
+        shared = defaultdict(int)
+        with self._lock:
+            for gram in title_grams:
+                for doc in self._postings.get(gram, ()):
+                    shared[doc] += 1
+            # Titles too far off to reach min_score even with a perfect artist match are skipped
+            title_floor = (self.min_score - (1 - TITLE_WEIGHT)) / TITLE_WEIGHT if artist_grams else self.min_score
+            best, best_score = None, 0.0
+            for doc, count in shared.items():
+                score = 2 * count / (len(title_grams) + len(self._titles[doc]))
+                if score < title_floor:
+                    continue
+                if artist_grams:
+                    artist_score = max((_dice(a, b) for a in artist_grams for b in self._artists[doc]), default=0.0)
+                    score = TITLE_WEIGHT * score + (1 - TITLE_WEIGHT) * artist_score
+                if score > best_score:
+                    best, best_score = doc, score
+            song = self._songs[best] if best is not None and best_score >= self.min_score else None
+
+            self.stats["match_us_total"] += (time.perf_counter() - start) * 1e6
+            self.stats["hits" if song else "misses"] += 1
+        return (dict(song), round(best_score, 3)) if song else None
+
+    async def match_async(self, query):
+        """`match`, after picking up other workers' rows in a thread when a refresh is due."""
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._refreshed_at > self.refresh_seconds and not self._refreshing:
+            # One refresh at a time; concurrent lookups match against the current index meanwhile
+            self._refreshing = True
+            try:
+                await asyncio.to_thread(self.refresh)
+            finally:
+                self._refreshing = False
+        return self.match(query)
+
+    async def add_async(self, song):
+        if not self.enabled:
+            return False
+        return await asyncio.to_thread(self.add, song)
+
+    def add(self, song):
+        """Stores a song a remote provider returned; already-indexed songs are skipped."""
+        if not self.enabled or not song or not song.get("title"):
+            return False
+        song = normalize_song(song)
+        key = self._key(song)
+        with self._lock:
+            if not self._index(song):
+                return False
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR IGNORE INTO song_catalog (key, payload, added_at) VALUES (?, ?, ?)",
+                (json.dumps(key), json.dumps(song), time.time()),
+            )
+            conn.commit()
+            self._count("stores")
+        except sqlite3.Error as e:
+            self._count("errors")
+            logging.warning(f"⚠️ Song catalog write failed: {e}")
+        return True
+
+    def import_songs(self, songs):
+        """Bulk-adds dump rows (dicts with at least `title`); returns how many were new."""
+        return sum(self.add({"image": DEFAULT_IMAGE, "source": "Catalog", **row}) for row in songs)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "hits": self.stats["hits"],
+                "misses": self.stats["misses"],
+                "stores": self.stats["stores"],
+                "errors": self.stats["errors"],
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "avg_match_us": round(self.stats["match_us_total"] / lookups, 1) if lookups else 0.0,
+                "songs": len(self._songs),
+                "min_score": self.min_score,
+                "enabled": self.enabled,
+            }
+
+
+song_catalog = SongCatalog()
+
+
+# =============================
+# 📥 Dump Import (CLI)
+# =============================
+def load_dump(path):
+    """Reads a CSV (header row with title, artist, ...) or a JSON list of song objects."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    return [{k: v for k, v in row.items() if k in SONG_FIELDS and v not in (None, "")} for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a song dump into the local song catalog.")
+    parser.add_argument("dump", help="CSV or JSON file with title, artist and optional image/preview/link/album")
+    args = parser.parse_args()
+    if not song_catalog.enabled:
+        sys.exit("❌ Song catalog is disabled (SONG_CATALOG_PATH is empty or unusable).")
+    rows = load_dump(args.dump)
+    added = song_catalog.import_songs(row for row in rows if row.get("title"))
+    print(f"✅ Imported {added} new songs ({len(rows)} rows) into {song_catalog.path}")
+
+
+if __name__ == "__main__":
+    main()
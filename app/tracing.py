@@ -0,0 +1,219 @@
+import os
+import time
+import json
+import uuid
+import random
+import asyncio
+import logging
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# =============================
+# 🧵 Request Tracing
+# =============================
+# Every request gets a trace ID and a flat list of spans (stages, Gemini
+# calls, music lookups, image jobs) linked by parent ID. The current trace
+# and span live in context variables, so tasks created inside a request —
+# pipeline stages, streamed lookups — inherit them automatically.
+#
+# Finished traces are sampled: errors and requests slower than TRACE_SLOW_MS
+# are always kept, the rest with probability TRACE_SAMPLE_RATE. Kept traces
+# go to an in-memory ring buffer and, if TRACE_EXPORT_PATH is set, are
+# appended to that file as JSON lines through the logging queue.
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+
+TRACE_EXPORT_LOGGER = "glamo.traces"
+
+_current_trace = contextvars.ContextVar("glamo_trace", default=None)
+_current_span = contextvars.ContextVar("glamo_span", default=None)
+_recent = deque(maxlen=TRACE_BUFFER_SIZE)
+_export_logger = logging.getLogger(TRACE_EXPORT_LOGGER)
+_export_logger.propagate = False
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "attrs", "start", "end", "status", "error")
+
+    def __init__(self, name, parent_id=None, attrs=None):
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error, status="error"):
+        self.status = status
+        self.error = str(error)[:300]
+
+    def to_dict(self, origin):
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round((end - self.start) * 1000, 1),
+            "status": self.status,
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class _NoopSpan:
+    """Returned by `span()` outside of a trace so callers never need to check."""
+
+    def set(self, **attrs):
+        pass
+
+    def fail(self, error, status="error"):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = {}
+        self.spans = []
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.status = "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    @property
+    def errored(self):
+        return self.status != "ok" or any(s.status == "error" for s in self.spans)
+
+    def summary(self):
+        """One-line breakdown of finished spans, slowest first — for error logs."""
+        done = [s for s in self.spans if s.end is not None]
+        done.sort(key=lambda s: s.end - s.start, reverse=True)
+        return ", ".join(
+            f"{s.name}={round((s.end - s.start) * 1000)}ms" + ("" if s.status == "ok" else f"({s.status})")
+            for s in done[:8]
+        )
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": self.duration_ms if self.duration_ms is not None else self.elapsed_ms(),
+            "status": self.status,
+            "attrs": self.attrs,
+            "spans": [s.to_dict(self.start) for s in self.spans],
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def start_trace(name, trace_id=None):
+    """Starts a trace and makes it current. Returns `(trace, token)`; pass the token to `detach_trace`."""
+    trace = Trace(name, trace_id)
+    return trace, (_current_trace.set(trace), _current_span.set(None))
+
+
+def detach_trace(token):
+    trace_token, span_token = token
+    _current_span.reset(span_token)
+    _current_trace.reset(trace_token)
+
+
+def finish_trace(trace, status="ok"):
+    """Closes the trace and applies sampling. Returns True if it was kept."""
+    if trace.duration_ms is not None:
+        return False
+    trace.duration_ms = trace.elapsed_ms()
+    if status != "ok":
+        trace.status = status
+
+    keep = trace.errored or trace.duration_ms >= TRACE_SLOW_MS or random.random() < TRACE_SAMPLE_RATE
+    if keep:
+        _recent.append(trace)
+        if TRACE_EXPORT_PATH:
+            # Serialised here, written by the logging queue's listener thread
+            _export_logger.info(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+    return keep
+
+
+@contextmanager
+def span(name, **attrs):
+    """Records a child span of the current span. A no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.span_id if parent is not None else None, attrs)
+    trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except asyncio.CancelledError:
+        current.fail("cancelled", status="cancelled")
+        raise
+    except Exception as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+def traced(name, **attrs):
+    """Decorator: runs an async function inside `span(name, **attrs)`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_traces(limit=50, min_ms=0.0):
+    """Kept traces from the ring buffer, slowest first."""
+    traces = [t for t in list(_recent) if (t.duration_ms or 0) >= min_ms]
+    traces.sort(key=lambda t: t.duration_ms or 0, reverse=True)
+    return [t.to_dict() for t in traces[:limit]]
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to every log record (an explicit `extra={'trace_id': ...}` wins)."""
+
+    def filter(self, record):
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id() or "-"
+        return True
@@ -0,0 +1,175 @@
+import os
+import threading
+from PIL import UnidentifiedImageError
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartParser
+from starlette.responses import JSONResponse
+from app.metrics import UPLOAD_REJECTED, UPLOAD_PEAK_MEMORY
+from app.tracing import span, current_trace
+
+# =============================
+# 📥 Upload Ingestion
+# =============================
+# The request body is capped while it streams in (UploadSizeLimit below), so
+# an oversized upload is refused as soon as it passes the limit, before the
+# multipart parser has read the rest. Starlette's parser spools each file to
+# a temp file past UPLOAD_SPOOL_BYTES; handlers decode straight from that
+# file instead of copying it again.
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = MultiPartParser.max_file_size  # Starlette keeps smaller file parts in memory
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Form fields and part headers on top of the files
+UPLOAD_TOO_LARGE_MESSAGE = f"Photo is too large. The limit is {UPLOAD_MAX_BYTES // (1024 * 1024)}MB per photo."
+
+# Leading bytes of the formats accepted for upload
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+)
+
+
+class UploadTooLarge(ValueError):
+    """The upload is bigger than UPLOAD_MAX_BYTES."""
+
+
+def sniff_format(head):
+    """Image format from the first bytes of a file, or None when it isn't one we accept."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, fmt in _SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    return None
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware capping the request body at `limit_for(scope)` bytes
+    (None = no cap). A declared Content-Length over the cap is refused
+    before anything is read; otherwise the body is counted as it is
+    received and reading stops with a 413 once the cap is passed, which
+    also covers chunked uploads.
+    """
+
+    def __init__(self, app, limit_for):
+        self.app = app
+        self.limit_for = limit_for
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            record_rejection("too_large")
+            response = JSONResponse({"detail": UPLOAD_TOO_LARGE_MESSAGE}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    record_rejection("too_large")
+                    # Raised inside the form parser; FastAPI passes HTTPException through as the response
+                    raise HTTPException(status_code=413, detail=UPLOAD_TOO_LARGE_MESSAGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class SpooledUpload:
+    """An upload's (already spooled) bytes, rewound and ready for decoding; close it when done."""
+
+    def __init__(self, file, size, fmt):
+        self.file = file
+        self.size = size
+        self.format = fmt
+
+    @property
+    def on_disk(self):
+        return self.size > UPLOAD_SPOOL_BYTES
+
+    @property
+    def memory_bytes(self):
+        return min(self.size, UPLOAD_SPOOL_BYTES)
+
+    def close(self):
+        self.file.close()
+
+
+async def open_upload(upload, max_bytes=UPLOAD_MAX_BYTES):
+    """
+    Checks `upload` (a FastAPI UploadFile) and hands back its spooled file
+    without copying it. Raises `UploadTooLarge` past `max_bytes` (per file,
+    for multi-file forms) and `PIL.UnidentifiedImageError` when it isn't an
+    image. Returns None for an empty upload.
+    """
+    with span("upload.open") as open_span:
+        size = upload.size
+        if size is None:
+            size = upload.file.seek(0, os.SEEK_END)
+        if size > max_bytes:
+            record_rejection("too_large")
+            raise UploadTooLarge(f"{size} bytes, limit is {max_bytes}")
+        if size == 0:
+            return None
+
+        await upload.seek(0)
+        fmt = sniff_format(await upload.read(16))
+        if fmt is None:
+            record_rejection("format")
+            raise UnidentifiedImageError("upload is not a supported image format")
+        await upload.seek(0)
+        open_span.set(bytes=size, format=fmt, on_disk=size > UPLOAD_SPOOL_BYTES)
+    return SpooledUpload(upload.file, size, fmt)
+
+
+# =============================
+# 📏 Per-Request Memory Accounting
+# =============================
+_lock = threading.Lock()
+_stats = {"accepted": 0, "spooled_to_disk": 0, "rejected": {}, "peak_memory_bytes_max": 0, "last": None}
+
+
+def record_rejection(reason):
+    UPLOAD_REJECTED.inc(reason=reason)
+    with _lock:
+        _stats["rejected"][reason] = _stats["rejected"].get(reason, 0) + 1
+
+
+def record_ingest(upload, image):
+    """
+    Reports the estimated peak memory one upload needed: its in-memory buffer,
+    the (draft-reduced) decode buffer and the encoded Gemini blob.
+    """
+    peak = upload.memory_bytes + image.decoded_bytes + len(image.blob["data"])
+    UPLOAD_PEAK_MEMORY.observe(peak)
+    trace = current_trace()
+    if trace is not None:
+        trace.set(upload_bytes=upload.size, peak_memory_bytes=peak)
+    with _lock:
+        _stats["accepted"] += 1
+        _stats["spooled_to_disk"] += upload.on_disk
+        _stats["peak_memory_bytes_max"] = max(_stats["peak_memory_bytes_max"], peak)
+        _stats["last"] = {"bytes": upload.size, "format": upload.format, "peak_memory_bytes": peak}
+    return peak
+
+
+def upload_stats():
+    with _lock:
+        return {
+            **_stats,
+            "rejected": dict(_stats["rejected"]),
+            "max_bytes": UPLOAD_MAX_BYTES,
+            "spool_bytes": UPLOAD_SPOOL_BYTES,
+        }
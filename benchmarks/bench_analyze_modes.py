@@ -0,0 +1,82 @@
+"""
+Benchmark: multi-call /analyze pipeline vs the fused single-call mode.
+
+Runs the analyze stages in-process against whatever Gemini backend is
+configured (real keys, or the local stand-in via GEMINI_API_ENDPOINT) and
+reports per-request latency, Gemini calls and tokens for each mode. The
+pHash analysis cache is disabled so every pipeline run pays for its own
+analysis call.
+
+Usage:
+    GEMINI_API_ENDPOINT=http://127.0.0.1:9000 GEMINI_KEYS=k1,k2 \\
+        python -m benchmarks.bench_analyze_modes [image_path] [--runs 5] [--app lightroom] [--style "Moody & Dark"]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+os.environ.setdefault("ANALYSIS_CACHE_TTL", "0")
+sys.path.insert(0, ".")
+from app.main import _run_analyze  # noqa: E402
+from app.image_utils import prepare_image  # noqa: E402
+from app.metrics import GEMINI_REQUESTS, GEMINI_TOKENS  # noqa: E402
+
+DEFAULT_IMAGE = "static/uploads/WhatsApp_Image_2025-08-02_at_11.42.40_PM.jpeg"
+
+
+def _counters():
+    return {
+        "calls": GEMINI_REQUESTS.total(),
+        "prompt_tokens": GEMINI_TOKENS.total(type="prompt"),
+        "response_tokens": GEMINI_TOKENS.total(type="response"),
+    }
+
+
+async def measure(mode, image, selected_app, style, runs):
+    latencies, fell_back = [], 0
+    before = _counters()
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await _run_analyze(
+            {"image": image, "selected_app": selected_app, "style": style, "song_sink": None}, mode
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        if mode == "fused" and "fused" not in result.results:
+            fell_back += 1
+    after = _counters()
+
+    latencies.sort()
+    per_request = {name: round((after[name] - before[name]) / runs, 1) for name in after}
+    return {
+        "runs": runs,
+        "latency_ms": {
+            "mean": round(sum(latencies) / runs, 1),
+            "p50": round(latencies[runs // 2], 1),
+            "max": round(latencies[-1], 1),
+        },
+        "per_request": per_request,
+        "fallbacks": fell_back,
+    }
+
+
+async def run(args):
+    with open(args.image, "rb") as f:
+        image = await prepare_image(f.read())
+    return {mode: await measure(mode, image, args.app, args.style, args.runs) for mode in ("pipeline", "fused")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image", nargs="?", default=DEFAULT_IMAGE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app", default="lightroom")
+    parser.add_argument("--style", default="Golden Hour Glow")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
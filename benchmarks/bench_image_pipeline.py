@@ -0,0 +1,74 @@
+"""
+Benchmark: legacy upload handling vs the PreparedImage pipeline.
+
+Legacy: full decode -> convert("RGB") -> thumbnail(512) -> PNG encode per Gemini call.
+Prepared: JPEG draft decode at ~512 -> encode once (JPEG/WebP) -> reuse bytes.
+
+Usage:
+    python -m benchmarks.bench_image_pipeline [image_path] [--calls 4] [--runs 10]
+"""
+import io
+import sys
+import time
+import argparse
+from PIL import Image
+
+sys.path.insert(0, ".")
+from app.image_utils import PreparedImage  # noqa: E402
+
+DEFAULT_IMAGE = "static/uploads/WhatsApp_Image_2025-08-02_at_11.42.40_PM.jpeg"
+
+
+def legacy_pipeline(data, calls):
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    image.thumbnail((512, 512))
+    sent = 0
+    for _ in range(calls):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        sent += len(buffer.getvalue())
+    return sent
+
+
+def prepared_pipeline(data, calls, fmt, quality):
+    image = PreparedImage.from_bytes(data, fmt=fmt, quality=quality)
+    return sum(len(image.blob["data"]) for _ in range(calls))
+
+
+def measure(func, runs):
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+    for _ in range(runs):
+        sent = func()
+    return {
+        "cpu_ms": round((time.process_time() - start_cpu) * 1000 / runs, 2),
+        "wall_ms": round((time.perf_counter() - start_wall) * 1000 / runs, 2),
+        "bytes_on_wire": sent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image", nargs="?", default=DEFAULT_IMAGE)
+    parser.add_argument("--calls", type=int, default=4, help="Multimodal Gemini calls per request")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        data = f.read()
+
+    results = {"legacy_png": measure(lambda: legacy_pipeline(data, args.calls), args.runs)}
+    for fmt, quality in (("JPEG", 85), ("WEBP", 80)):
+        results[f"prepared_{fmt.lower()}"] = measure(
+            lambda: prepared_pipeline(data, args.calls, fmt, quality), args.runs
+        )
+
+    base = results["legacy_png"]
+    print(f"📷 {args.image} ({len(data)} bytes), {args.calls} calls/request, {args.runs} runs")
+    print(f"{'pipeline':<16}{'cpu ms':>10}{'wall ms':>10}{'bytes':>12}{'cpu x':>8}{'bytes x':>9}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['cpu_ms']:>10}{r['wall_ms']:>10}{r['bytes_on_wire']:>12}"
+              f"{base['cpu_ms'] / max(r['cpu_ms'], 0.01):>8.1f}{base['bytes_on_wire'] / max(r['bytes_on_wire'], 1):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: downstream prompt size with the full analysis text vs the
+compact per-stage analysis fields.
+
+Builds every prompt that receives the image analysis twice — once with the
+analysis pasted verbatim (the old behaviour) and once with only the fields
+each builder asks for — and reports estimated text tokens per stage. Runs
+offline; no Gemini calls are made.
+
+Usage:
+    python -m benchmarks.bench_prompt_tokens [analysis.txt] [--app lightroom] [--style "Moody & Dark"]
+"""
+import sys
+import json
+import argparse
+
+sys.path.insert(0, ".")
+from app.image_analysis import ImageAnalysis  # noqa: E402
+from app.prompt_tokens import estimate_tokens  # noqa: E402
+from app.prompts import (  # noqa: E402
+    EDITING_PROMPTS, get_caption_prompt, get_caption_regeneration_prompt, get_caption_validator_prompt,
+    get_music_prompt
+)
+
+SAMPLE_ANALYSIS = """Here is a detailed analysis of the image:
+
+- **Subject:** A young woman in a cream knit sweater smiling softly at the camera, holding a ceramic mug with both hands.
+- **Setting:** A small, cozy cafe with exposed brick walls, wooden shelves of plants and a large window onto a rainy street.
+- **Mood & Vibe:** Warm, calm and intimate, with a slow-morning, comforting feel.
+- **Action:** Sitting at a table and lifting the mug towards her face while looking into the lens.
+- **Key Objects:** Ceramic mug, wooden table, potted plants, rain-streaked window, a closed notebook.
+- **Composition:** Medium close-up portrait at eye level, subject slightly off-center following the rule of thirds.
+- **Lighting:** Soft, diffused window light from the left with gentle shadows on the right side of the face.
+- **Color Palette:** Warm earthy tones of brown, cream and muted green, with low saturation and soft contrast.
+"""
+
+SAMPLE_CAPTIONS = "Slow mornings and warm hands #Glamo #CafeDays #RainyMood"
+
+
+def stage_prompts(analysis, app, style):
+    return {
+        "editing_values": EDITING_PROMPTS[app](style, analysis),
+        "raw_captions": get_caption_prompt(style, analysis),
+        "caption_regenerate": get_caption_regeneration_prompt(style, analysis, 2, {"slow", "warm"}),
+        "caption_validator": get_caption_validator_prompt(style, analysis, SAMPLE_CAPTIONS),
+        "music_queries": get_music_prompt(style, analysis),
+    }
+
+
+def measure(text, app, style):
+    # An ImageAnalysis without fields renders the raw text, i.e. the old verbatim prompts
+    full = stage_prompts(ImageAnalysis({}, raw=text), app, style)
+    compact = stage_prompts(ImageAnalysis.parse(text), app, style)
+    report = {}
+    for stage in full:
+        before, after = estimate_tokens(full[stage]), estimate_tokens(compact[stage])
+        report[stage] = {"full": before, "compact": after, "saved_pct": round(100 * (before - after) / before, 1)}
+    before = sum(r["full"] for r in report.values())
+    after = sum(r["compact"] for r in report.values())
+    report["total"] = {"full": before, "compact": after, "saved_pct": round(100 * (before - after) / before, 1)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("analysis", nargs="?", help="File with an analysis response (defaults to a built-in sample)")
+    parser.add_argument("--app", default="lightroom", choices=sorted(EDITING_PROMPTS))
+    parser.add_argument("--style", default="Golden Hour Glow")
+    args = parser.parse_args()
+    text = SAMPLE_ANALYSIS
+    if args.analysis:
+        with open(args.analysis, encoding="utf-8") as f:
+            text = f.read()
+    print(json.dumps(measure(text, args.app, args.style), indent=2))
+
+
+if __name__ == "__main__":
+    main()
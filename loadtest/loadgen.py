@@ -0,0 +1,171 @@
+"""
+Open-loop load generator for Glamo.
+
+Fires requests at a fixed target rate (independent of how fast responses
+come back) against /analyze, /chat and /suggest_style_app, then prints a
+JSON report with p50/p95/p99 latency, throughput and an error breakdown.
+
+    python -m loadtest.loadgen --base-url http://127.0.0.1:8000 --rps 5 --duration 60 \\
+        --mix analyze=0.6,chat=0.3,suggest=0.1 --output loadtest_report.json
+"""
+import io
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+import httpx
+
+DEFAULT_IMAGE = "static/uploads/WhatsApp_Image_2025-08-02_at_11.42.40_PM.jpeg"
+CHAT_QUESTIONS = [
+    "How do I start?",
+    "What is the difference between VSCO and Lightroom?",
+    "Tips for a good selfie?",
+    "Where can I find captions?",
+    "What is the rule of thirds?",
+]
+APPS = ["iphone", "vsco", "lightroom", "snapseed", "picsart"]
+STYLES = ["Vibrant & Vivid", "Bright & Airy", "Moody & Dark", "Golden Hour Glow", "Soft Pastel"]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return round(ordered[index], 1)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"analyze", "chat", "suggest"}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def load_image(path, max_size):
+    """Mimics the browser, which re-encodes uploads to at most 1024px WebP before sending."""
+    from PIL import Image
+
+    image = Image.open(path)
+    image.draft("RGB", (max_size, max_size))
+    image = image.convert("RGB")
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=85)
+    return buffer.getvalue()
+
+
+async def send(client, endpoint, image_bytes):
+    if endpoint == "analyze":
+        files = {"photo": ("photo.webp", image_bytes, "image/webp")}
+        data = {"selected_app": random.choice(APPS), "style": random.choice(STYLES)}
+        return await client.post("/analyze", files=files, data=data)
+    if endpoint == "suggest":
+        files = {"photo": ("photo.webp", image_bytes, "image/webp")}
+        return await client.post("/suggest_style_app", files=files)
+    return await client.post("/chat", json={"question": random.choice(CHAT_QUESTIONS)})
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    endpoints, weights = list(mix), list(mix.values())
+    image_bytes = load_image(args.image, args.image_size)
+
+    samples = defaultdict(list)        # endpoint -> latencies (ms) of successful requests
+    outcomes = defaultdict(lambda: defaultdict(int))  # endpoint -> outcome -> count
+    in_flight = 0
+    peak_in_flight = 0
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+
+        async def one(endpoint):
+            nonlocal in_flight, peak_in_flight
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+            start = time.perf_counter()
+            try:
+                res = await send(client, endpoint, image_bytes)
+                elapsed = (time.perf_counter() - start) * 1000
+                if res.status_code < 400:
+                    samples[endpoint].append(elapsed)
+                    outcomes[endpoint]["ok"] += 1
+                else:
+                    outcomes[endpoint][f"http_{res.status_code}"] += 1
+            except httpx.TimeoutException:
+                outcomes[endpoint]["timeout"] += 1
+            except httpx.HTTPError as e:
+                outcomes[endpoint][type(e).__name__] += 1
+            finally:
+                in_flight -= 1
+
+        tasks = []
+        started = time.perf_counter()
+        total = int(args.rps * args.duration)
+        for i in range(total):
+            # Open loop: request i is due at i / rps regardless of earlier responses
+            delay = started + i / args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(random.choices(endpoints, weights)[0])))
+        sending_time = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        wall_time = time.perf_counter() - started
+
+    report = {
+        "target_rps": args.rps,
+        "achieved_send_rps": round(total / sending_time, 2) if sending_time else None,
+        "duration_s": round(wall_time, 2),
+        "requests": total,
+        "peak_in_flight": peak_in_flight,
+        "endpoints": {},
+    }
+    for endpoint in endpoints:
+        latencies = samples[endpoint]
+        counts = dict(outcomes[endpoint])
+        sent = sum(counts.values())
+        report["endpoints"][endpoint] = {
+            "sent": sent,
+            "ok": counts.get("ok", 0),
+            "error_rate": round(1 - counts.get("ok", 0) / sent, 4) if sent else None,
+            "throughput_rps": round(counts.get("ok", 0) / wall_time, 2) if wall_time else None,
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": round(max(latencies), 1) if latencies else None,
+            },
+            "errors": {name: n for name, n in counts.items() if name != "ok"},
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=2.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to keep sending")
+    parser.add_argument("--mix", default="analyze=0.6,chat=0.3,suggest=0.1")
+    parser.add_argument("--image", default=DEFAULT_IMAGE)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-connections", type=int, default=500)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
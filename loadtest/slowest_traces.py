@@ -0,0 +1,71 @@
+"""
+Summarises exported request traces (TRACE_EXPORT_PATH, or the output of
+GET /traces saved to a file): the slowest requests with their span
+breakdown, plus which spans dominate across all of them.
+
+    python -m loadtest.slowest_traces traces.jsonl --top 10 --endpoint "POST /analyze"
+"""
+import json
+import argparse
+from collections import defaultdict
+
+
+def load(path, endpoint=None):
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            trace = json.loads(line)
+            if endpoint is None or trace.get("name") == endpoint:
+                traces.append(trace)
+    return traces
+
+
+def span_totals(traces):
+    """Total time per span name across traces (same-name siblings are summed)."""
+    totals = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    for trace in traces:
+        for span in trace.get("spans", []):
+            entry = totals[span["name"]]
+            entry["count"] += 1
+            entry["total_ms"] += span["duration_ms"]
+            entry["max_ms"] = max(entry["max_ms"], span["duration_ms"])
+    return sorted(totals.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+
+
+def print_spans(spans, parent=None, depth=0):
+    children = defaultdict(list)
+    for span in spans:
+        children[span["parent"]].append(span)
+    for span in sorted(children[parent], key=lambda s: s["start_ms"]):
+        flag = "" if span["status"] == "ok" else f"  ({span['status']})"
+        print(f"{'':13}{'  ' * depth}+{span['start_ms']:.0f}ms {span['name']} {span['duration_ms']:.1f}ms{flag}")
+        print_spans(spans, span["id"], depth + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--endpoint", help='Only traces with this name, e.g. "POST /analyze"')
+    args = parser.parse_args()
+
+    traces = load(args.path, args.endpoint)
+    traces.sort(key=lambda t: t.get("duration_ms", 0), reverse=True)
+    slowest = traces[:args.top]
+    print(f"{len(traces)} traces, showing the {len(slowest)} slowest\n")
+
+    for trace in slowest:
+        print(f"{trace['duration_ms']:>9.1f}ms  {trace['name']}  {trace['trace_id']}  [{trace.get('status')}]")
+        print_spans(trace.get("spans", []))
+        print()
+
+    print("Span totals across the slowest traces:")
+    for name, entry in span_totals(slowest):
+        print(f"  {name:<28} n={entry['count']:<5} total={entry['total_ms']:.0f}ms max={entry['max_ms']:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
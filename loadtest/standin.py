@@ -0,0 +1,257 @@
+"""
+Local stand-in for every upstream Glamo talks to, so /analyze can be load
+tested without spending Gemini quota:
+
+- Gemini REST:   POST /v1beta/models/{model}:generateContent (and :streamGenerateContent?alt=sse)
+- Spotify:       POST /api/token, GET /v1/search
+- JioSaavn:      GET  /api/search/songs
+
+Run it, then start the app pointed at it:
+
+    uvicorn loadtest.standin:app --port 9000
+    GEMINI_API_ENDPOINT=http://127.0.0.1:9000 \\
+    SPOTIFY_CLIENT_ID=x SPOTIFY_CLIENT_SECRET=x \\
+    SPOTIFY_TOKEN_URL=http://127.0.0.1:9000/api/token \\
+    SPOTIFY_SEARCH_URL=http://127.0.0.1:9000/v1/search \\
+    JIOSAAVN_SEARCH_URL=http://127.0.0.1:9000/api/search/songs \\
+    uvicorn app.main:app --port 8000
+
+Behaviour is configured with env vars (or at runtime via POST /__config):
+    STANDIN_GEMINI_LATENCY_MS   mean Gemini latency          (default 800)
+    STANDIN_MUSIC_LATENCY_MS    mean Spotify/JioSaavn latency (default 120)
+    STANDIN_JITTER              +/- fraction of the mean      (default 0.3)
+    STANDIN_ERROR_RATE          fraction of 500 responses     (default 0)
+    STANDIN_RATE_LIMIT_RATE     fraction of 429 responses     (default 0)
+    STANDIN_KEY_RPM             per-key requests/min before 429s, 0 = unlimited (default 0)
+    STANDIN_BAD_JSON_RATE       fraction of JSON-mode replies that are malformed (default 0)
+    STANDIN_SLOW_RATE           fraction of Gemini replies delayed to the tail latency (default 0)
+    STANDIN_SLOW_MS             tail latency for those replies (default 8000)
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from collections import defaultdict, deque
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Glamo upstream stand-in")
+
+config = {
+    "gemini_latency_ms": float(os.getenv("STANDIN_GEMINI_LATENCY_MS", "800")),
+    "music_latency_ms": float(os.getenv("STANDIN_MUSIC_LATENCY_MS", "120")),
+    "jitter": float(os.getenv("STANDIN_JITTER", "0.3")),
+    "error_rate": float(os.getenv("STANDIN_ERROR_RATE", "0")),
+    "rate_limit_rate": float(os.getenv("STANDIN_RATE_LIMIT_RATE", "0")),
+    "key_rpm": int(os.getenv("STANDIN_KEY_RPM", "0")),
+    "bad_json_rate": float(os.getenv("STANDIN_BAD_JSON_RATE", "0")),
+    "slow_rate": float(os.getenv("STANDIN_SLOW_RATE", "0")),
+    "slow_ms": float(os.getenv("STANDIN_SLOW_MS", "8000")),
+}
+counters = defaultdict(int)
+_key_windows = defaultdict(deque)
+
+SONGS = [
+    ("Perfect", "Ed Sheeran"), ("Raabta", "Arijit Singh"), ("Sunflower", "Post Malone"),
+    ("Golden Hour", "JVKE"), ("Tum Mile", "Pritam"), ("Believer", "Imagine Dragons"),
+    ("Until I Found You", "Stephen Sanders"), ("Malang", "Ved Sharma"), ("Lost in Japan", "Shawn Mendes"),
+    ("Agar Tum Saath Ho", "Alka Yagnik"), ("All of Me", "John Legend"), ("Zinda", "Siddharth Mahadevan"),
+]
+
+ANALYSIS = """- **Subject:** A person smiling at the camera
+- **Setting:** A sunlit rooftop cafe
+- **Mood & Vibe:** Warm and relaxed
+- **Action:** Posing for a photo
+- **Key Objects:** Coffee cup, string lights
+- **Composition:** Medium close-up portrait
+- **Lighting:** Soft golden-hour side light
+- **Color Palette:** Warm oranges and muted teal"""
+
+
+async def _simulate(latency_key):
+    if latency_key == "gemini_latency_ms" and random.random() < config["slow_rate"]:
+        counters["slow_replies"] += 1
+        await asyncio.sleep(config["slow_ms"] / 1000)
+        return
+    mean = config[latency_key]
+    jitter = mean * config["jitter"]
+    await asyncio.sleep(max(0.0, random.uniform(mean - jitter, mean + jitter)) / 1000)
+
+
+def _injected_failure(api_key=None):
+    if config["key_rpm"] and api_key:
+        window, now = _key_windows[api_key], time.monotonic()
+        while window and now - window[0] > 60:
+            window.popleft()
+        if len(window) >= config["key_rpm"]:
+            counters["rate_limited"] += 1
+            return JSONResponse({"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota)."}},
+                                status_code=429)
+        window.append(now)
+
+    roll = random.random()
+    if roll < config["rate_limit_rate"]:
+        counters["rate_limited"] += 1
+        return JSONResponse({"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota)."}},
+                            status_code=429)
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        counters["errors"] += 1
+        return JSONResponse({"error": {"code": 500, "message": "Internal error (stand-in)."}}, status_code=500)
+    return None
+
+
+FUSED_ANALYSIS = {
+    "subject": "A person smiling at the camera", "setting": "A sunlit rooftop cafe",
+    "mood": "Warm and relaxed", "action": "Posing for a photo", "key_objects": "Coffee cup, string lights",
+    "composition": "Medium close-up portrait", "lighting": "Soft golden-hour side light",
+    "color_palette": "Warm oranges and muted teal",
+}
+
+
+def _gemini_json(schema):
+    """Structured reply for JSON mode, filling whichever sections the schema asks for."""
+    if config["bad_json_rate"] and random.random() < config["bad_json_rate"]:
+        counters["bad_json"] += 1
+        return '{"analysis": {"subject": "truncated'
+    properties = (schema or {}).get("properties", {})
+    reply = {
+        "analysis": FUSED_ANALYSIS,
+        "captions": _gemini_text("caption", 0).splitlines(),
+        "music_queries": [f"{title} by {artist}" for title, artist in random.sample(SONGS, 8)],
+    }
+    if "editing_steps" in properties:
+        reply["editing_steps"] = [
+            {"tool": "Exposure", "value": "+10", "reason": "Lift the face."},
+            {"tool": "Warmth", "value": "+15", "reason": "Lean into golden hour."},
+        ]
+    return json.dumps(reply)
+
+
+def _gemini_text(prompt, image_count):
+    lowered = prompt.lower()
+    if "user question" in lowered:
+        return "Start by uploading a photo, choose an app and a style, then tap Get Editing Suggestions!"
+    if "### image" in lowered:
+        return "\n".join(f"### IMAGE {i + 1}\n{ANALYSIS}" for i in range(image_count))
+    if "music curator" in lowered:
+        return "\n".join(f'"{title} by {artist}"' for title, artist in random.sample(SONGS, 8))
+    if "validate" in lowered or "quality checker" in lowered:
+        return "✅ Valid"
+    if "caption" in lowered:
+        return "\n".join([
+            "Golden light and slow afternoons #Glamo #GoldenHour #CafeVibes",
+            "Soft smiles under rooftop skies #Glamo #Rooftop #Warmth",
+            "Coffee, sunsets and quiet joy #Glamo #SlowLiving #Sunset",
+            "Chasing warm hues all day #Glamo #WarmTones #Portrait",
+            "Where the city hums softly #Glamo #CityMood #Calm",
+        ])
+    if "step 1" in lowered:
+        return "Step 1: Exposure – +10\nReason: Lift the face.\nStep 2: Warmth – +15\nReason: Lean into golden hour."
+    if "style:" in lowered and "app:" in lowered:
+        return "Style: Golden Hour Glow\nApp: Lightroom\nReason: Warm side light suits a glow edit."
+    return ANALYSIS
+
+
+async def _stream_reply(text, usage):
+    """SSE chunks of a few words each, spread over the configured latency."""
+    words = text.split(" ")
+    pieces = [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "") for i in range(0, len(words), 4)]
+    mean = config["gemini_latency_ms"] / 1000
+    for i, piece in enumerate(pieces):
+        await asyncio.sleep(mean * 0.3 if i == 0 else mean * 0.7 / max(1, len(pieces) - 1))
+        data = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+        if i == len(pieces) - 1:
+            data["usageMetadata"] = usage
+        yield f"data: {json.dumps(data)}\r\n\r\n"
+
+
+@app.post("/v1beta/models/{model_action}")
+async def generate_content(model_action: str, request: Request, key: str = ""):
+    counters["gemini_requests"] += 1
+    body = await request.json()
+    streaming = model_action.endswith(":streamGenerateContent")
+    if not streaming:
+        await _simulate("gemini_latency_ms")
+    failure = _injected_failure(key)
+    if failure is not None:
+        return failure
+
+    parts = [p for content in body.get("contents", []) for p in content.get("parts", [])]
+    prompt = "\n".join(p.get("text", "") for p in parts)
+    image_count = sum(1 for p in parts if "inline_data" in p or "inlineData" in p)
+    generation_config = body.get("generationConfig") or {}
+    if generation_config.get("responseMimeType") == "application/json":
+        text = _gemini_json(generation_config.get("responseSchema"))
+    else:
+        text = _gemini_text(prompt, image_count)
+
+    prompt_tokens = len(prompt) // 4 + 258 * image_count
+    output_tokens = len(text) // 4
+    usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+             "totalTokenCount": prompt_tokens + output_tokens}
+    if streaming:
+        counters["gemini_streams"] += 1
+        return StreamingResponse(_stream_reply(text, usage), media_type="text/event-stream")
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+        "usageMetadata": usage,
+    }
+
+
+@app.post("/api/token")
+async def spotify_token():
+    counters["spotify_token_requests"] += 1
+    await _simulate("music_latency_ms")
+    return {"access_token": "standin-token", "token_type": "Bearer", "expires_in": 3600}
+
+
+def _match_song(query):
+    words = set(re.findall(r"\w+", query.lower()))
+    best = max(SONGS, key=lambda s: len(words & set(re.findall(r"\w+", f"{s[0]} {s[1]}".lower()))))
+    return best if words & set(re.findall(r"\w+", f"{best[0]} {best[1]}".lower())) else None
+
+
+@app.get("/v1/search")
+async def spotify_search(q: str = ""):
+    counters["spotify_requests"] += 1
+    await _simulate("music_latency_ms")
+    failure = _injected_failure()
+    if failure is not None:
+        return failure
+    song = _match_song(q)
+    items = [] if song is None else [{
+        "name": song[0], "artists": [{"name": song[1]}], "preview_url": None,
+        "album": {"name": song[0], "images": [{"url": "/static/music-default.jpg"}]},
+    }]
+    return {"tracks": {"items": items}}
+
+
+@app.get("/api/search/songs")
+async def jiosaavn_search(query: str = ""):
+    counters["jiosaavn_requests"] += 1
+    await _simulate("music_latency_ms")
+    failure = _injected_failure()
+    if failure is not None:
+        return failure
+    song = _match_song(query)
+    results = [] if song is None else [{
+        "name": song[0], "primaryArtists": song[1], "url": "https://example.invalid/song",
+        "image": [{"link": "/static/music-default.jpg"}],
+    }]
+    return {"data": {"results": results}}
+
+
+@app.get("/__stats")
+async def stats():
+    return {"config": config, "counters": counters}
+
+
+@app.post("/__config")
+async def update_config(request: Request):
+    updates = await request.json()
+    for name, value in updates.items():
+        if name in config:
+            config[name] = type(config[name])(value)
+    return config
@@ -25,7 +25,13 @@ document.addEventListener('DOMContentLoaded', () => {
         moodInfoDiv: document.getElementById('moodInfo'),
         editingValuesDiv: document.getElementById('editingValues'),
         captionListDiv: document.getElementById('captionList'),
-        songListDiv: document.getElementById('songList')
+        songListDiv: document.getElementById('songList'),
+        chatToggle: document.getElementById('chatToggle'),
+        chatPanel: document.getElementById('chatPanel'),
+        chatMessages: document.getElementById('chatMessages'),
+        chatForm: document.getElementById('chatForm'),
+        chatInput: document.getElementById('chatInput'),
+        chatSend: document.getElementById('chatSend')
     };
 
     // =================================================================
@@ -40,6 +46,88 @@ document.addEventListener('DOMContentLoaded', () => {
         return result;
     }
 
+    // Streams NDJSON events from /analyze/stream, calling onEvent(event, data) for each line.
+    async function analyzeImageStream(formData, onEvent) {
+        const response = await fetch('/analyze/stream', { method: 'POST', body: formData });
+        if (!response.ok || !response.body) {
+            const result = await response.json().catch(() => ({}));
+            throw new Error(result.detail || 'An unknown server error occurred.');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (!line) continue;
+                const { event, data } = JSON.parse(line);
+                if (event === 'error') throw new Error(data);
+                onEvent(event, data);
+            }
+        }
+    }
+
+    async function askChat(question) {
+        const response = await fetch('/chat', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ question })
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.detail || 'Oops! Something went wrong on our end.');
+        }
+        return result;
+    }
+
+    // Streams Server-Sent Events from /chat/stream, calling onToken(text) for each chunk.
+    async function askChatStream(question, onToken) {
+        const response = await fetch('/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ question })
+        });
+        if (!response.ok || !response.body) {
+            const result = await response.json().catch(() => ({}));
+            throw new Error(result.detail || 'Oops! Something went wrong on our end.');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (!data) continue;
+                const payload = JSON.parse(data);
+                if (event === 'error') throw new Error(payload);
+                if (event === 'token') onToken(payload.text);
+            }
+        }
+    }
+
     async function suggestStyle(formData) {
         const response = await fetch('/suggest_style_app', { method: 'POST', body: formData });
         const result = await response.json();
@@ -87,6 +175,42 @@ document.addEventListener('DOMContentLoaded', () => {
         initializeTilt();
     }
 
+    function showResultBlock() {
+        if (dom.resultBlock.style.display === 'block') return;
+        dom.moodInfoDiv.innerHTML = '';
+        dom.editingValuesDiv.innerHTML = '';
+        dom.captionListDiv.innerHTML = '';
+        dom.songListDiv.innerHTML = '';
+        dom.resultBlock.style.display = 'block';
+        dom.resultBlock.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        dom.resultBlock.focus();
+    }
+
+    // Renders one streamed section as soon as it arrives.
+    function renderStreamEvent(event, data) {
+        showResultBlock();
+        switch (event) {
+            case 'mood_info':
+                renderAnalysis(data);
+                break;
+            case 'editing_values':
+                renderEditingSteps(data);
+                break;
+            case 'captions':
+                renderCaptions(data);
+                break;
+            case 'song':
+                renderSong(data);
+                break;
+            case 'songs':
+                if (!data || data.length === 0) renderSongs(data);
+                break;
+            default:
+                return;
+        }
+        initializeTilt();
+    }
+
     function renderAnalysis(moodInfo) {
         const template = document.getElementById('analysis-card-template');
         if (!moodInfo || !template) {
@@ -169,20 +293,24 @@ document.addEventListener('DOMContentLoaded', () => {
             dom.songListDiv.innerHTML = '<p>No music suggestions found for this image.</p>';
             return;
         }
-        songs.forEach(song => {
-            const card = template.content.cloneNode(true);
-            card.querySelector('img').src = song.image || '/static/music-default.jpg';
-            card.querySelector('img').alt = `Album art for ${song.title} by ${song.artist}`;
-            card.querySelector('.song-title').textContent = song.title || 'Untitled';
-            card.querySelector('.song-artist').textContent = song.artist || 'Unknown Artist';
-            const audio = card.querySelector('audio');
-            if (song.preview) {
-                audio.src = song.preview;
-            } else {
-                audio.remove();
-            }
-            dom.songListDiv.appendChild(card);
-        });
+        songs.forEach(renderSong);
+    }
+
+    function renderSong(song) {
+        const template = document.getElementById('song-card-template');
+        if (!song || !template) return;
+        const card = template.content.cloneNode(true);
+        card.querySelector('img').src = song.image || '/static/music-default.jpg';
+        card.querySelector('img').alt = `Album art for ${song.title} by ${song.artist}`;
+        card.querySelector('.song-title').textContent = song.title || 'Untitled';
+        card.querySelector('.song-artist').textContent = song.artist || 'Unknown Artist';
+        const audio = card.querySelector('audio');
+        if (song.preview) {
+            audio.src = song.preview;
+        } else {
+            audio.remove();
+        }
+        dom.songListDiv.appendChild(card);
     }
 
     // =================================================================
@@ -247,8 +375,12 @@ document.addEventListener('DOMContentLoaded', () => {
         formData.append('style', dom.editForm.elements.style.value);
 
         try {
-            const result = await analyzeImage(formData);
-            renderResults(result);
+            if (window.ReadableStream && 'body' in Response.prototype) {
+                await analyzeImageStream(formData, renderStreamEvent);
+            } else {
+                const result = await analyzeImage(formData);
+                renderResults(result);
+            }
         } catch (error) {
             console.error('Fetch Error:', error);
             renderError(error.message);
@@ -279,6 +411,56 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function appendChatMessage(role, text) {
+        const message = document.createElement('div');
+        message.className = `chat-message ${role}`;
+        message.textContent = text;
+        dom.chatMessages.appendChild(message);
+        dom.chatMessages.scrollTop = dom.chatMessages.scrollHeight;
+        return message;
+    }
+
+    async function handleChatSubmit(event) {
+        event.preventDefault();
+        const question = dom.chatInput.value.trim();
+        if (!question) return;
+
+        appendChatMessage('user', question);
+        dom.chatInput.value = '';
+        dom.chatSend.disabled = true;
+
+        const reply = appendChatMessage('assistant pending', '');
+        try {
+            if (window.ReadableStream && 'body' in Response.prototype) {
+                // Render tokens as they arrive instead of waiting for the whole answer
+                await askChatStream(question, (text) => {
+                    reply.textContent += text;
+                    dom.chatMessages.scrollTop = dom.chatMessages.scrollHeight;
+                });
+            } else {
+                const result = await askChat(question);
+                reply.textContent = result.answer;
+            }
+            if (!reply.textContent) reply.textContent = 'Sorry, I could not come up with an answer.';
+        } catch (error) {
+            console.error('Chat Error:', error);
+            reply.textContent = reply.textContent
+                ? `${reply.textContent}\n❌ ${error.message}`
+                : `❌ ${error.message}`;
+        } finally {
+            reply.classList.remove('pending');
+            dom.chatSend.disabled = false;
+            dom.chatInput.focus();
+        }
+    }
+
+    function toggleChatPanel() {
+        const open = dom.chatPanel.hidden;
+        dom.chatPanel.hidden = !open;
+        dom.chatToggle.setAttribute('aria-expanded', String(open));
+        if (open) dom.chatInput.focus();
+    }
+
     function handlePhotoPreview(file) {
         if (file) {
             dom.photoPreview.src = URL.createObjectURL(file);
@@ -324,6 +506,8 @@ document.addEventListener('DOMContentLoaded', () => {
     if (dom.editForm) dom.editForm.addEventListener('submit', handleFormSubmit);
     if (dom.suggestStyleBtn) dom.suggestStyleBtn.addEventListener('click', handleSuggestStyle);
     if (dom.styleSelector) dom.styleSelector.addEventListener('change', handleStyleDescriptionChange);
+    if (dom.chatForm) dom.chatForm.addEventListener('submit', handleChatSubmit);
+    if (dom.chatToggle) dom.chatToggle.addEventListener('click', toggleChatPanel);
 
     if (dom.photoInput) {
         dom.photoInput.addEventListener('change', (e) => {